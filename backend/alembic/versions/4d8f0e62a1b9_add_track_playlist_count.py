@@ -0,0 +1,41 @@
+"""Add track playlist count
+
+Revision ID: 4d8f0e62a1b9
+Revises: e3a9b51c7d04
+Create Date: 2026-10-18 15:04:36.117902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4d8f0e62a1b9'
+down_revision: Union[str, None] = 'e3a9b51c7d04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('track_playlist_count',
+    sa.Column('track_id', sa.String(), nullable=False),
+    sa.Column('playlists', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text("TIMEZONE('utc', now())"), nullable=False),
+    sa.ForeignKeyConstraint(['track_id'], ['track.track_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('track_id')
+    )
+
+    # Backfill from existing links
+    op.execute(
+        'INSERT INTO track_playlist_count (track_id, playlists) '
+        'SELECT playlist_track_association.track_id, count(DISTINCT playlist_version.playlist_id) '
+        'FROM playlist_track_association '
+        'JOIN playlist_version ON playlist_version.version_id = playlist_track_association.playlist_version_id '
+        'GROUP BY playlist_track_association.track_id'
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('track_playlist_count')
@@ -0,0 +1,47 @@
+"""Add genre vocabulary
+
+Revision ID: 7c1e4a9d2f36
+Revises: b5275b39b0f1
+Create Date: 2026-10-18 13:02:17.204551
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e4a9d2f36'
+down_revision: Union[str, None] = 'b5275b39b0f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('genre',
+    sa.Column('genre_id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text("TIMEZONE('utc', now())"), nullable=False),
+    sa.PrimaryKeyConstraint('genre_id'),
+    sa.UniqueConstraint('name')
+    )
+    op.add_column('artist', sa.Column('genre_ids', postgresql.ARRAY(sa.Integer()), nullable=True))
+
+    # Backfill: vocabulary of all known genres, then codes of every artist in the order of ``genres``
+    op.execute(
+        'INSERT INTO genre (name) '
+        'SELECT DISTINCT unnest(genres) FROM artist ORDER BY 1 '
+        'ON CONFLICT DO NOTHING'
+    )
+    op.execute(
+        'UPDATE artist SET genre_ids = ARRAY('
+        'SELECT genre.genre_id FROM unnest(artist.genres) WITH ORDINALITY AS artist_genre(name, position) '
+        'JOIN genre ON genre.name = artist_genre.name ORDER BY artist_genre.position'
+        ') WHERE genres IS NOT NULL'
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('artist', 'genre_ids')
+    op.drop_table('genre')
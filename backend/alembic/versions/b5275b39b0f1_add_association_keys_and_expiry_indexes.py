@@ -0,0 +1,65 @@
+"""Add association keys and expiry indexes
+
+Revision ID: b5275b39b0f1
+Revises: c863a38187f7
+Create Date: 2026-10-18 12:10:42.512907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5275b39b0f1'
+down_revision: Union[str, None] = 'c863a38187f7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# table -> primary key columns and their types
+ASSOCIATIONS = {
+    'artist_track_association': (('artist_id', sa.String()), ('track_id', sa.String())),
+    'playlist_track_association': (('playlist_version_id', sa.UUID()), ('track_id', sa.String())),
+}
+
+
+def upgrade() -> None:
+    for table, ((first, first_type), (second, second_type)) in ASSOCIATIONS.items():
+        # Primary key columns can't be null and duplicated edges would break the unique index
+        op.execute(f'DELETE FROM {table} WHERE {first} IS NULL OR {second} IS NULL')
+        op.execute(
+            f'DELETE FROM {table} a USING {table} b '
+            f'WHERE a.ctid < b.ctid AND a.{first} = b.{first} AND a.{second} = b.{second}'
+        )
+        op.alter_column(table, first, existing_type=first_type, nullable=False)
+        op.alter_column(table, second, existing_type=second_type, nullable=False)
+
+    # Indexes are built without locking writes, ``CONCURRENTLY`` can't run inside transaction
+    with op.get_context().autocommit_block():
+        for table, ((first, _), (second, _)) in ASSOCIATIONS.items():
+            op.create_index(f'{table}_pkey', table, [first, second], unique=True,
+                            postgresql_concurrently=True, if_not_exists=True)
+            op.execute(f'ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY USING INDEX {table}_pkey')
+            op.create_index(f'ix_{table}_track_id', table, ['track_id'],
+                            postgresql_concurrently=True, if_not_exists=True)
+
+        op.create_index('ix_track_expires_at', 'track', ['expires_at'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_artist_expires_at', 'artist', ['expires_at'],
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_artist_expires_at', table_name='artist', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_track_expires_at', table_name='track', postgresql_concurrently=True, if_exists=True)
+
+        for table in ASSOCIATIONS:
+            op.drop_index(f'ix_{table}_track_id', table_name=table, postgresql_concurrently=True, if_exists=True)
+
+    for table, ((first, first_type), (second, second_type)) in ASSOCIATIONS.items():
+        # Dropping the constraint drops its index too
+        op.drop_constraint(f'{table}_pkey', table, type_='primary')
+        op.alter_column(table, first, existing_type=first_type, nullable=True)
+        op.alter_column(table, second, existing_type=second_type, nullable=True)
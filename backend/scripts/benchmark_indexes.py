@@ -0,0 +1,181 @@
+"""
+Reports query plans and latencies of association and expiry lookups before and after
+the indexes of migration ``b5275b39b0f1`` on a seeded dataset.
+
+Data is seeded into a separate ``index_benchmark`` schema (dropped afterwards), real tables are not touched.
+
+Usage (from ``backend``):
+    python -m scripts.benchmark_indexes --tracks 200000 --repeat 20
+"""
+import argparse
+import asyncio
+import json
+import statistics
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from src.database import engine
+
+SCHEMA = 'index_benchmark'
+
+CREATE_TABLES = [
+    f'CREATE SCHEMA {SCHEMA}',
+    f'CREATE TABLE {SCHEMA}.track (track_id varchar NOT NULL, expires_at timestamp NOT NULL)',
+    f'CREATE TABLE {SCHEMA}.artist (artist_id varchar NOT NULL, expires_at timestamp NOT NULL)',
+    f'CREATE TABLE {SCHEMA}.artist_track_association (artist_id varchar NOT NULL, track_id varchar NOT NULL)',
+    f'CREATE TABLE {SCHEMA}.playlist_track_association '
+    f'(playlist_version_id uuid NOT NULL, track_id varchar NOT NULL)',
+]
+
+# Same keys and indexes as in the migration
+CREATE_INDEXES = [
+    f'ALTER TABLE {SCHEMA}.artist_track_association ADD PRIMARY KEY (artist_id, track_id)',
+    f'CREATE INDEX ON {SCHEMA}.artist_track_association (track_id)',
+    f'ALTER TABLE {SCHEMA}.playlist_track_association ADD PRIMARY KEY (playlist_version_id, track_id)',
+    f'CREATE INDEX ON {SCHEMA}.playlist_track_association (track_id)',
+    f'CREATE INDEX ON {SCHEMA}.track (expires_at)',
+    f'CREATE INDEX ON {SCHEMA}.artist (expires_at)',
+]
+
+# About 1% of rows are expired, like a regularly refreshed database
+SEED = [
+    f"INSERT INTO {SCHEMA}.track SELECT 't' || i, now() - interval '1 hour' + (i % 100) * interval '1 hour' "
+    f"FROM generate_series(1, :tracks) i",
+    f"INSERT INTO {SCHEMA}.artist SELECT 'a' || i, now() - interval '1 hour' + (i % 100) * interval '1 hour' "
+    f"FROM generate_series(1, :artists) i",
+    # One or two artists per track
+    f"INSERT INTO {SCHEMA}.artist_track_association "
+    f"SELECT 'a' || (1 + (i * 7919 + j) % :artists), 't' || i "
+    f"FROM generate_series(1, :tracks) i, generate_series(0, i % 2) j",
+    # Every version contains ``per_version`` tracks, popular tracks are shared by many versions
+    f"INSERT INTO {SCHEMA}.playlist_track_association "
+    f"SELECT DISTINCT md5('v' || v)::uuid, 't' || (1 + (v * 104729 + k * k) % :tracks) "
+    f"FROM generate_series(1, :versions) v, generate_series(1, :per_version) k",
+]
+
+# name -> (query, params), params are filled in ``main``
+QUERIES = {
+    'artists of page tracks': (
+        f'SELECT track_id, artist_id FROM {SCHEMA}.artist_track_association WHERE track_id = ANY(:track_ids)',
+        ('track_ids',),
+    ),
+    'linked tracks of version': (
+        f'SELECT track_id FROM {SCHEMA}.playlist_track_association '
+        f'WHERE playlist_version_id = :version_id AND track_id = ANY(:track_ids)',
+        ('version_id', 'track_ids'),
+    ),
+    'versions containing track': (
+        f'SELECT playlist_version_id FROM {SCHEMA}.playlist_track_association WHERE track_id = :track_id',
+        ('track_id',),
+    ),
+    'expired tracks': (
+        f'SELECT track_id FROM {SCHEMA}.track WHERE expires_at < :now',
+        ('now',),
+    ),
+    'expired artists': (
+        f'SELECT artist_id FROM {SCHEMA}.artist WHERE expires_at < :now',
+        ('now',),
+    ),
+}
+
+
+def plan_nodes(plan: dict) -> list[str]:
+    """
+    Flattens plan tree into node descriptions like ``Index Only Scan (artist_track_association_pkey)``
+    """
+    node = plan['Node Type']
+    if 'Index Name' in plan:
+        node = f"{node} ({plan['Index Name']})"
+
+    return [node, *(child for subplan in plan.get('Plans', []) for child in plan_nodes(subplan))]
+
+
+async def measure(connection: AsyncConnection, query: str, params: dict, repeat: int) -> tuple[list[str], float]:
+    """
+    :return: Plan nodes and median execution time (ms) reported by ``EXPLAIN ANALYZE``
+    """
+    timings = []
+    nodes = []
+
+    for _ in range(repeat):
+        result = await connection.execute(text(f'EXPLAIN (ANALYZE, FORMAT JSON) {query}'), params)
+        explain = result.scalar_one()
+        explain = json.loads(explain) if isinstance(explain, str) else explain
+
+        nodes = plan_nodes(explain[0]['Plan'])
+        timings.append(explain[0]['Execution Time'])
+
+    return nodes, statistics.median(timings)
+
+
+async def run_queries(connection: AsyncConnection, params: dict, repeat: int) -> dict[str, tuple[list[str], float]]:
+    results = {}
+
+    for name, (query, param_names) in QUERIES.items():
+        results[name] = await measure(connection, query, {key: params[key] for key in param_names}, repeat)
+
+    return results
+
+
+async def main(tracks: int, artists: int, versions: int, per_version: int, repeat: int) -> None:
+    async with engine.connect() as connection:
+        await connection.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+
+        try:
+            for statement in CREATE_TABLES:
+                await connection.execute(text(statement))
+
+            seed_params = {'tracks': tracks, 'artists': artists, 'versions': versions, 'per_version': per_version}
+            for statement in SEED:
+                await connection.execute(text(statement), seed_params)
+            await connection.commit()
+
+            version_id = (await connection.execute(
+                text(f'SELECT playlist_version_id FROM {SCHEMA}.playlist_track_association LIMIT 1'))).scalar_one()
+            page = list((await connection.execute(
+                text(f'SELECT track_id FROM {SCHEMA}.playlist_track_association '
+                     f'WHERE playlist_version_id = :version_id LIMIT 100'),
+                {'version_id': version_id})).scalars())
+
+            params = {'track_ids': page, 'track_id': page[0], 'version_id': version_id, 'now': datetime.now()}
+
+            await connection.execute(text(f'ANALYZE {SCHEMA}.track, {SCHEMA}.artist, '
+                                          f'{SCHEMA}.artist_track_association, {SCHEMA}.playlist_track_association'))
+            before = await run_queries(connection, params, repeat)
+
+            for statement in CREATE_INDEXES:
+                await connection.execute(text(statement))
+            await connection.execute(text(f'ANALYZE {SCHEMA}.track, {SCHEMA}.artist, '
+                                          f'{SCHEMA}.artist_track_association, {SCHEMA}.playlist_track_association'))
+            after = await run_queries(connection, params, repeat)
+        finally:
+            await connection.rollback()
+            await connection.execute(text(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE'))
+            await connection.commit()
+
+    print(f'{tracks} tracks, {artists} artists, {versions} versions x {per_version} tracks, '
+          f'median of {repeat} runs\n')
+
+    for name in QUERIES:
+        (nodes_before, time_before), (nodes_after, time_after) = before[name], after[name]
+        speedup = time_before / time_after if time_after else float('inf')
+
+        print(f'{name}: {time_before:.3f} ms -> {time_after:.3f} ms ({speedup:.1f}x)')
+        print(f'    before: {" > ".join(nodes_before)}')
+        print(f'    after:  {" > ".join(nodes_after)}')
+
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tracks', type=int, default=200_000)
+    parser.add_argument('--artists', type=int, default=50_000)
+    parser.add_argument('--versions', type=int, default=2_000)
+    parser.add_argument('--per-version', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.tracks, args.artists, args.versions, args.per_version, args.repeat))
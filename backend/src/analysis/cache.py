@@ -0,0 +1,281 @@
+import hashlib
+import inspect
+import marshal
+import sys
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from enum import Enum
+from typing import Any, Callable, Hashable, Iterable, get_args
+from uuid import UUID
+
+from pydantic import BaseModel
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+
+def model_size(value: BaseModel) -> int:
+    """
+    Approximate memory size of schema, size of its json is used
+    """
+    return len(value.__pydantic_serializer__.to_json(value))
+
+
+class LRUCache:
+    """
+    Bounded in-process LRU cache.
+
+    Every entry has an optional expiry date (row's ``expires_at``, compared with utc time like ``is_expired``),
+    entries without it never expire. Size is capped by number of entries and optionally by approximate bytes.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int | None = None,
+                 sizeof: Callable[[Any], int] = model_size):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._sizeof = sizeof
+
+        # key -> (value, expires_at, size)
+        self._entries: OrderedDict[Hashable, tuple[Any, datetime | None, int]] = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at, _ = entry
+        if expires_at is not None and expires_at < datetime.utcnow():
+            self.__remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def get_many(self, keys: Iterable[Hashable]) -> dict[Hashable, Any]:
+        """
+        :return: Dict of found keys and values, missing and expired keys are not included
+        """
+        found = {}
+
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+
+        return found
+
+    def set(self, key: Hashable, value: Any, expires_at: datetime | None = None) -> None:
+        if key in self._entries:
+            self.__remove(key)
+
+        size = self._sizeof(value) if self._max_bytes is not None else 0
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+
+        while len(self._entries) > self._max_entries or \
+                (self._max_bytes is not None and self._bytes > self._max_bytes and len(self._entries) > 1):
+            oldest_key = next(iter(self._entries))
+            self.__remove(oldest_key)
+            self.evictions += 1
+
+    def invalidate(self, keys: Iterable[Hashable]) -> None:
+        for key in keys:
+            if key in self._entries:
+                self.__remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def __remove(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / total if total else 0.0,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+        }
+
+
+def _nested_schema(annotation: Any) -> type[BaseModel] | None:
+    """
+    Schema of nested model field (``SArtistBase`` for ``list[SArtistBase]``, ``Optional[...]``, etc.)
+    """
+    if inspect.isclass(annotation) and issubclass(annotation, BaseModel):
+        return annotation
+
+    for arg in get_args(annotation):
+        schema = _nested_schema(arg)
+        if schema is not None:
+            return schema
+
+    return None
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        # Excluded fields (``expires_at``) are encoded too
+        return tuple(_encode(getattr(value, name)) for name in type(value).model_fields)
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def _decode(schema: type[BaseModel], values: tuple) -> BaseModel:
+    data = {}
+
+    for (name, field), value in zip(schema.model_fields.items(), values):
+        nested = _nested_schema(field.annotation)
+
+        if nested is not None and isinstance(value, list):
+            value = [_decode(nested, item) for item in value]
+        elif nested is not None and isinstance(value, tuple):
+            value = _decode(nested, value)
+
+        data[name] = value
+
+    return schema.model_validate(data)
+
+
+def pack_model(value: BaseModel) -> bytes:
+    """
+    Compact binary encoding of schema: ``marshal`` of field values in declaration order, without field names.
+    ``marshal`` format may change between python versions, so it is a part of ``schema_version``
+    """
+    return marshal.dumps(_encode(value))
+
+
+def unpack_model(schema: type[BaseModel], data: bytes) -> BaseModel:
+    return _decode(schema, marshal.loads(data))
+
+
+def schema_version(schema: type[BaseModel]) -> str:
+    """
+    Short hash of schema fields (including nested ones) and python version,
+    changes whenever encoding of the schema changes
+    """
+
+    def fields(model: type[BaseModel]) -> tuple:
+        return tuple((name, fields(nested) if (nested := _nested_schema(field.annotation)) else None)
+                     for name, field in model.model_fields.items())
+
+    # Processes of different python versions (e.g. during deploy) never read entries of each other
+    encoding = (sys.version_info[:2], marshal.version, fields(schema))
+    return hashlib.sha1(repr(encoding).encode()).hexdigest()[:8]
+
+
+class RedisCache:
+    """
+    Cache of records shared by all processes, second level after ``LRUCache``.
+
+    Records are stored in redis with ``pack_model`` encoding under ``{prefix}:{name}:{schema version}:{id}``,
+    so entries of old schema versions are never read. Entries live until record's ``expires_at``, but no longer than
+    ``ttl``. If cache is disabled or redis is unavailable, every read is a miss and writes are skipped.
+    """
+
+    def __init__(self, redis: Redis, name: str, schema: type[BaseModel], ttl: timedelta, enabled: bool = True,
+                 prefix: str = 'cache'):
+        self._redis = redis
+        self._schema = schema
+        self._ttl = ttl
+        self._enabled = enabled
+        self._prefix = f'{prefix}:{name}:{schema_version(schema)}'
+
+        self.hits = 0
+        self.misses = 0
+
+    def __key(self, record_id: str) -> str:
+        return f'{self._prefix}:{record_id}'
+
+    async def get_many(self, ids: Iterable[str]) -> dict[str, BaseModel]:
+        """
+        Reads records with one ``MGET``
+        :return: Dict of found ids and records, missing and expired records are not included
+        """
+        ids = list(ids)
+        if not self._enabled or not ids:
+            return {}
+
+        try:
+            values = await self._redis.mget([self.__key(record_id) for record_id in ids])
+        except RedisError:
+            self.misses += len(ids)
+            return {}
+
+        found = {}
+        for record_id, value in zip(ids, values):
+            if value is None:
+                continue
+
+            try:
+                found[record_id] = unpack_model(self._schema, value)
+            except (ValueError, EOFError, TypeError):
+                # Corrupted entry is treated as missing and overwritten on next write
+                continue
+
+        self.hits += len(found)
+        self.misses += len(ids) - len(found)
+        return found
+
+    async def set_many(self, records: dict[str, BaseModel], expiries: dict[str, datetime | None]) -> None:
+        """
+        Writes records with one pipeline
+        :param records: Dict of id and record
+        :param expiries: Dict of id and expiry date of the record (utc, like ``is_expired``), None for default ttl
+        """
+        if not self._enabled or not records:
+            return
+
+        now = datetime.utcnow()
+
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for record_id, record in records.items():
+                    expires_at = expiries.get(record_id)
+                    ttl = self._ttl if expires_at is None else min(self._ttl, expires_at - now)
+
+                    if ttl <= timedelta(0):
+                        continue
+
+                    pipe.set(self.__key(record_id), pack_model(record), px=int(ttl.total_seconds() * 1000))
+                await pipe.execute()
+        except RedisError:
+            pass
+
+    async def invalidate(self, ids: Iterable[str]) -> None:
+        keys = [self.__key(record_id) for record_id in ids]
+        if not self._enabled or not keys:
+            return
+
+        try:
+            await self._redis.delete(*keys)
+        except RedisError:
+            pass
+
+    def stats(self) -> dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
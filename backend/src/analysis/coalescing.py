@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.analysis.config import analysis_settings
+from src.redis_client import redis_client
+
+Fetcher = Callable[[], Awaitable[Any]]
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalizes url so identical requests get the same key (query params are sorted)
+    :param url: Url with optional query string
+    :return: Normalized url
+    """
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)), safe=',()')
+    return f'{parts.path}?{query}' if query else parts.path
+
+
+class RequestCoalescer:
+    """
+    In-process single-flight: concurrent identical requests share one network call and one decoded result.
+    Result is shared between callers, so it must not be mutated.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str, fetch: Fetcher) -> Any:
+        future = self._in_flight.get(key)
+
+        if future is None:
+            self.misses += 1
+            future = asyncio.ensure_future(fetch())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda done: self.__forget(key, done))
+        else:
+            self.hits += 1
+
+        # Shielding, so cancellation of one caller doesn't cancel the request for others
+        return await asyncio.shield(future)
+
+    def __forget(self, key: str, future: asyncio.Future) -> None:
+        self._in_flight.pop(key, None)
+
+        # Marking exception as retrieved, it is raised to every caller anyway
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+
+class SharedRequestCoalescer:
+    """
+    Cross-worker variant of ``RequestCoalescer``.
+    First caller takes a redis lock and stores the decoded result for ``ttl`` seconds,
+    callers from other processes wait for that result instead of making their own request.
+    If redis is unavailable, requests are made directly.
+    """
+
+    def __init__(self, redis: Redis, ttl: float, lock_timeout: float = 10, poll_interval: float = 0.05,
+                 prefix: str = 'spotify:response'):
+        self._redis = redis
+        self._ttl = ttl
+        self._lock_timeout = lock_timeout
+        self._poll_interval = poll_interval
+        self._prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str, fetch: Fetcher) -> Any:
+        cache_key = f'{self._prefix}:{hashlib.sha1(key.encode()).hexdigest()}'
+        lock_key = f'{cache_key}:lock'
+
+        try:
+            result = await self.__wait_for_result(cache_key, lock_key)
+        except RedisError:
+            self.misses += 1
+            return await fetch()
+
+        if result is not None:
+            self.hits += 1
+            return json.loads(result)
+
+        self.misses += 1
+        try:
+            result = await fetch()
+        except BaseException:
+            # Releasing the lock, so waiting processes don't wait for the timeout
+            try:
+                await self._redis.delete(lock_key)
+            except RedisError:
+                pass
+            raise
+
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.set(cache_key, json.dumps(result), px=int(self._ttl * 1000))
+                pipe.delete(lock_key)
+                await pipe.execute()
+        except RedisError:
+            pass
+
+        return result
+
+    async def __wait_for_result(self, cache_key: str, lock_key: str) -> bytes | None:
+        """
+        Returns cached result, or None if caller has taken the lock and has to make the request itself
+        """
+        while True:
+            result = await self._redis.get(cache_key)
+            if result is not None:
+                return result
+
+            if await self._redis.set(lock_key, 1, nx=True, px=int(self._lock_timeout * 1000)):
+                return None
+
+            # Other process is making the request
+            await asyncio.sleep(self._poll_interval)
+
+    def stats(self) -> dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+
+request_coalescer = RequestCoalescer()
+shared_request_coalescer = SharedRequestCoalescer(redis_client, analysis_settings.shared_response_ttl)
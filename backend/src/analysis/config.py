@@ -1,3 +1,7 @@
+from os import path
+from tempfile import gettempdir
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 
@@ -11,7 +15,68 @@ class AnalysisSettings(BaseSettings):
         'era_diversity': 0.1
     }
 
+    # Used when 429 response has no ``Retry-After`` header
     rate_limit_wait: int = 5
+    # Shared by all processes
+    rate_limit_per_second: float = 10
+    rate_limit_burst: int = 20
+    # Retries of 429 responses with jittered exponential backoff (seconds)
+    rate_limit_retries: int = 5
+    rate_limit_backoff: float = 1
+    rate_limit_backoff_max: float = 30
+
+    # Identical concurrent GET requests share one network call
+    coalesce_requests: bool = True
+    # Seconds decoded responses are shared between processes through redis, 0 disables cross-process coalescing
+    shared_response_ttl: float = 0
+
+    # Seconds between logs of rate limiter, cache and coalescing counters by every worker process, 0 disables logging
+    metrics_log_interval: float = 300
+
+    # Max number of expired artists and tracks refreshed by one background job
+    refresh_limit: int = 1000
+    # Analyses that met expired records request the refresh job at most once per this many seconds
+    # (it also runs on beat schedule)
+    refresh_request_interval: int = 300
+
+    # In-process read-through caches of repositories (number of entries), optionally capped by approximate bytes
+    tracks_cache_size: int = 10_000
+    artists_cache_size: int = 10_000
+    track_features_cache_size: int = 50_000
+    cache_max_bytes: Optional[int] = None
+    # Records are also cached in redis and shared by all processes (expire with ``TRACK/ARTIST_EXPIRY_DAYS``)
+    shared_cache: bool = False
+
+    # Association rows are inserted with ``COPY`` starting from this number of rows
+    copy_threshold: int = 1000
+
+    # New playlist version is rescored from statistics of the previous one, unless added and removed tracks
+    # make more than this share of its tracks
+    incremental_max_changes: float = 0.5
+    # Removed tracks are subtracted with their current values, to bound the drift a playlist is scored from scratch
+    # after this many incremental versions (and whenever a removed track or its artist was refreshed)
+    incremental_max_versions: int = 10
+
+    # Playlists with at least this many tracks are scored approximately with sketches (see ``PlaylistSketch``),
+    # None scores every playlist exactly
+    sketch_min_tracks: Optional[int] = None
+
+    # Number of processes scoring runs in (per celery worker process), 0 runs scoring in the event loop thread.
+    # Children of celery prefork pool can't start processes, there scoring runs in this many threads instead
+    # (see ``ScoringExecutor``), workers scoring in processes have to run with --pool=solo
+    scoring_workers: int = 0
+
+    # Seconds between refreshes of in-memory index of playlist feature vectors (see ``FeatureIndex``)
+    feature_index_refresh: float = 60
+
+    # Max number of playlist pages requested or waiting to be processed at the same time,
+    # 1 disables concurrent fetching
+    pages_concurrency: int = 8
+
+    # Access token is refreshed this many seconds before spotify's ``expires_in`` runs out
+    token_refresh_margin: int = 60
+    # Used when redis is unavailable, shared between processes on one host
+    token_cache_file: str = path.join(gettempdir(), 'viniqufy_spotify_token.json')
 
 
 analysis_settings = AnalysisSettings()
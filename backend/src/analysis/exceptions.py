@@ -7,6 +7,12 @@ class InvalidSpotifyId(CustomHTTPException):
         super().__init__(detail, status_code=400, error_code='INVALID_SPOTIFY_ID')
 
 
+class PlaylistNotAnalyzed(CustomHTTPException):
+    def __init__(self, spotify_id: str):
+        detail = f"Playlist is not analyzed yet: {spotify_id}"
+        super().__init__(detail, status_code=404, error_code='PLAYLIST_NOT_ANALYZED')
+
+
 class InvalidTaskId(TaskException):
     def __init__(self, task_id: str):
         detail = f"Invalid base-64 Task ID: {task_id}"
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+
+from src.analysis.config import analysis_settings
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_up() -> None:
+    # Importing numpy and scoring code once, so the first scoring doesn't pay for it
+    import src.analysis.statistics  # noqa
+
+
+class ScoringExecutor:
+    """
+    Pool for CPU-bound scoring, one per process.
+    Event loop keeps fetching and writing while scoring runs on other cores.
+
+    Processes are spawned (not forked), so they don't inherit event loop, connections, etc.
+    Arguments are pickled, so only numpy arrays and numbers should be passed (e.g. ``StatsSummary``).
+    If pool is disabled (``workers`` = 0), functions are run in the calling thread.
+
+    Daemonic processes can't have children, so in children of celery ``prefork`` pool (or if processes
+    can't be started) scoring runs in a pool of threads instead: numpy releases the GIL in array operations,
+    so the event loop still isn't blocked. Celery ``threads`` pool is not supported, tasks use the event loop
+    of the thread they run in.
+    The pool is started on the first scoring (in a thread, not to block the event loop)
+    if it wasn't started before (e.g. by ``worker_process_init``)
+    """
+
+    def __init__(self, workers: int):
+        self._workers = workers
+        self._pool: Executor | None = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """
+        Starts pool and waits until every process has imported scoring code (blocks, up to process start time).
+        If processes can't be started, a pool of threads is started instead
+        """
+        with self._lock:
+            if self._workers <= 0 or self._pool is not None:
+                return
+
+            if multiprocessing.current_process().daemon:
+                logger.info('Scoring process pool can\'t be started in daemonic process (e.g. celery prefork pool), '
+                            'scoring runs in %d threads', self._workers)
+                self._pool = ThreadPoolExecutor(self._workers, thread_name_prefix='scoring')
+                return
+
+            try:
+                self._pool = ProcessPoolExecutor(self._workers, mp_context=multiprocessing.get_context('spawn'))
+                for future in [self._pool.submit(_warm_up) for _ in range(self._workers)]:
+                    future.result()
+            except (AssertionError, OSError, BrokenProcessPool) as error:
+                logger.warning('Scoring process pool is not started, scoring runs in %d threads: %s',
+                               self._workers, error)
+                self.__shutdown()
+                self._pool = ThreadPoolExecutor(self._workers, thread_name_prefix='scoring')
+
+    def close(self) -> None:
+        with self._lock:
+            self.__shutdown()
+
+    def __shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    async def run(self, function: Callable[..., Any], *args: Any) -> Any:
+        """
+        Runs function in pool (inline if pool is disabled)
+        :param function: Module-level function, it is imported by name in pool process
+        :param args: Picklable arguments
+        """
+        if self._workers <= 0:
+            return function(*args)
+
+        if self._pool is None:
+            await asyncio.to_thread(self.start)
+
+        return await asyncio.get_running_loop().run_in_executor(self._pool, function, *args)
+
+
+scoring_executor = ScoringExecutor(analysis_settings.scoring_workers)
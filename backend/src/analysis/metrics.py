@@ -0,0 +1,43 @@
+import logging
+import time
+
+from src.analysis.coalescing import request_coalescer, shared_request_coalescer
+from src.analysis.config import analysis_settings
+from src.analysis.ratelimit import rate_limiter
+from src.analysis.repository import tracks_cache, artists_cache, track_features_cache, tracks_shared_cache, \
+    artists_shared_cache, track_features_shared_cache
+
+logger = logging.getLogger(__name__)
+
+_logged_at: float | None = None
+
+
+async def collect_metrics() -> dict[str, dict[str, float]]:
+    """
+    Rate limiter counters (shared by all processes), cache and coalescing counters of current process
+    """
+    return {
+        'rate_limiter': await rate_limiter.stats(),
+        'request_coalescer': request_coalescer.stats(),
+        'shared_request_coalescer': shared_request_coalescer.stats(),
+        'tracks_cache': tracks_cache.stats(),
+        'artists_cache': artists_cache.stats(),
+        'track_features_cache': track_features_cache.stats(),
+        'tracks_shared_cache': tracks_shared_cache.stats(),
+        'artists_shared_cache': artists_shared_cache.stats(),
+        'track_features_shared_cache': track_features_shared_cache.stats(),
+    }
+
+
+async def log_metrics(interval: float = analysis_settings.metrics_log_interval) -> None:
+    """
+    Logs metrics of current process, at most once per ``interval`` seconds (called after every task of worker)
+    """
+    global _logged_at
+
+    if interval <= 0 or (_logged_at is not None and time.monotonic() - _logged_at < interval):
+        return
+
+    _logged_at = time.monotonic()
+    for name, values in (await collect_metrics()).items():
+        logger.info('%s: %s', name, ', '.join(f'{key}={value:g}' for key, value in values.items()))
@@ -2,8 +2,8 @@ from datetime import date, datetime, timedelta
 from uuid import UUID, uuid4
 
 from sqlalchemy import text, ForeignKey, Table, Column, String, Enum as SQLAlchemyEnum, UUID as SQLALCHEMY_UUID, \
-    DateTime
-from sqlalchemy.dialects.postgresql import ARRAY
+    DateTime, Integer, Float, SmallInteger, BigInteger, LargeBinary
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.orm import mapped_column, Mapped, validates, relationship, declared_attr
 
 from src.analysis.enums import AnalysisStatus
@@ -25,23 +25,34 @@ class ExpireTable(BaseTable):
 
     @declared_attr
     def expires_at(self) -> Mapped[datetime]:
-        return mapped_column(DateTime, default=lambda: datetime.now() + timedelta(days=self.expires_after))
+        return mapped_column(DateTime, default=self.next_expires_at, index=True)
 
+    @classmethod
+    def next_expires_at(cls) -> datetime:
+        """
+        Expiry date (UTC, like every other timestamp compared with it) for a row created or refreshed now
+        """
+        return datetime.utcnow() + timedelta(days=cls.expires_after)
 
-# Association tables
+
+# Association tables (composite primary keys, ``track_id`` indexed separately for reverse lookups)
 artist_track_association = Table(
     'artist_track_association',
     Base.metadata,
-    Column('artist_id', String, ForeignKey("artist.artist_id", ondelete='CASCADE', name='artist_id')),
-    Column('track_id', String, ForeignKey("track.track_id", ondelete='CASCADE', name="track_id")),
+    Column('artist_id', String, ForeignKey("artist.artist_id", ondelete='CASCADE', name='artist_id'),
+           primary_key=True),
+    Column('track_id', String, ForeignKey("track.track_id", ondelete='CASCADE', name="track_id"),
+           primary_key=True, index=True),
 )
 
 playlist_track_association = Table(
     'playlist_track_association',
     Base.metadata,
     Column('playlist_version_id', SQLALCHEMY_UUID,
-           ForeignKey("playlist_version.version_id", ondelete="CASCADE", name="playlist_version_id")),
-    Column('track_id', String, ForeignKey("track.track_id", ondelete="CASCADE", name="track_id_playlist")),
+           ForeignKey("playlist_version.version_id", ondelete="CASCADE", name="playlist_version_id"),
+           primary_key=True),
+    Column('track_id', String, ForeignKey("track.track_id", ondelete="CASCADE", name="track_id_playlist"),
+           primary_key=True, index=True),
 )
 
 
@@ -95,6 +106,8 @@ class Analysis(BaseTable):
 
     # Analysis data (nullable for pending analysis)
     uniqueness: Mapped[float] = mapped_column(nullable=True)
+    # Components of uniqueness in ``scoring.COMPONENTS`` order, uniqueness is recomputed from them on weights change
+    components: Mapped[list[float]] = mapped_column(ARRAY(Float), nullable=True)
     # Other metrics will be added later
 
     playlist_version: Mapped["PlaylistVersion"] = relationship("PlaylistVersion",
@@ -162,6 +175,8 @@ class Artist(ExpireTable):
     followers: Mapped[int]
     popularity: Mapped[int]
     genres: Mapped[list[str]] = mapped_column(ARRAY(String), nullable=True)
+    # Codes of ``genres`` in ``genre`` table, written together with ``genres``
+    genre_ids: Mapped[list[int]] = mapped_column(ARRAY(Integer), nullable=True)
 
     expires_after = settings.ARTIST_EXPIRY_DAYS
 
@@ -171,3 +186,77 @@ class Artist(ExpireTable):
     @validates('popularity')
     def validate_popularity(self, key, value):
         return validate_popularity(value)
+
+
+class TrackPlaylistCount(BaseTable):
+    """
+    Number of distinct playlists containing track in any of their versions, maintained when tracks are linked.
+    Counters are never decremented, the application doesn't delete playlists or their versions.
+    Links of playlists deleted in db are removed by cascade, but counters are not, so they are rebuilt after
+    such deletes (in one transaction): ``DELETE FROM track_playlist_count;
+    INSERT INTO track_playlist_count (track_id, playlists) SELECT track_id, count(DISTINCT playlist_id)
+    FROM playlist_track_association JOIN playlist_version ON version_id = playlist_version_id GROUP BY track_id``
+    """
+    __tablename__ = "track_playlist_count"
+
+    track_id: Mapped[str] = mapped_column(ForeignKey("track.track_id", ondelete="CASCADE"), primary_key=True)
+    playlists: Mapped[int] = mapped_column(default=0)
+
+
+class PlaylistVersionStats(BaseTable):
+    """
+    Sufficient statistics of scored playlist version (``PlaylistStats.to_json``),
+    the next version of the playlist is rescored from them incrementally
+    """
+    __tablename__ = "playlist_version_stats"
+
+    version_id: Mapped[UUID] = mapped_column(ForeignKey("playlist_version.version_id", ondelete="CASCADE"),
+                                             primary_key=True)
+    stats: Mapped[dict] = mapped_column(JSONB)
+
+
+class Genre(BaseTable):
+    """
+    Vocabulary of genre names, genres of artists are stored as integer codes of this table
+    """
+    __tablename__ = "genre"
+
+    genre_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(unique=True)
+
+
+class PlaylistVersionSignature(BaseTable):
+    """
+    MinHash signature of tracks of analyzed playlist version (``minhash.signature``, ``SIGNATURE_SIZE`` uint32)
+    """
+    __tablename__ = "playlist_version_signature"
+
+    version_id: Mapped[UUID] = mapped_column(ForeignKey("playlist_version.version_id", ondelete="CASCADE"),
+                                             primary_key=True)
+    signature: Mapped[bytes] = mapped_column(LargeBinary)
+
+
+class PlaylistVersionBand(BaseTable):
+    """
+    LSH index of signatures: hash of every band of signature, versions sharing a band are similarity candidates
+    """
+    __tablename__ = "playlist_version_band"
+
+    band: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    band_hash: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    version_id: Mapped[UUID] = mapped_column(ForeignKey("playlist_version.version_id", ondelete="CASCADE"),
+                                             primary_key=True, index=True)
+
+
+class PlaylistVersionFeatures(BaseTable):
+    """
+    Feature vector of analyzed playlist version (``PlaylistStats.feature_vector``: float32 means and standard
+    deviations of features), nearest playlists by sound are searched by ``FeatureIndex``
+    """
+    __tablename__ = "playlist_version_features"
+
+    version_id: Mapped[UUID] = mapped_column(ForeignKey("playlist_version.version_id", ondelete="CASCADE"),
+                                             primary_key=True)
+    vector: Mapped[bytes] = mapped_column(LargeBinary)
+    # Index is refreshed with vectors created since its previous refresh
+    created_at: Mapped[datetime] = mapped_column(server_default=text("TIMEZONE('utc', now())"), index=True)
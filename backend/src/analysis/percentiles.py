@@ -0,0 +1,128 @@
+import math
+from typing import Awaitable, Callable
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.redis_client import redis_client
+
+# Counts of analyzes in every bin, counted in db (see ``AnalysisRepository.uniqueness_histogram``)
+HistogramLoader = Callable[[int], Awaitable[dict[int, int]]]
+
+# Bins are incremented only while the histogram exists, otherwise the analysis is counted by the next rebuild
+ADD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+end
+return 0
+"""
+
+# Field of every built histogram, so the histogram of zero analyzes exists too
+_BUILT_FIELD = 'built'
+
+
+class PercentileIndex:
+    """
+    Distribution of uniqueness of all successful analyzes, kept in redis as a fixed-bin histogram (hash of bin counts).
+
+    Every completed analysis increments one bin, so nothing is counted in db on reads.
+    Percentile is read from at most ``bins`` counters, cost doesn't depend on number of analyzes.
+    Values in the same bin are not ordered, error of percentile is at most half of the share of analyzes
+    in the bin of the value (uniqueness is from 0 to 1, bins are 1 / ``bins`` wide).
+    If the histogram is missing (first deploy, redis data lost), it is rebuilt from db on read by one process.
+    If redis is unavailable, writes are skipped and percentiles are unknown
+    """
+
+    def __init__(self, redis: Redis, bins: int = 1000, prefix: str = 'analysis:uniqueness',
+                 rebuild_timeout: int = 60):
+        self._redis = redis
+        self._bins = bins
+        # Histograms of earlier versions were built by increments only and may miss older analyzes
+        self._key = f'{prefix}:histogram:v2:{bins}'
+        self._rebuild_lock_key = f'{self._key}:rebuilding'
+        self._rebuild_timeout = rebuild_timeout
+        self._add_script = redis.register_script(ADD_SCRIPT)
+
+    @property
+    def bins(self) -> int:
+        return self._bins
+
+    def bin(self, uniqueness: float) -> int:
+        return min(max(int(uniqueness * self._bins), 0), self._bins - 1)
+
+    async def add(self, uniqueness: float) -> None:
+        if not math.isfinite(uniqueness):
+            return
+
+        try:
+            await self._add_script(keys=[self._key], args=[str(self.bin(uniqueness))])
+        except RedisError:
+            pass
+
+    async def percentile(self, uniqueness: float, load: HistogramLoader | None = None) -> float | None:
+        """
+        :param load: Loader of the histogram from db, used if the histogram is missing
+        :return: Percentage of analyzes with lower uniqueness (from 0 to 100), None if unknown
+        """
+        if uniqueness is None or not math.isfinite(uniqueness):
+            return None
+
+        try:
+            histogram = await self._redis.hgetall(self._key)
+            if not histogram and load is not None and await self.__rebuild_from(load):
+                histogram = await self._redis.hgetall(self._key)
+        except RedisError:
+            return None
+
+        value_bin = self.bin(uniqueness)
+        total = lower = same = 0
+
+        for bin_key, count in histogram.items():
+            if bin_key.decode() == _BUILT_FIELD:
+                continue
+
+            bin_index, count = int(bin_key), int(count)
+            total += count
+
+            if bin_index < value_bin:
+                lower += count
+            elif bin_index == value_bin:
+                same += count
+
+        if total == 0:
+            return None
+
+        # Half of the values of the same bin are counted as lower
+        return 100 * (lower + same / 2) / total
+
+    async def __rebuild_from(self, load: HistogramLoader) -> bool:
+        """
+        Rebuilds missing histogram, unless another process is already rebuilding it
+        :return: Whether the histogram was rebuilt
+        """
+        if not await self._redis.set(self._rebuild_lock_key, 1, nx=True, ex=self._rebuild_timeout):
+            return False
+
+        try:
+            await self.rebuild(await load(self._bins))
+        finally:
+            await self._redis.delete(self._rebuild_lock_key)
+
+        return True
+
+    async def rebuild(self, counts: dict[int, int]) -> None:
+        """
+        Replaces the histogram, e.g. after uniqueness of all analyzes is recomputed
+        :param counts: Dict of bin (see ``bin``) and number of analyzes
+        """
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.delete(self._key)
+                pipe.hset(self._key, mapping={_BUILT_FIELD: 1,
+                                              **{str(bin_index): count for bin_index, count in counts.items()}})
+                await pipe.execute()
+        except RedisError:
+            pass
+
+
+percentile_index = PercentileIndex(redis_client)
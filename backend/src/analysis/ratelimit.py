@@ -0,0 +1,152 @@
+import asyncio
+import random
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.analysis.config import analysis_settings
+from src.redis_client import redis_client
+
+# Token bucket stored in redis hash, shared by every API worker and celery process.
+# Server time is used, so clocks of different hosts don't matter.
+# Returns number of milliseconds caller has to wait before trying again (0 means request is allowed)
+ACQUIRE_SCRIPT = """
+local bucket_key, pause_key, stats_key = KEYS[1], KEYS[2], KEYS[3]
+local rate, capacity = tonumber(ARGV[1]), tonumber(ARGV[2])
+
+local pause_ttl = redis.call('PTTL', pause_key)
+if pause_ttl > 0 then
+    return pause_ttl
+end
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local bucket = redis.call('HMGET', bucket_key, 'tokens', 'timestamp')
+local tokens = tonumber(bucket[1]) or capacity
+local timestamp = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - timestamp) * rate / 1000)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    redis.call('HINCRBY', stats_key, 'requests', 1)
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+
+redis.call('HSET', bucket_key, 'tokens', tostring(tokens), 'timestamp', now)
+redis.call('PEXPIRE', bucket_key, math.ceil(capacity * 1000 / rate) + 1000)
+return wait
+"""
+
+# Pause is extended only, a shorter ``Retry-After`` never shortens a longer pause already in place
+PAUSE_SCRIPT = """
+local pause_ttl = redis.call('PTTL', KEYS[1])
+local duration = tonumber(ARGV[1])
+
+if pause_ttl < duration then
+    redis.call('SET', KEYS[1], 1, 'PX', duration)
+    return 1
+end
+return 0
+"""
+
+
+class RateLimiter:
+    """
+    Distributed token bucket for spotify API calls.
+
+    Requests pass at ``rate`` per second with bursts up to ``capacity``.
+    When spotify answers with 429, every process is paused for the ``Retry-After`` window.
+    Time spent waiting is accumulated in redis (see ``stats``) to size the fleet against the real quota.
+    If redis is unavailable, requests are not throttled.
+    """
+
+    def __init__(self, redis: Redis, rate: float, capacity: int, prefix: str = 'spotify:rate_limit'):
+        self._redis = redis
+        self._rate = rate
+        self._capacity = capacity
+
+        self._bucket_key = f'{prefix}:bucket'
+        self._pause_key = f'{prefix}:pause'
+        self._stats_key = f'{prefix}:stats'
+
+        self._acquire_script = redis.register_script(ACQUIRE_SCRIPT)
+        self._pause_script = redis.register_script(PAUSE_SCRIPT)
+
+    async def acquire(self) -> float:
+        """
+        Waits until request is allowed by the bucket.
+        :return: Seconds spent waiting
+        """
+        waited = 0.0
+
+        while True:
+            try:
+                wait_ms = await self._acquire_script(keys=[self._bucket_key, self._pause_key, self._stats_key],
+                                                     args=[self._rate, self._capacity])
+            except RedisError:
+                return waited
+
+            if wait_ms <= 0:
+                break
+
+            # Jitter prevents all waiting processes from hitting the bucket at the same millisecond
+            wait = wait_ms / 1000 + random.uniform(0, 0.1)
+            await asyncio.sleep(wait)
+            waited += wait
+
+        if waited:
+            await self.__record(waited_requests=1, wait_seconds=waited)
+
+        return waited
+
+    async def pause(self, retry_after: float) -> None:
+        """
+        Pauses all callers, used when spotify responds with 429
+        :param retry_after: Seconds from ``Retry-After`` header
+        """
+        try:
+            await self._pause_script(keys=[self._pause_key], args=[max(int(retry_after * 1000), 1)])
+        except RedisError:
+            await asyncio.sleep(retry_after)
+
+        await self.__record(throttled_responses=1)
+
+    async def stats(self) -> dict[str, float]:
+        """
+        Counters of all processes:
+        requests - number of allowed requests,
+        waited_requests - number of requests that had to wait,
+        wait_seconds - total time spent waiting,
+        throttled_responses - number of 429 responses
+        """
+        try:
+            raw = await self._redis.hgetall(self._stats_key)
+        except RedisError:
+            return {}
+
+        return {key.decode(): float(value) for key, value in raw.items()}
+
+    async def __record(self, **counters: float) -> None:
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for name, value in counters.items():
+                    pipe.hincrbyfloat(self._stats_key, name, value)
+                await pipe.execute()
+        except RedisError:
+            pass
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Exponential backoff with full jitter
+    :param attempt: Number of retry, starting from 0
+    :return: Seconds to wait
+    """
+    delay = min(analysis_settings.rate_limit_backoff_max, analysis_settings.rate_limit_backoff * 2 ** attempt)
+    return random.uniform(0, delay)
+
+
+rate_limiter = RateLimiter(redis_client, analysis_settings.rate_limit_per_second, analysis_settings.rate_limit_burst)
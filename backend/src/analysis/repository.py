@@ -1,13 +1,123 @@
-from datetime import datetime
+import math
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Hashable, Iterable
 from uuid import UUID
 
-from sqlalchemy import select
-from sqlalchemy.orm import joinedload, selectinload
-
-from src.analysis.models import Track, TrackFeatures, Artist, Playlist, PlaylistVersion, Analysis
+from pydantic import BaseModel
+
+import numpy as np
+from sqlalchemy import select, text, func, distinct, literal, union_all, update, delete, tuple_, case, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import joinedload, selectinload, noload
+
+from src.analysis import minhash, vectors
+from src.analysis.cache import LRUCache, RedisCache
+from src.analysis.config import analysis_settings
+from src.analysis.enums import AnalysisStatus
+from src.analysis.models import Track, TrackFeatures, Artist, Playlist, PlaylistVersion, Analysis, Genre, \
+    PlaylistVersionStats, TrackPlaylistCount, PlaylistVersionSignature, PlaylistVersionBand, PlaylistVersionFeatures, \
+    artist_track_association, playlist_track_association
+from src.analysis.scoring import FEATURES, ScoringRecords
 from src.analysis.schemas import STrack, STrackBase, SArtist, SArtistBase, SPlaylist, SPlaylistBase, \
     SPlaylistVersion, SPlaylistVersionBase, STrackFeaturesBase, SAnalysis, SAnalysisBase, SAnalysisUpdate
-from src.repository import BaseRepository, with_session_management
+from src.config import settings
+from src.redis_client import redis_client
+from src.repository import BaseRepository, with_session_management, bulk_insert, after_commit
+
+# Read-through caches, module level because writes of one entity invalidate records of others.
+# Keys: id for records without relationships (``get_many``), (GRAPH, id) for records with them (``get``)
+GRAPH = 'graph'
+track_features_cache = LRUCache(analysis_settings.track_features_cache_size, analysis_settings.cache_max_bytes)
+artists_cache = LRUCache(analysis_settings.artists_cache_size, analysis_settings.cache_max_bytes)
+tracks_cache = LRUCache(analysis_settings.tracks_cache_size, analysis_settings.cache_max_bytes)
+
+# Second level, shared by all processes. Holds only records of ``get_many`` (keyed by id)
+track_features_shared_cache = RedisCache(redis_client, 'track_features', STrackFeaturesBase,
+                                         ttl=timedelta(days=settings.TRACK_EXPIRY_DAYS),
+                                         enabled=analysis_settings.shared_cache)
+artists_shared_cache = RedisCache(redis_client, 'artist', SArtistBase,
+                                  ttl=timedelta(days=settings.ARTIST_EXPIRY_DAYS),
+                                  enabled=analysis_settings.shared_cache)
+tracks_shared_cache = RedisCache(redis_client, 'track', STrack,
+                                 ttl=timedelta(days=settings.TRACK_EXPIRY_DAYS),
+                                 enabled=analysis_settings.shared_cache)
+
+
+def _record_expiry(record: BaseModel) -> datetime | None:
+    """
+    Record is valid until it or any of its artists expires, records without ``expires_at`` never expire
+    """
+    expiries = [getattr(record, 'expires_at', None), *(artist.expires_at for artist in getattr(record, 'artists', []))]
+    return min((expiry for expiry in expiries if expiry is not None), default=None)
+
+
+def _updated_at(table: type[Track | Artist], excluded, columns: Iterable[str]):
+    """
+    ``updated_at`` of upserted row: now if any of columns (the ones scoring uses) changes, otherwise unchanged.
+    So refreshing a record with the same values doesn't mark it as refreshed (see ``refreshed_since``)
+    """
+    changed = or_(*(getattr(table, column).is_distinct_from(excluded[column]) for column in columns))
+    return case((changed, text("TIMEZONE('utc', now())")), else_=table.updated_at)
+
+
+async def _cache_records(cache: LRUCache, records: dict[Hashable, BaseModel],
+                         shared_cache: RedisCache | None = None) -> None:
+    # Not caching uncommitted data, it may be rolled back
+    async def store():
+        expiries = {key: _record_expiry(record) for key, record in records.items()}
+
+        for key, record in records.items():
+            cache.set(key, record, expires_at=expiries[key])
+
+        if shared_cache:
+            await shared_cache.set_many(records, expiries)
+
+    await after_commit(store)
+
+
+async def _invalidate_records(cache: LRUCache, ids: Iterable[str], shared_cache: RedisCache | None = None) -> None:
+    ids = list(ids)
+    keys = [key for entity_id in ids for key in (entity_id, (GRAPH, entity_id))]
+
+    async def invalidate():
+        cache.invalidate(keys)
+        if shared_cache:
+            await shared_cache.invalidate(ids)
+
+    await invalidate()
+
+    # Old values may be cached by other readers before commit
+    await after_commit(invalidate)
+
+
+async def _read_through(cache: LRUCache, shared_cache: RedisCache, ids: Iterable[str],
+                        load: Callable[[set[str]], Awaitable[dict[str, BaseModel]]]) -> dict[str, BaseModel]:
+    """
+    Reads records from in-process cache, then from shared cache, then loads the rest from db and caches them
+    :param load: Coroutine function loading records of missing ids from db
+    :return: Dict of id and record, missing records are not included
+    """
+    result = cache.get_many(ids)
+    missing_ids = set(ids) - result.keys()
+
+    if missing_ids:
+        shared = await shared_cache.get_many(missing_ids)
+        for record_id, record in shared.items():
+            cache.set(record_id, record, expires_at=_record_expiry(record))
+
+        result |= shared
+        missing_ids -= shared.keys()
+
+    if missing_ids:
+        loaded = await load(missing_ids)
+        await _cache_records(cache, loaded, shared_cache)
+        result |= loaded
+
+    return result
+
+
+# Genre names never change, so codes are cached for the whole life of the process
+_genre_codes: dict[str, int] = {}
 
 
 # TODO: find way to avoid code duplication (lazy rn)
@@ -19,6 +129,10 @@ from src.repository import BaseRepository, with_session_management
 @with_session_management
 class TrackFeaturesRepository(BaseRepository):
     async def get(self, track_id: str) -> STrackFeaturesBase | None:
+        cached = track_features_cache.get(track_id)
+        if cached is not None:
+            return cached
+
         query = (
             select(TrackFeatures)
             .options(joinedload(TrackFeatures.track))
@@ -31,22 +145,106 @@ class TrackFeaturesRepository(BaseRepository):
         if not features_scalar:
             return None
 
-        return STrackFeaturesBase.model_validate(features_scalar, from_attributes=True)
+        features = STrackFeaturesBase.model_validate(features_scalar, from_attributes=True)
+        await _cache_records(track_features_cache, {track_id: features})
+
+        return features
+
+    async def get_many(self, track_ids: list[str]) -> dict[str, STrackFeaturesBase]:
+        """
+        Loads features of many tracks in one query
+        :param track_ids: Spotify ids of tracks
+        :return: Dict of track id and features, missing tracks are not included
+        """
+        async def load(missing_ids: set[str]) -> dict[str, STrackFeaturesBase]:
+            query = select(TrackFeatures).where(TrackFeatures.track_id.in_(missing_ids))
+            features_models = await self.session.scalars(query)
+
+            return {features.track_id: STrackFeaturesBase.model_validate(features, from_attributes=True)
+                    for features in features_models}
+
+        return await _read_through(track_features_cache, track_features_shared_cache, track_ids, load)
 
     async def create(self, input_features: STrackFeaturesBase) -> STrackFeaturesBase:
         features_model = TrackFeatures(**input_features.model_dump())
+        await _invalidate_records(track_features_cache, [input_features.track_id], track_features_shared_cache)
 
         self.session.add(features_model)
         await self.session.flush()
-        await self.session.commit()
+        await self.commit()
 
         return STrackFeaturesBase.model_validate(features_model, from_attributes=True)
 
+    async def upsert_many(self, input_features: list[STrackFeaturesBase]) -> list[STrackFeaturesBase]:
+        """
+        Inserts or updates features of many tracks in one statement
+        :param input_features: schemas of track features
+        :return: written schemas
+        """
+        rows = {features.track_id: features.model_dump() for features in input_features}
+
+        if not rows:
+            return []
+
+        await _invalidate_records(track_features_cache, rows, track_features_shared_cache)
+
+        statement = insert(TrackFeatures).values([rows[key] for key in sorted(rows)])
+        statement = statement.on_conflict_do_update(
+            index_elements=[TrackFeatures.track_id],
+            set_={key: statement.excluded[key] for key in STrackFeaturesBase.model_fields if key != 'track_id'}
+        )
+
+        await self.session.execute(statement)
+        await self.commit()
+
+        return list(input_features)
+
+
+@with_session_management
+class GenreRepository(BaseRepository):
+    async def get_codes(self, names: Iterable[str]) -> dict[str, int]:
+        """
+        Integer codes of genres, unknown genres are added to vocabulary
+        :param names: Genre names
+        :return: Dict of genre name and code
+        """
+        names = set(names)
+        codes = {name: _genre_codes[name] for name in names if name in _genre_codes}
+        missing_names = sorted(names - codes.keys())
+
+        if missing_names:
+            # Sorted insert, concurrent writers take locks in the same order
+            await self.session.execute(
+                insert(Genre).values([{'name': name} for name in missing_names]).on_conflict_do_nothing())
+            rows = await self.session.execute(select(Genre.name, Genre.genre_id).where(Genre.name.in_(missing_names)))
+            loaded = dict(rows.tuples())
+            codes |= loaded
+
+            await self.commit()
+            # Codes of genres added in rolled back transaction must not be cached
+            await after_commit(lambda: _genre_codes.update(loaded))
+
+        return codes
+
+    async def with_codes(self, input_artists: list[SArtistBase]) -> list[dict]:
+        """
+        Rows of artists with genre codes (``genre_ids``)
+        :param input_artists: schemas of artists
+        """
+        codes = await self.get_codes(genre for artist in input_artists for genre in artist.genres)
+
+        return [{**artist.model_dump(), 'genre_ids': [codes[genre] for genre in artist.genres]}
+                for artist in input_artists]
+
 
 @with_session_management
 class ArtistsRepository(BaseRepository):
 
     async def get(self, artist_id: str) -> SArtist | None:
+        cached = artists_cache.get((GRAPH, artist_id))
+        if cached is not None:
+            return cached
+
         query = (
             select(Artist)
             .options(selectinload(Artist.tracks))
@@ -59,14 +257,34 @@ class ArtistsRepository(BaseRepository):
         if not artist_scalar:
             return None
 
-        return SArtist.model_validate(artist_scalar, from_attributes=True)
+        artist = SArtist.model_validate(artist_scalar, from_attributes=True)
+        await _cache_records(artists_cache, {(GRAPH, artist_id): artist})
+
+        return artist
+
+    async def get_many(self, artist_ids: list[str]) -> dict[str, SArtistBase]:
+        """
+        Loads many artists (without relationships) in one query
+        :param artist_ids: Spotify ids of artists
+        :return: Dict of artist id and artist, missing artists are not included
+        """
+        async def load(missing_ids: set[str]) -> dict[str, SArtistBase]:
+            query = select(Artist).where(Artist.artist_id.in_(missing_ids))
+            artist_models = await self.session.scalars(query)
+
+            return {artist.artist_id: SArtistBase.model_validate(artist, from_attributes=True)
+                    for artist in artist_models}
+
+        return await _read_through(artists_cache, artists_shared_cache, artist_ids, load)
 
     async def create(self, input_artist: SArtistBase) -> SArtistBase:
-        artist_model = Artist(**input_artist.model_dump())
+        [row] = await genres.with_codes([input_artist])
+        artist_model = Artist(**row)
+        await _invalidate_records(artists_cache, [input_artist.artist_id], artists_shared_cache)
 
         self.session.add(artist_model)
         await self.session.flush()
-        await self.session.commit()
+        await self.commit()
 
         return SArtistBase.model_validate(artist_model, from_attributes=True)
 
@@ -81,13 +299,82 @@ class ArtistsRepository(BaseRepository):
         if not artist_model:
             return None
 
-        for key, value in input_artist.model_dump().items():
+        await _invalidate_records(artists_cache, [input_artist.artist_id], artists_shared_cache)
+
+        [row] = await genres.with_codes([input_artist])
+        for key, value in row.items():
             setattr(artist_model, key, value)
 
         await self.session.flush()
-        await self.session.commit()
+        await self.commit()
         return SArtistBase.model_validate(artist_model, from_attributes=True)
 
+    async def upsert_many(self, input_artists: list[SArtistBase]) -> list[SArtistBase]:
+        """
+        Inserts new artists and refreshes existing ones (including expiry date) in one statement
+        :param input_artists: schemas of artists
+        :return: written schemas
+        """
+        expires_at = Artist.next_expires_at()
+        rows = {row['artist_id']: {**row, 'expires_at': expires_at} for row in await genres.with_codes(input_artists)}
+
+        if not rows:
+            return []
+
+        await _invalidate_records(artists_cache, rows, artists_shared_cache)
+
+        statement = insert(Artist).values([rows[key] for key in sorted(rows)])
+        statement = statement.on_conflict_do_update(
+            index_elements=[Artist.artist_id],
+            set_={
+                **{key: statement.excluded[key] for key in SArtistBase.model_fields if key != 'artist_id'},
+                'genre_ids': statement.excluded.genre_ids,
+                'expires_at': statement.excluded.expires_at,
+                'updated_at': _updated_at(Artist, statement.excluded, ['popularity', 'genre_ids']),
+            }
+        )
+
+        await self.session.execute(statement)
+        await self.commit()
+
+        return list(input_artists)
+
+    async def most_referenced_expired(self, limit: int) -> list[str]:
+        """
+        Expired artists, ordered by number of playlist versions that contain their tracks
+        :param limit: Max number of ids
+        :return: Spotify ids of artists
+        """
+        query = (
+            select(Artist.artist_id)
+            .outerjoin(artist_track_association, artist_track_association.c.artist_id == Artist.artist_id)
+            .outerjoin(playlist_track_association,
+                       playlist_track_association.c.track_id == artist_track_association.c.track_id)
+            .where(Artist.expires_at < datetime.utcnow())
+            .group_by(Artist.artist_id)
+            .order_by(func.count(distinct(playlist_track_association.c.playlist_version_id)).desc())
+            .limit(limit)
+        )
+
+        return list(await self.session.scalars(query))
+
+    async def postpone_expiry(self, artist_ids: list[str]) -> None:
+        """
+        Sets expiry date of artists as if they were refreshed now, values (and ``updated_at``) are kept.
+        Used for artists spotify can't resolve, so they are not picked by ``most_referenced_expired`` again
+        :param artist_ids: Spotify ids of artists
+        """
+        if not artist_ids:
+            return
+
+        await _invalidate_records(artists_cache, artist_ids, artists_shared_cache)
+        await self.session.execute(
+            update(Artist)
+            .where(Artist.artist_id.in_(artist_ids))
+            .values(expires_at=Artist.next_expires_at(), updated_at=Artist.updated_at)
+        )
+        await self.commit()
+
     async def is_expired(self, artist_id: str) -> bool | None:
         """
         Compares artist expires_at date with current date
@@ -113,11 +400,12 @@ class ArtistsRepository(BaseRepository):
         if not artist_model:
             return None
 
+        await _invalidate_records(artists_cache, [artist_id], artists_shared_cache)
         track_model = Track(**track_input.model_dump())
 
         artist_model.tracks.append(track_model)
         await self.session.flush()
-        await self.session.commit()
+        await self.commit()
         return STrack.model_validate(track_model, from_attributes=True)
 
 
@@ -125,6 +413,10 @@ class ArtistsRepository(BaseRepository):
 class TrackRepository(BaseRepository):
 
     async def get(self, track_id: str) -> STrack | None:
+        cached = tracks_cache.get((GRAPH, track_id))
+        if cached is not None:
+            return cached
+
         query = (
             select(Track)
             .options(
@@ -140,14 +432,40 @@ class TrackRepository(BaseRepository):
         if not track_scalar:
             return None
 
-        return STrack.model_validate(track_scalar, from_attributes=True)
+        track = STrack.model_validate(track_scalar, from_attributes=True)
+        await _cache_records(tracks_cache, {(GRAPH, track_id): track})
+
+        return track
+
+    async def get_many(self, track_ids: list[str]) -> dict[str, STrack]:
+        """
+        Loads many tracks with features and artists in one query. Playlist versions are not loaded
+        :param track_ids: Spotify ids of tracks
+        :return: Dict of track id and track, missing tracks are not included
+        """
+        async def load(missing_ids: set[str]) -> dict[str, STrack]:
+            query = (
+                select(Track)
+                .options(
+                    joinedload(Track.track_features),
+                    joinedload(Track.artists),
+                    noload(Track.playlist_versions))
+                .where(Track.track_id.in_(missing_ids))
+            )
+            track_models = await self.session.scalars(query)
+
+            return {track.track_id: STrack.model_validate(track, from_attributes=True)
+                    for track in track_models.unique()}
+
+        return await _read_through(tracks_cache, tracks_shared_cache, track_ids, load)
 
     async def create(self, input_track: STrackBase) -> STrackBase:
         track_model = Track(**input_track.model_dump())
+        await _invalidate_records(tracks_cache, [input_track.track_id], tracks_shared_cache)
 
         self.session.add(track_model)
         await self.session.flush()
-        await self.session.commit()
+        await self.commit()
 
         return STrackBase.model_validate(track_model, from_attributes=True)
 
@@ -157,24 +475,59 @@ class TrackRepository(BaseRepository):
         :param input_track: schema of track to update
         :return: updated track schema (without relationships)
         """
-        track_model = await self.get(input_track.track_id)
+        # Loading the row itself, schema returned by ``get`` may be shared by the cache
+        track_model = await self.session.get(Track, input_track.track_id)
+        await _invalidate_records(tracks_cache, [input_track.track_id], tracks_shared_cache)
 
         for key, value in input_track.model_dump().items():
             setattr(track_model, key, value)
 
         await self.session.flush()
-        await self.session.commit()
+        await self.commit()
         return STrack.model_validate(track_model, from_attributes=True)
 
+    async def upsert_many(self, input_tracks: list[STrackBase]) -> list[STrackBase]:
+        """
+        Inserts new tracks and refreshes existing ones (including expiry date) in one statement.
+        Relationships are not touched
+        :param input_tracks: schemas of tracks
+        :return: written schemas
+        """
+        expires_at = Track.next_expires_at()
+        # Rows are deduplicated and sorted by id, so concurrent transactions lock them in the same order
+        rows = {track.track_id: {**track.model_dump(), 'expires_at': expires_at} for track in input_tracks}
+
+        if not rows:
+            return []
+
+        await _invalidate_records(tracks_cache, rows, tracks_shared_cache)
+
+        statement = insert(Track).values([rows[key] for key in sorted(rows)])
+        statement = statement.on_conflict_do_update(
+            index_elements=[Track.track_id],
+            set_={
+                **{key: statement.excluded[key] for key in STrackBase.model_fields if key != 'track_id'},
+                'expires_at': statement.excluded.expires_at,
+                'updated_at': _updated_at(Track, statement.excluded, ['popularity', 'release_date']),
+            }
+        )
+
+        await self.session.execute(statement)
+        await self.commit()
+
+        return list(input_tracks)
+
     async def set_features(self, track_id: str, features: STrackFeaturesBase) -> STrackBase | None:
         track_model = await self.session.get(Track, track_id)
 
         if not track_model:
             return None
 
+        await _invalidate_records(tracks_cache, [track_id], tracks_shared_cache)
+        await _invalidate_records(track_features_cache, [track_id], track_features_shared_cache)
         track_model.track_features = TrackFeatures(**features.model_dump())
         await self.session.flush()
-        await self.session.commit()
+        await self.commit()
         return STrackBase.model_validate(track_model, from_attributes=True)
 
     async def link_artist(self, input_artist: SArtistBase, track_id: str) -> None | STrackBase:
@@ -196,12 +549,190 @@ class TrackRepository(BaseRepository):
         if not track_model or not artist_model:
             return None
 
+        await _invalidate_records(tracks_cache, [track_id], tracks_shared_cache)
+        await _invalidate_records(artists_cache, [input_artist.artist_id], artists_shared_cache)
         track_model.artists.append(artist_model)
         await self.session.flush()
-        await self.session.commit()
+        await self.commit()
 
         return STrackBase.model_validate(track_model, from_attributes=True)
 
+    async def link_artists(self, links: list[tuple[str, str]]) -> int:
+        """
+        Linking existing artists to existing tracks in one insert, already linked pairs are skipped.
+        Relationship collections are not loaded
+        :param links: Pairs of track id and artist id
+        :return: Number of inserted links
+        """
+        links = list(dict.fromkeys(links))
+
+        if not links:
+            return 0
+
+        existing_query = (
+            select(artist_track_association.c.track_id, artist_track_association.c.artist_id)
+            .where(artist_track_association.c.track_id.in_({track_id for track_id, _ in links}))
+        )
+        existing = {tuple(row) for row in await self.session.execute(existing_query)}
+
+        rows = [{'track_id': track_id, 'artist_id': artist_id}
+                for track_id, artist_id in sorted(links) if (track_id, artist_id) not in existing]
+
+        await _invalidate_records(tracks_cache, {row['track_id'] for row in rows}, tracks_shared_cache)
+        await _invalidate_records(artists_cache, {row['artist_id'] for row in rows}, artists_shared_cache)
+
+        # Links inserted by concurrent analyses after the check above are skipped by primary key
+        await bulk_insert(self.session, artist_track_association, rows, analysis_settings.copy_threshold,
+                          ignore_conflicts=True)
+        await self.commit()
+
+        return len(rows)
+
+    async def scoring_records(self, version_id: UUID | None = None,
+                              track_ids: Iterable[str] | None = None) -> ScoringRecords:
+        """
+        Loads only the columns used by scoring for all tracks of playlist version (or for given tracks),
+        with two column-only queries.
+        Nothing is validated into schemas, so cost doesn't depend on how many playlists contain the tracks
+        :param version_id: UUID of playlist version
+        :param track_ids: Spotify ids of tracks, used instead of version
+        :return: Array-backed records of tracks and their artists
+        """
+        track_query = (
+            select(Track.track_id, Track.popularity, Track.release_date,
+                   *(getattr(TrackFeatures, feature) for feature in FEATURES))
+            .outerjoin(TrackFeatures, TrackFeatures.track_id == Track.track_id)
+        )
+        artist_query = (
+            select(artist_track_association.c.track_id, Artist.artist_id, Artist.popularity, Artist.genre_ids)
+            .join(Artist, Artist.artist_id == artist_track_association.c.artist_id)
+        )
+
+        if track_ids is not None:
+            track_ids = set(track_ids)
+            track_query = track_query.where(Track.track_id.in_(track_ids))
+            artist_query = artist_query.where(artist_track_association.c.track_id.in_(track_ids))
+        else:
+            track_query = (
+                track_query
+                .join(playlist_track_association, playlist_track_association.c.track_id == Track.track_id)
+                .where(playlist_track_association.c.playlist_version_id == version_id)
+            )
+            artist_query = (
+                artist_query
+                .join(playlist_track_association,
+                      playlist_track_association.c.track_id == artist_track_association.c.track_id)
+                .where(playlist_track_association.c.playlist_version_id == version_id)
+            )
+
+        track_rows = await self.session.execute(track_query)
+        artist_rows = await self.session.execute(artist_query)
+
+        return ScoringRecords.from_rows(track_rows, artist_rows)
+
+    async def playlist_counts(self, version_id: UUID) -> dict[str, int]:
+        """
+        Number of playlists containing every track of playlist version, read from maintained counters
+        :param version_id: UUID of playlist version
+        :return: Dict of track id and number of playlists
+        """
+        query = (
+            select(playlist_track_association.c.track_id, func.coalesce(TrackPlaylistCount.playlists, 1))
+            .outerjoin(TrackPlaylistCount, TrackPlaylistCount.track_id == playlist_track_association.c.track_id)
+            .where(playlist_track_association.c.playlist_version_id == version_id)
+        )
+        rows = await self.session.execute(query)
+
+        return dict(rows.tuples())
+
+    async def expired_ids(self, track_ids: list[str]) -> tuple[set[str], set[str]]:
+        """
+        Finds expired tracks and expired artists of these tracks with one query
+        :param track_ids: Spotify ids of tracks
+        :return: Ids of expired tracks and ids of expired artists
+        """
+        if not track_ids:
+            return set(), set()
+
+        track_ids = set(track_ids)
+        now = datetime.utcnow()
+
+        expired_tracks = (
+            select(literal('track'), Track.track_id)
+            .where(Track.track_id.in_(track_ids), Track.expires_at < now)
+        )
+        expired_artists = (
+            select(literal('artist'), Artist.artist_id)
+            .join(artist_track_association, artist_track_association.c.artist_id == Artist.artist_id)
+            .where(artist_track_association.c.track_id.in_(track_ids), Artist.expires_at < now)
+        )
+
+        result = await self.session.execute(union_all(expired_tracks, expired_artists))
+        expired = {'track': set(), 'artist': set()}
+
+        for kind, entity_id in result:
+            expired[kind].add(entity_id)
+
+        return expired['track'], expired['artist']
+
+    async def refreshed_since(self, track_ids: Iterable[str], since: datetime) -> bool:
+        """
+        Checks if values scoring uses of any of tracks or their artists changed after given time, with one query.
+        Upserts bump ``updated_at`` only when these values change (see ``_updated_at``)
+        :param track_ids: Spotify ids of tracks
+        :param since: UTC time
+        """
+        track_ids = set(track_ids)
+        if not track_ids:
+            return False
+
+        refreshed_tracks = (
+            select(Track.track_id)
+            .where(Track.track_id.in_(track_ids), Track.updated_at > since)
+        )
+        refreshed_artists = (
+            select(artist_track_association.c.track_id)
+            .join(Artist, Artist.artist_id == artist_track_association.c.artist_id)
+            .where(artist_track_association.c.track_id.in_(track_ids), Artist.updated_at > since)
+        )
+
+        result = await self.session.execute(union_all(refreshed_tracks, refreshed_artists).limit(1))
+        return result.first() is not None
+
+    async def most_referenced_expired(self, limit: int) -> list[str]:
+        """
+        Expired tracks, ordered by number of playlist versions that contain them
+        :param limit: Max number of ids
+        :return: Spotify ids of tracks
+        """
+        query = (
+            select(Track.track_id)
+            .outerjoin(playlist_track_association, playlist_track_association.c.track_id == Track.track_id)
+            .where(Track.expires_at < datetime.utcnow())
+            .group_by(Track.track_id)
+            .order_by(func.count(playlist_track_association.c.playlist_version_id).desc())
+            .limit(limit)
+        )
+
+        return list(await self.session.scalars(query))
+
+    async def postpone_expiry(self, track_ids: list[str]) -> None:
+        """
+        Sets expiry date of tracks as if they were refreshed now, values (and ``updated_at``) are kept.
+        Used for tracks spotify can't resolve, so they are not picked by ``most_referenced_expired`` again
+        :param track_ids: Spotify ids of tracks
+        """
+        if not track_ids:
+            return
+
+        await _invalidate_records(tracks_cache, track_ids, tracks_shared_cache)
+        await self.session.execute(
+            update(Track)
+            .where(Track.track_id.in_(track_ids))
+            .values(expires_at=Track.next_expires_at(), updated_at=Track.updated_at)
+        )
+        await self.commit()
+
     async def is_expired(self, track_id: str) -> bool | None:
         """
         Compares track expires_at date with current date
@@ -239,7 +770,7 @@ class PlaylistRepository(BaseRepository):
 
         self.session.add(playlist_model)
         await self.session.flush()
-        await self.session.commit()
+        await self.commit()
 
         return SPlaylist.model_validate(playlist_model, from_attributes=True)
 
@@ -258,7 +789,7 @@ class PlaylistRepository(BaseRepository):
             setattr(playlist_model, key, value)
 
         await self.session.flush()
-        await self.session.commit()
+        await self.commit()
         return SPlaylistBase.model_validate(playlist_model, from_attributes=True)
 
     async def add_version(self, playlist_id: str, version_input: SPlaylistVersion) -> SPlaylistVersion | None:
@@ -271,7 +802,7 @@ class PlaylistRepository(BaseRepository):
 
         playlist_model.versions.append(version_model)
         await self.session.flush()
-        await self.session.commit()
+        await self.commit()
         return SPlaylistVersion.model_validate(version_model, from_attributes=True)
 
 
@@ -302,35 +833,268 @@ class PlaylistVersionRepository(BaseRepository):
 
         self.session.add(playlist_version_model)
         await self.session.flush()
-        await self.session.commit()
+        await self.commit()
 
         return SPlaylistVersionBase.model_validate(playlist_version_model, from_attributes=True)
 
-    async def link_track(self, input_track: STrack | STrackBase, version_id: UUID) -> None | SPlaylistVersionBase:
+    async def track_ids(self, version_id: UUID) -> list[str]:
         """
-        Linking existing artist to track
-        :param input_track: Schema of track
+        Spotify ids of tracks linked to playlist version, relationships are not loaded
         :param version_id: UUID of playlist version
-        :return: None if not found or added track schema
         """
-        playlist_version_query = (
-            select(PlaylistVersion)
+        query = (
+            select(playlist_track_association.c.track_id)
+            .where(playlist_track_association.c.playlist_version_id == version_id)
+        )
+        return list(await self.session.scalars(query))
+
+    async def previous_stats(self, version_id: UUID) -> tuple[UUID, dict] | None:
+        """
+        Statistics of the latest scored version of the same playlist
+        :param version_id: UUID of playlist version
+        :return: UUID of previous version and its statistics, or None if no other version is scored
+        """
+        playlist_id = (
+            select(PlaylistVersion.playlist_id)
             .where(PlaylistVersion.version_id == version_id)
-            .options(selectinload(PlaylistVersion.tracks))
+            .scalar_subquery()
+        )
+        query = (
+            select(PlaylistVersionStats.version_id, PlaylistVersionStats.stats)
+            .join(PlaylistVersion, PlaylistVersion.version_id == PlaylistVersionStats.version_id)
+            .where(PlaylistVersion.playlist_id == playlist_id, PlaylistVersion.version_id != version_id)
+            .order_by(PlaylistVersion.created_at.desc())
+            .limit(1)
         )
+        row = (await self.session.execute(query)).first()
 
-        playlist_version_model = await self.session.execute(playlist_version_query)
-        playlist_version_model = playlist_version_model.scalar_one_or_none()
-        track_model = await self.session.get(Track, input_track.track_id)
+        return tuple(row) if row else None
 
-        if not playlist_version_model or not track_model:
-            return None
+    async def save_stats(self, version_id: UUID, stats: dict) -> None:
+        """
+        Writes statistics of scored playlist version, replacing existing ones
+        :param version_id: UUID of playlist version
+        :param stats: Json-compatible statistics
+        """
+        statement = insert(PlaylistVersionStats).values(version_id=version_id, stats=stats)
+        statement = statement.on_conflict_do_update(
+            index_elements=[PlaylistVersionStats.version_id],
+            set_={'stats': statement.excluded.stats}
+        )
 
-        playlist_version_model.tracks.append(track_model)
-        await self.session.flush()
-        await self.session.commit()
+        await self.session.execute(statement)
+        await self.commit()
 
-        return SPlaylistVersionBase.model_validate(playlist_version_model, from_attributes=True)
+    async def save_signature(self, version_id: UUID, signature: np.ndarray) -> None:
+        """
+        Writes MinHash signature of playlist version and its bands (LSH index), replacing existing ones
+        :param version_id: UUID of playlist version
+        :param signature: Signature (see ``minhash.signature``)
+        """
+        statement = insert(PlaylistVersionSignature).values(version_id=version_id,
+                                                            signature=minhash.to_bytes(signature))
+        statement = statement.on_conflict_do_update(
+            index_elements=[PlaylistVersionSignature.version_id],
+            set_={'signature': statement.excluded.signature}
+        )
+        await self.session.execute(statement)
+
+        await self.session.execute(delete(PlaylistVersionBand).where(PlaylistVersionBand.version_id == version_id))
+        await self.session.execute(insert(PlaylistVersionBand), [
+            {'band': band, 'band_hash': band_hash, 'version_id': version_id}
+            for band, band_hash in enumerate(minhash.band_hashes(signature))
+        ])
+
+        await self.commit()
+
+    async def latest_signature(self, spotify_playlist_id: str) -> tuple[UUID, np.ndarray] | None:
+        """
+        Signature of the latest analyzed version of playlist
+        :param spotify_playlist_id: Spotify id of playlist
+        :return: UUID of playlist and signature, or None if no version of playlist is analyzed
+        """
+        query = (
+            select(PlaylistVersion.playlist_id, PlaylistVersionSignature.signature)
+            .join(PlaylistVersion, PlaylistVersion.version_id == PlaylistVersionSignature.version_id)
+            .join(Playlist, Playlist.playlist_id == PlaylistVersion.playlist_id)
+            .where(Playlist.spotify_playlist_id == spotify_playlist_id)
+            .order_by(PlaylistVersion.created_at.desc())
+            .limit(1)
+        )
+        row = (await self.session.execute(query)).first()
+
+        return (row.playlist_id, minhash.from_bytes(row.signature)) if row else None
+
+    async def similar_candidates(self, playlist_id: UUID, signature: np.ndarray,
+                                 limit: int) -> list[tuple[str, str, np.ndarray]]:
+        """
+        Analyzed versions of other playlists sharing at least one band with signature, looked up by band index,
+        versions sharing more bands first
+        :param playlist_id: UUID of playlist, its versions are skipped
+        :param signature: Signature (see ``minhash.signature``)
+        :param limit: Max number of candidates
+        :return: Spotify id of playlist, name and signature of every candidate version
+        """
+        bands = list(enumerate(minhash.band_hashes(signature)))
+        matches = (
+            select(PlaylistVersionBand.version_id, func.count().label('bands'))
+            .where(tuple_(PlaylistVersionBand.band, PlaylistVersionBand.band_hash).in_(bands))
+            .group_by(PlaylistVersionBand.version_id)
+            .subquery()
+        )
+        query = (
+            select(Playlist.spotify_playlist_id, PlaylistVersion.name, PlaylistVersionSignature.signature)
+            .select_from(matches)
+            .join(PlaylistVersion, PlaylistVersion.version_id == matches.c.version_id)
+            .join(Playlist, Playlist.playlist_id == PlaylistVersion.playlist_id)
+            .join(PlaylistVersionSignature, PlaylistVersionSignature.version_id == matches.c.version_id)
+            .where(PlaylistVersion.playlist_id != playlist_id)
+            .order_by(matches.c.bands.desc())
+            .limit(limit)
+        )
+        rows = await self.session.execute(query)
+
+        return [(spotify_id, name, minhash.from_bytes(data)) for spotify_id, name, data in rows.tuples()]
+
+    async def save_feature_vector(self, version_id: UUID, vector: np.ndarray) -> None:
+        """
+        Writes feature vector of playlist version, replacing existing one
+        :param version_id: UUID of playlist version
+        :param vector: Vector (see ``PlaylistStats.feature_vector``)
+        """
+        statement = insert(PlaylistVersionFeatures).values(version_id=version_id, vector=vectors.to_bytes(vector))
+        statement = statement.on_conflict_do_update(
+            index_elements=[PlaylistVersionFeatures.version_id],
+            set_={'vector': statement.excluded.vector}
+        )
+
+        await self.session.execute(statement)
+        await self.commit()
+
+    async def feature_vectors(self, since: datetime | None = None) -> list[tuple[UUID, UUID, np.ndarray, datetime]]:
+        """
+        Feature vectors of analyzed playlist versions, for ``FeatureIndex``
+        :param since: Only vectors created since this time are loaded, all if None
+        :return: Version id, playlist id, vector and creation time of every vector
+        """
+        query = (
+            select(PlaylistVersionFeatures.version_id, PlaylistVersion.playlist_id, PlaylistVersionFeatures.vector,
+                   PlaylistVersionFeatures.created_at)
+            .join(PlaylistVersion, PlaylistVersion.version_id == PlaylistVersionFeatures.version_id)
+        )
+        if since is not None:
+            query = query.where(PlaylistVersionFeatures.created_at >= since)
+
+        rows = await self.session.execute(query)
+
+        return [(version_id, playlist_id, vectors.from_bytes(data), created_at)
+                for version_id, playlist_id, data, created_at in rows.tuples()]
+
+    async def latest_feature_vector(self, spotify_playlist_id: str) -> tuple[UUID, np.ndarray] | None:
+        """
+        Feature vector of the latest analyzed version of playlist
+        :param spotify_playlist_id: Spotify id of playlist
+        :return: UUID of playlist and vector, or None if no version of playlist is analyzed
+        """
+        query = (
+            select(PlaylistVersion.playlist_id, PlaylistVersionFeatures.vector)
+            .join(PlaylistVersion, PlaylistVersion.version_id == PlaylistVersionFeatures.version_id)
+            .join(Playlist, Playlist.playlist_id == PlaylistVersion.playlist_id)
+            .where(Playlist.spotify_playlist_id == spotify_playlist_id)
+            .order_by(PlaylistVersion.created_at.desc())
+            .limit(1)
+        )
+        row = (await self.session.execute(query)).first()
+
+        return (row.playlist_id, vectors.from_bytes(row.vector)) if row else None
+
+    async def names(self, version_ids: list[UUID]) -> dict[UUID, tuple[str, str]]:
+        """
+        :param version_ids: UUIDs of playlist versions
+        :return: Dict of version id and spotify id of playlist and name of version
+        """
+        query = (
+            select(PlaylistVersion.version_id, Playlist.spotify_playlist_id, PlaylistVersion.name)
+            .join(Playlist, Playlist.playlist_id == PlaylistVersion.playlist_id)
+            .where(PlaylistVersion.version_id.in_(version_ids))
+        )
+        rows = await self.session.execute(query)
+
+        return {version_id: (spotify_id, name) for version_id, spotify_id, name in rows.tuples()}
+
+    async def link_tracks(self, version_id: UUID, track_ids: list[str]) -> int:
+        """
+        Linking existing tracks to playlist version in one insert, already linked tracks are skipped.
+        Relationship collections are not loaded
+        :param version_id: UUID of playlist version
+        :param track_ids: Spotify ids of tracks
+        :return: Number of inserted links
+        """
+        track_ids = list(dict.fromkeys(track_ids))
+
+        if not track_ids:
+            return 0
+
+        existing_query = (
+            select(playlist_track_association.c.track_id)
+            .where(playlist_track_association.c.playlist_version_id == version_id,
+                   playlist_track_association.c.track_id.in_(track_ids))
+        )
+        existing = set(await self.session.scalars(existing_query))
+
+        rows = [{'playlist_version_id': version_id, 'track_id': track_id}
+                for track_id in sorted(track_ids) if track_id not in existing]
+
+        # Cached tracks with relationships include playlist versions
+        await _invalidate_records(tracks_cache, [row['track_id'] for row in rows])
+
+        # Links inserted by concurrent analyses after the check above are skipped by primary key
+        await bulk_insert(self.session, playlist_track_association, rows, analysis_settings.copy_threshold,
+                          ignore_conflicts=True)
+        await self.__count_playlists(version_id, [row['track_id'] for row in rows])
+        await self.commit()
+
+        return len(rows)
+
+    async def __count_playlists(self, version_id: UUID, track_ids: list[str]) -> None:
+        """
+        Increments playlist counters of tracks newly linked to version,
+        unless another version of the same playlist already contains them. Doesn't commit
+        :param version_id: UUID of playlist version
+        :param track_ids: Spotify ids of newly linked tracks
+        """
+        if not track_ids:
+            return
+
+        playlist_id = (
+            select(PlaylistVersion.playlist_id)
+            .where(PlaylistVersion.version_id == version_id)
+            .scalar_subquery()
+        )
+        other_versions = (
+            select(PlaylistVersion.version_id)
+            .where(PlaylistVersion.playlist_id == playlist_id, PlaylistVersion.version_id != version_id)
+        )
+        contained_query = (
+            select(playlist_track_association.c.track_id)
+            .distinct()
+            .where(playlist_track_association.c.playlist_version_id.in_(other_versions),
+                   playlist_track_association.c.track_id.in_(track_ids))
+        )
+        contained = set(await self.session.scalars(contained_query))
+        counted_ids = sorted(set(track_ids) - contained)
+
+        if not counted_ids:
+            return
+
+        # Sorted, so concurrent analyses lock counters in the same order
+        statement = insert(TrackPlaylistCount).values([{'track_id': track_id, 'playlists': 1}
+                                                       for track_id in counted_ids])
+        statement = statement.on_conflict_do_update(
+            index_elements=[TrackPlaylistCount.track_id],
+            set_={'playlists': TrackPlaylistCount.playlists + 1}
+        )
+        await self.session.execute(statement)
 
 
 @with_session_management
@@ -361,7 +1125,7 @@ class AnalysisRepository(BaseRepository):
         analysis_model = Analysis(**input_analysis.model_dump())
         self.session.add(analysis_model)
         await self.session.flush()
-        await self.session.commit()
+        await self.commit()
         return SAnalysisBase.model_validate(analysis_model, from_attributes=True)
 
     async def update(self, analysis_id: UUID, update_data: SAnalysisUpdate) -> SAnalysis | None:
@@ -372,16 +1136,59 @@ class AnalysisRepository(BaseRepository):
         if not analysis_model:
             return None
 
-        updatable_fields = {'status', 'uniqueness'}
+        updatable_fields = {'status', 'uniqueness', 'components'}
 
         for key, value in update_data.model_dump(exclude_unset=True).items():
             if key in updatable_fields:
                 setattr(analysis_model, key, value)
 
-        await self.session.commit()
+        await self.commit()
         return SAnalysis.model_validate(analysis_model, from_attributes=True)
 
+    async def uniqueness_histogram(self, bins: int) -> dict[int, int]:
+        """
+        Number of successful analyzes in every uniqueness bin (see ``PercentileIndex``), counted in db
+        :param bins: Number of bins uniqueness from 0 to 1 is split into
+        :return: Dict of bin and number of analyzes
+        """
+        bin_index = func.floor(Analysis.uniqueness * bins)
+        query = (
+            select(bin_index, func.count())
+            .where(Analysis.status == AnalysisStatus.SUCCESS, Analysis.uniqueness.isnot(None))
+            .group_by(bin_index)
+        )
+        rows = await self.session.execute(query)
+
+        histogram = {}
+        for value, count in rows.tuples():
+            # NaN uniqueness is not counted, values out of range are counted in the edge bins
+            if not math.isfinite(value):
+                continue
+            value = min(max(int(value), 0), bins - 1)
+            histogram[value] = histogram.get(value, 0) + count
+
+        return histogram
+
+    async def reweight(self, weights: list[float]) -> int:
+        """
+        Recomputes uniqueness of all analyzes with stored components in one ``UPDATE``
+        :param weights: Weights in ``COMPONENTS`` order
+        :return: Number of updated analyzes
+        """
+        # Postgres arrays are 1-based
+        weighted = sum(weight * Analysis.components[index + 1] for index, weight in enumerate(weights))
+        query = (
+            update(Analysis)
+            .where(Analysis.components.isnot(None))
+            .values(uniqueness=weighted / sum(weights))
+        )
+
+        result = await self.session.execute(query)
+        await self.commit()
+        return result.rowcount
+
 
+genres = GenreRepository()
 tracks = TrackRepository()
 track_features = TrackFeaturesRepository()
 artists = ArtistsRepository()
@@ -1,8 +1,17 @@
-from fastapi import APIRouter, Depends
+from typing import Literal
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Query
 
 from src.analysis.dependencies import get_analysis_task
+from src.analysis.enums import AnalysisStatus
 from src.analysis.exceptions import InvalidSpotifyId
-from src.analysis.schemas import AnalysisTaskInit, AnalysisTaskResult, SPlaylistCreate
+from src.analysis.metrics import collect_metrics
+from src.analysis.percentiles import percentile_index
+from src.analysis.repository import analyzes
+from src.analysis.scoring import COMPONENTS
+from src.analysis.schemas import AnalysisTaskInit, AnalysisTaskResult, SPlaylistCreate, SSimilarPlaylist, \
+    SSoundSimilarPlaylist
 from src.analysis.service import AnalysisService
 from src.analysis.tasks import analyse_playlist
 from src.analysis.utils import encode_uuid, decode_uuid
@@ -21,7 +30,8 @@ async def start_analysis(playlist: SPlaylistCreate):
     async with AnalysisService() as spotify:
         playlist_info, version_id = await spotify.playlist_info(playlist.spotify_playlist_id)
 
-    task = analyse_playlist.delay(playlist, version_id)
+    # Known tracks count lets the task request all playlist pages concurrently
+    task = analyse_playlist.delay(playlist, version_id, playlist_info.tracks_count)
     task_id = encode_uuid(task.task_id)  # base-64 task-id (only for better look of id on frontend)
 
     return AnalysisTaskInit(task_id=task_id, info=playlist_info)
@@ -42,4 +52,43 @@ async def get_analysis_result(task=Depends(get_analysis_task)):
     if task.status != 'SUCCESS':
         raise TaskNotCompleted(task_id=task.task_id)
 
-    return AnalysisTaskResult(task_id=base_64_task_id, result=task.result)
+    # Uniqueness in db is recomputed when weights change (see ``AnalysisService.reweight``), task result is not.
+    # Task that found an existing analysis of the version has no analysis row of its own, its result is used as is
+    analysis = await analyzes.get(task_id=UUID(task.task_id))
+    uniqueness, components = task.result, None
+
+    if analysis is not None and analysis.status == AnalysisStatus.SUCCESS:
+        uniqueness = analysis.uniqueness
+        components = dict(zip(COMPONENTS, analysis.components)) if analysis.components else None
+
+    # Missing histogram of percentiles is rebuilt from db
+    percentile = await percentile_index.percentile(uniqueness, analyzes.uniqueness_histogram)
+
+    return AnalysisTaskResult(task_id=base_64_task_id, result=uniqueness, components=components,
+                              percentile=percentile)
+
+
+@router.get('/similar', response_model=list[SSimilarPlaylist])
+async def get_similar_playlists(spotify_playlist_id: str, limit: int = Query(10, ge=1, le=50)):
+    if not validate_spotify_id(spotify_playlist_id):
+        raise InvalidSpotifyId(spotify_playlist_id)
+
+    async with AnalysisService() as service:
+        return await service.similar_playlists(spotify_playlist_id, limit)
+
+
+@router.get('/similar-sound', response_model=list[SSoundSimilarPlaylist])
+async def get_similar_sound_playlists(spotify_playlist_id: str, limit: int = Query(10, ge=1, le=50),
+                                      metric: Literal['l2', 'cosine'] = 'l2'):
+    if not validate_spotify_id(spotify_playlist_id):
+        raise InvalidSpotifyId(spotify_playlist_id)
+
+    async with AnalysisService() as service:
+        return await service.similar_sound_playlists(spotify_playlist_id, limit, metric)
+
+
+# Rate limiter counters are shared by all processes, cache and coalescing counters are of this API process only
+# (workers log theirs, see ``metrics_log_interval``)
+@router.get('/metrics', response_model=dict[str, dict[str, float]])
+async def get_metrics():
+    return await collect_metrics()
@@ -1,4 +1,4 @@
-from datetime import date
+from datetime import date, datetime
 from typing import Optional
 from uuid import UUID
 
@@ -35,14 +35,26 @@ class SAnalysisBase(BaseModel):
     status: AnalysisStatus
     task_id: UUID = None
     uniqueness: Optional[float] = None
+    # Uniqueness components in ``scoring.COMPONENTS`` order
+    components: Optional[list[float]] = None
 
 
 class SAnalysisUpdate(BaseModel):
     status: Optional[AnalysisStatus] = None
     uniqueness: Optional[float] = None
+    components: Optional[list[float]] = None
 
 
-class STrackBase(BaseModel):
+class SExpirable(BaseModel):
+    # Loaded from db only, never written by repositories
+    expires_at: Optional[datetime] = Field(default=None, exclude=True)
+
+    @property
+    def is_expired(self) -> bool:
+        return self.expires_at is not None and self.expires_at < datetime.utcnow()
+
+
+class STrackBase(SExpirable):
     track_id: str
     name: str
     release_date: date
@@ -67,7 +79,7 @@ class STrackFeaturesBase(BaseModel):
     time_signature: Optional[int] = None
 
 
-class SArtistBase(BaseModel):
+class SArtistBase(SExpirable):
     artist_id: str
     name: str
     followers: int
@@ -135,6 +147,24 @@ SPlaylist.update_forward_refs()
 # Analysis Task schemas
 class AnalysisTaskResult(TaskResult):
     result: Optional[float]
+    # Percentage of analyzed playlists that are less unique
+    percentile: Optional[float] = None
+    # Uniqueness components by name (``scoring.COMPONENTS``), unknown for analyzes scored before they were stored
+    components: Optional[dict[str, float]] = None
+
+
+class SSimilarPlaylist(BaseModel):
+    spotify_playlist_id: str
+    name: str
+    # Estimated share of common tracks (Jaccard similarity of track sets)
+    jaccard: float
+
+
+class SSoundSimilarPlaylist(BaseModel):
+    spotify_playlist_id: str
+    name: str
+    # Distance of feature vectors, the lower the more similar
+    distance: float
 
 
 class AnalysisTaskInit(TaskInit):
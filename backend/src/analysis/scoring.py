@@ -0,0 +1,223 @@
+from typing import Iterable
+
+import numpy as np
+
+# Columns of ``ScoringRecords.features``, in the order used by musical diversity
+FEATURES = ('tempo', 'key', 'loudness', 'duration_ms', 'mode', 'energy', 'valence', 'dance_ability')
+
+# Components of uniqueness score (P, A, M, G, T, E), keys of weights and order of stored ``Analysis.components``
+COMPONENTS = ('popularity', 'artist_diversity', 'musical_diversity', 'genre_diversity', 'temporal_diversity',
+              'era_diversity')
+
+
+class ScoringRecords:
+    """
+    Compact, array-backed data of playlist version tracks, only the columns used by scoring.
+
+    Tracks are rows of ``popularity``, ``years`` and ``features`` (tracks x FEATURES, NaN for missing values).
+    Every artist of every track is an edge: ``edge_track`` holds the track row of the edge,
+    ``edge_artists`` and ``edge_popularity`` hold artist data (artists are repeated per track).
+    Every genre of every edge is a genre occurrence: ``genre_edge`` holds the edge of occurrence,
+    ``genres`` holds the genre code (``genre`` table id).
+    Artists are integer codes too, indexes in ``artist_ids``.
+    """
+    __slots__ = ('track_ids', 'popularity', 'years', 'features',
+                 'edge_track', 'edge_artists', 'edge_popularity', 'artist_ids',
+                 'genre_edge', 'genres')
+
+    def __init__(self, track_ids: list[str], popularity: np.ndarray, years: np.ndarray, features: np.ndarray,
+                 edge_track: np.ndarray, edge_artists: np.ndarray, edge_popularity: np.ndarray,
+                 artist_ids: list[str], genre_edge: np.ndarray, genres: np.ndarray):
+        self.track_ids = track_ids
+        self.popularity = popularity
+        self.years = years
+        self.features = features
+        self.edge_track = edge_track
+        self.edge_artists = edge_artists
+        self.edge_popularity = edge_popularity
+        self.artist_ids = artist_ids
+        self.genre_edge = genre_edge
+        self.genres = genres
+
+    def __len__(self) -> int:
+        return len(self.popularity)
+
+    @classmethod
+    def from_rows(cls, track_rows: Iterable[tuple], artist_rows: Iterable[tuple]) -> 'ScoringRecords':
+        """
+        Builds records from db rows
+        :param track_rows: (track_id, popularity, release_date, *FEATURES) rows
+        :param artist_rows: (track_id, artist_id, popularity, genre_ids) rows
+        """
+        track_ids = []
+        popularity = []
+        years = []
+        features = []
+
+        for track_id, track_popularity, release_date, *track_features in track_rows:
+            track_ids.append(track_id)
+            popularity.append(track_popularity)
+            years.append(release_date.year)
+            features.append([np.nan if value is None else value for value in track_features])
+
+        track_index = {track_id: index for index, track_id in enumerate(track_ids)}
+        artist_codes = {}
+        edge_track = []
+        edge_artists = []
+        edge_popularity = []
+        genre_edge = []
+        genres = []
+
+        for edge, (track_id, artist_id, artist_popularity, genre_ids) in enumerate(artist_rows):
+            edge_track.append(track_index[track_id])
+            edge_artists.append(artist_codes.setdefault(artist_id, len(artist_codes)))
+            edge_popularity.append(artist_popularity)
+
+            if genre_ids:
+                genre_edge.extend([edge] * len(genre_ids))
+                genres.extend(genre_ids)
+
+        return cls(
+            track_ids=track_ids,
+            popularity=np.array(popularity, dtype=np.int16),
+            years=np.array(years, dtype=np.int16),
+            features=np.array(features, dtype=np.float64).reshape(len(track_ids), len(FEATURES)),
+            edge_track=np.array(edge_track, dtype=np.int32),
+            edge_artists=np.array(edge_artists, dtype=np.int32),
+            edge_popularity=np.array(edge_popularity, dtype=np.int16),
+            artist_ids=list(artist_codes),
+            genre_edge=np.array(genre_edge, dtype=np.int32),
+            genres=np.array(genres, dtype=np.int32),
+        )
+
+
+def features_uniqueness(features: np.ndarray) -> np.ndarray:
+    """
+    Uniqueness of every column of the matrix based on Shannon index, Simpson index, and coefficient of variation,
+    all columns are computed together.
+    Column values are sorted once, value counts are lengths of runs of equal values.
+    Missing (NaN) values are skipped, every column is scored over its present values only,
+    columns without present values are 0.
+
+    :param features: Matrix (values x columns)
+    :return: Uniqueness of every column (from 0 to 1)
+    """
+    values_count, columns_count = features.shape
+
+    if values_count == 0:
+        return np.zeros(columns_count)
+
+    # NaNs are sorted last, so present values of every column are its first ``present_counts`` rows
+    sorted_features = np.sort(features, axis=0)
+    present = ~np.isnan(sorted_features)
+    present_counts = present.sum(axis=0)
+
+    # True where a new value starts
+    starts = present.copy()
+    starts[1:] &= sorted_features[1:] != sorted_features[:-1]
+
+    # Values of different columns get different run ids, so all counts come from one bincount
+    unique_counts = starts.sum(axis=0)
+    run_offsets = np.concatenate(([0], np.cumsum(unique_counts)[:-1]))
+    run_ids = np.cumsum(starts, axis=0) - 1 + run_offsets
+    counts = np.bincount(run_ids.T[present.T], minlength=unique_counts.sum())
+    run_columns = np.repeat(np.arange(columns_count), unique_counts)
+
+    # Shannon index (in bits), normalized from 0 to 1
+    probabilities = counts / present_counts[run_columns]
+    probabilities = probabilities / np.bincount(run_columns, weights=probabilities, minlength=columns_count)[run_columns]
+    shannon_index = np.bincount(run_columns, weights=-probabilities * np.log(probabilities),
+                                minlength=columns_count) / np.log(2)
+    # Columns without present values have no runs, their index is 0
+    max_shannon_index = np.log2(np.maximum(unique_counts, 1))
+    normalized_shannon_index = np.divide(shannon_index, max_shannon_index, out=np.zeros(columns_count),
+                                         where=max_shannon_index > 0)
+
+    # Simpson index, the higher the value (1 - D), the higher the diversity
+    normalized_simpson_index = 1 - np.bincount(run_columns, weights=probabilities ** 2, minlength=columns_count)
+
+    # Coefficient of variation, CV > 1 is treated as 1 (very high variability)
+    present_features = np.where(present, sorted_features, 0)
+    mean = np.divide(present_features.sum(axis=0), present_counts, out=np.zeros(columns_count),
+                     where=present_counts > 0)
+    deviations = np.where(present, sorted_features - mean, 0)
+    std = np.sqrt(np.divide((deviations ** 2).sum(axis=0), present_counts, out=np.zeros(columns_count),
+                            where=present_counts > 0))
+    coefficient_of_variation = np.divide(std, mean, out=np.zeros(columns_count), where=mean != 0)
+    normalized_cv = np.minimum(coefficient_of_variation, 1)
+
+    uniqueness = (normalized_shannon_index + normalized_simpson_index + normalized_cv) / 3
+    return np.where(present_counts > 0, uniqueness, 0)
+
+
+def rarity(playlist_counts: np.ndarray) -> float:
+    """
+    Era diversity (E): average of 1 / number of playlists containing the track.
+    Track is always contained at least by the scored playlist
+    :param playlist_counts: Number of playlists containing every track
+    """
+    return np.sum(1 / np.maximum(playlist_counts, 1)) / len(playlist_counts)
+
+
+def component_weights(weights: dict[str, float]) -> list[float]:
+    """
+    Validates weights of uniqueness components
+    :param weights: Dictionary of weights keyed by component
+    :return: Weights in ``COMPONENTS`` order
+    """
+    weights_list = [weights.get(name) for name in COMPONENTS]
+
+    if any(weight is None for weight in weights_list):
+        raise ValueError('Not all weights are set.')
+
+    if sum(weights_list) != 1:
+        raise ValueError('Sum of weights must be equal to 1')
+
+    return weights_list
+
+
+def uniqueness_components(records: ScoringRecords, current_year: int,
+                          playlist_counts: np.ndarray) -> dict[str, float]:
+    """
+    Components of uniqueness score (see ``AnalysisService.__calculate_uniqueness``), keyed like weights
+    :param records: Scoring records of playlist tracks and their artists
+    :param current_year: Year temporal diversity is measured to
+    :param playlist_counts: Number of playlists containing every track
+    """
+    tracks_count = len(records)
+
+    # Popularity (P)
+    popularity = 1 - ((np.mean(records.popularity) + np.mean(records.edge_popularity)) / 200)
+
+    # Artist Diversity (A)
+    unique_artists = np.count_nonzero(np.bincount(records.edge_artists))
+    artist_counts = np.bincount(records.edge_track, minlength=tracks_count)
+    artist_diversity = (unique_artists / tracks_count) * (1 - (np.max(artist_counts) / tracks_count))
+
+    # Musical Diversity (M)
+    musical_diversity = np.mean(features_uniqueness(records.features))
+
+    # Genre Diversity (G)
+    genre_counts = np.bincount(records.genres)
+    genre_counts = genre_counts[genre_counts > 0]
+    unique_genres = len(genre_counts)
+    shares = genre_counts / len(records.genres)
+    shannon_index = -np.sum(shares * np.log(shares))
+    genre_diversity = (unique_genres / tracks_count) * (1 - (shannon_index / np.log(unique_genres)))
+
+    # Temporal Diversity (T), adding 1 to avoid division by zero
+    min_year = int(records.years.min())
+    max_year = int(records.years.max())
+    temporal_diversity = 1 - (max_year - min_year) / (current_year - min_year + 1)
+
+    # Era Diversity (E)
+    era_diversity = rarity(playlist_counts)
+
+    return {
+        'popularity': popularity,
+        'artist_diversity': artist_diversity,
+        'musical_diversity': musical_diversity,
+        'genre_diversity': genre_diversity,
+        'temporal_diversity': temporal_diversity,
+        'era_diversity': era_diversity,
+    }
@@ -1,27 +1,39 @@
 import asyncio
-from datetime import datetime, timedelta, date
-from itertools import chain
+from collections import deque
+from datetime import datetime, date
+from typing import AsyncIterator
 from uuid import UUID
 
 import numpy as np
-from aiohttp import ClientSession
-from scipy.stats import entropy
+from redis.exceptions import RedisError
 
+from src.analysis import minhash
+from src.analysis.coalescing import normalize_url, request_coalescer, shared_request_coalescer
 from src.analysis.config import analysis_settings
 from src.analysis.enums import AnalysisStatus
+from src.analysis.exceptions import PlaylistNotAnalyzed
+from src.analysis.executor import scoring_executor
+from src.analysis.percentiles import percentile_index
+from src.analysis.ratelimit import rate_limiter, backoff_delay
 from src.analysis.repository import playlists, playlist_versions, tracks, artists, track_features, analyzes
+from src.analysis.scoring import component_weights, COMPONENTS
 from src.analysis.schemas import SPlaylistCreate, SArtist, STrackFeatures, STrack, SPlaylist, SPlaylistVersionBase, \
-    SPlaylistInfo, STrackBase, SArtistBase, STrackFeaturesBase, SAnalysisBase, SAnalysisUpdate, SPlaylistBase
+    SPlaylistInfo, STrackBase, SArtistBase, STrackFeaturesBase, SAnalysisBase, SAnalysisUpdate, SPlaylistBase, \
+    SSimilarPlaylist, SSoundSimilarPlaylist
+from src.analysis.statistics import BaseStats, PlaylistStats, PlaylistSketch, summary_components
+from src.analysis.tokens import token_store
+from src.analysis.vectors import feature_index
 from src.config import settings
 from src.exceptions import CustomHTTPException
+from src.http_client import http_client
+from src.redis_client import redis_client
+from src.repository import uow, after_commit
+from src.tasks import celery
 
 
 class AnalysisService:
-    # TODO: token cache not working in different python processes (celery), token needs to be stored in file
     # NOTE: singleton pattern doesn't work because of session conflict
     API_URL = 'https://api.spotify.com/v1'
-    _access_token = None
-    _access_token_creation = None
 
     def __init__(self, client_id: str = settings.SPOTIFY_CLIENT_ID,
                  client_secret: str = settings.SPOTIFY_CLIENT_SECRET):
@@ -30,13 +42,15 @@ class AnalysisService:
         self.initialized = True
 
     async def __aenter__(self):
-        self.session = ClientSession()
+        # Session is borrowed from process-wide client, so connections are reused between requests and tasks
+        self.session = await http_client.get_session()
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
-        await self.session.close()
+        self.session = None
 
-    async def analyze_playlist(self, playlist: SPlaylistCreate, version_id: UUID, task_id: UUID) -> float:
+    async def analyze_playlist(self, playlist: SPlaylistCreate, version_id: UUID, task_id: UUID,
+                               tracks_count: int | None = None) -> float:
         # TODO: bind analysis creation to celery class
         analysis_db = await analyzes.get(version_id=version_id)
 
@@ -52,24 +66,61 @@ class AnalysisService:
                 status=AnalysisStatus.STARTED)
         )
 
-        playlist_tracks = await self.__playlist_tracks(playlist.spotify_playlist_id, version_id)
-        playlist_artists = list(chain.from_iterable(track.artists for track in playlist_tracks))
-
-        uniqueness = self.__calculate_uniqueness(playlist_tracks, playlist_artists, analysis_settings.weights)
-
-        await analyzes.update(
-            analysis.id,
-            SAnalysisUpdate(
-                status=AnalysisStatus.SUCCESS,
-                uniqueness=uniqueness
+        # Tracks and links are committed page by page while spotify is requested,
+        # so no transaction (and no row lock) is held across requests and rate limit waits
+        stats = await self.__rescore_incrementally(playlist.spotify_playlist_id, version_id, total=tracks_count)
+
+        if stats is None:
+            # Statistics are updated as every page is written, no track is loaded again for scoring
+            stats = PlaylistSketch() if self.__use_sketch(tracks_count) else PlaylistStats()
+            await self.__playlist_tracks(playlist.spotify_playlist_id, version_id, stats, total=tracks_count)
+
+        playlist_counts = await tracks.playlist_counts(version_id)
+        uniqueness, components = await self.__calculate_uniqueness(
+            stats, analysis_settings.weights, np.array(list(playlist_counts.values())))
+
+        # NaN is not a score (and is not valid JSON), such analysis is failed instead of stored as a result
+        if not np.isfinite(uniqueness):
+            await analyzes.update(analysis.id, SAnalysisUpdate(status=AnalysisStatus.FAILED))
+            raise ValueError(f'Uniqueness of playlist version {version_id} is not finite: {components}')
+
+        # Results of the version are written atomically
+        async with uow():
+            # Stored for incremental rescoring of the next versions (sketches can't be rescored incrementally)
+            if isinstance(stats, PlaylistStats):
+                await playlist_versions.save_stats(version_id, stats.to_json())
+
+            # Counts are loaded for every linked track, so their keys are the track set of the version
+            await playlist_versions.save_signature(version_id, minhash.signature(playlist_counts))
+            await playlist_versions.save_feature_vector(version_id, stats.feature_vector())
+
+            await analyzes.update(
+                analysis.id,
+                SAnalysisUpdate(
+                    status=AnalysisStatus.SUCCESS,
+                    uniqueness=uniqueness,
+                    # Stored, so uniqueness can be recomputed with new weights (see ``reweight``)
+                    components=[float(components[name]) for name in COMPONENTS]
+                )
             )
-        )
+
+            # Counted only once the analysis is committed
+            await after_commit(lambda: percentile_index.add(uniqueness))
 
         return uniqueness
 
-    async def __set_access_token(self) -> None:
+    @staticmethod
+    def __use_sketch(tracks_count: int | None) -> bool:
         """
-        Sets the access token and its expiry time.
+        Approximate scoring is opt-in (``sketch_min_tracks``) and used only when playlist size is known up front
+        """
+        min_tracks = analysis_settings.sketch_min_tracks
+        return min_tracks is not None and tracks_count is not None and tracks_count >= min_tracks
+
+    async def __request_access_token(self) -> tuple[str, int]:
+        """
+        Requests a new access token from spotify.
+        :return: Access token and its lifetime in seconds
         """
         response = await self.session.post(
             'https://accounts.spotify.com/api/token',
@@ -86,43 +137,71 @@ class AnalysisService:
             raise Exception(f'Failed to get access token. Response status code: {response.status})')
 
         response_json = await response.json()
-        self._access_token = response_json['access_token']
-        self._access_token_creation = datetime.now()
+        return response_json['access_token'], response_json['expires_in']
 
     async def __make_auth_headers(self) -> dict:
         """
         Creates the authentication headers for the Spotify API.
-        If token is expired, it will refresh it.
+        Token is shared between processes, if it is about to expire, it will be refreshed.
         :return: Headers with authentication
         """
-        if not self._access_token or (datetime.now() - self._access_token_creation > timedelta(hours=1)):
-            await self.__set_access_token()
+        access_token = await token_store.get(self.client_id, self.__request_access_token)
         return {
-            'Authorization': f"Bearer {self._access_token}"
+            'Authorization': f"Bearer {access_token}"
         }
 
     async def __get(self, sub_url: str):
         """
         Makes a GET request to the Spotify API.
+        Concurrent identical requests are coalesced into one, returned json is shared and must not be mutated.
         :param sub_url: Url that follows afters https://api.spotify.com/v1
         :return: response json
         """
         if not sub_url.startswith('/'):
             raise ValueError('sub_url must start with /')
 
-        headers = await self.__make_auth_headers()
-        response = await self.session.get(f'{self.API_URL}{sub_url}', headers=headers)
+        if not analysis_settings.coalesce_requests:
+            return await self.__request(sub_url)
+
+        key = normalize_url(sub_url)
+
+        async def fetch():
+            if analysis_settings.shared_response_ttl > 0:
+                return await shared_request_coalescer.get(key, lambda: self.__request(sub_url))
+            return await self.__request(sub_url)
+
+        return await request_coalescer.get(key, fetch)
+
+    async def __request(self, sub_url: str):
+        """
+        Makes a GET request to the Spotify API, waiting for rate limiter and retrying on 429.
+        :param sub_url: Url that follows afters https://api.spotify.com/v1
+        :return: response json
+        """
+        for attempt in range(analysis_settings.rate_limit_retries + 1):
+            await rate_limiter.acquire()
+
+            headers = await self.__make_auth_headers()
+            response = await self.session.get(f'{self.API_URL}{sub_url}', headers=headers)
+
+            if response.status == 429:
+                response.release()
+                retry_after = float(response.headers.get('Retry-After', analysis_settings.rate_limit_wait))
 
-        if response.status == 429:
-            await asyncio.sleep(analysis_settings.rate_limit_wait)
-            return await self.__get(sub_url)
-        elif response.status == 404:
-            raise CustomHTTPException('Spotify resource not found', status_code=404,
-                                      error_code='SPOTIFY_RESOURCE_NOT_FOUND')
-        elif response.status == 500:
-            raise CustomHTTPException('Internal spotify server error', status_code=500,
-                                      error_code='INTERNAL_SPOTIFY_ERROR')
-        return await response.json()
+                # Pausing every process, ``acquire`` waits for the pause on the next attempt
+                await rate_limiter.pause(retry_after)
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            elif response.status == 404:
+                raise CustomHTTPException('Spotify resource not found', status_code=404,
+                                          error_code='SPOTIFY_RESOURCE_NOT_FOUND')
+            elif response.status == 500:
+                raise CustomHTTPException('Internal spotify server error', status_code=500,
+                                          error_code='INTERNAL_SPOTIFY_ERROR')
+            return await response.json()
+
+        raise CustomHTTPException('Spotify rate limit exceeded', status_code=429,
+                                  error_code='SPOTIFY_RATE_LIMIT_EXCEEDED')
 
     @staticmethod
     def __group_items(items: list[str], group_size: int = 100) -> list[str]:
@@ -148,20 +227,32 @@ class AnalysisService:
 
         return datetime.strptime(track_date, '%Y-%m-%d').date()
 
+    @classmethod
+    def __track_schema(cls, track: dict) -> STrackBase:
+        return STrackBase(
+            name=track['name'],
+            track_id=track['id'],
+            popularity=track['popularity'],
+            explicit=track['explicit'],
+            release_date=cls.__get_track_date(track)
+        )
+
     @staticmethod
-    async def __update_artist(artist_id: str, artist: dict) -> bool | SArtistBase:
-        if await artists.is_expired(artist_id):
-            artist_db = await artists.update(SArtistBase(
-                artist_id=artist_id,
-                name=artist['name'],
-                genres=artist['genres'],
-                popularity=artist['popularity'],
-                followers=artist['followers']['total']
-            ))
-            return artist_db
-        return False
+    def __artist_schema(artist: dict) -> SArtistBase:
+        return SArtistBase(
+            artist_id=artist['id'],
+            name=artist['name'],
+            genres=artist['genres'],
+            popularity=artist['popularity'],
+            followers=artist['followers']['total']
+        )
 
-    async def __parse_artists(self, artists_ids: list[str]) -> dict[str, SArtistBase]:
+    async def __fetch_artists(self, artists_ids: list[str]) -> dict[str, SArtistBase]:
+        """
+        Loads artists info from spotify, nothing is written
+        :param artists_ids: Spotify ids of artists, may contain duplicates
+        :return: Dict of artist id and artist schema
+        """
         unique_artists = list(set(artists_ids))
         grouped_artists = self.__group_items(unique_artists, group_size=50)
         artists_dict = {}
@@ -169,43 +260,42 @@ class AnalysisService:
         for id_group in grouped_artists:
             response = await self.__get(f'/artists?ids={id_group}')
 
+            # Unknown artists are returned as null
             for artist in response['artists']:
-                artist_id = artist['id']
-                artist_db = await artists.get(artist_id)
-
-                if artist_db:
-                    updated_artist = await self.__update_artist(artist_id, artist)
-
-                    # If artist was updated, update ``artists_db``
-                    if updated_artist:
-                        artists_db = updated_artist
-                else:
-                    artist_db = await artists.create(SArtistBase(
-                        artist_id=artist_id,
-                        name=artist['name'],
-                        genres=artist['genres'],
-                        popularity=artist['popularity'],
-                        followers=artist['followers']['total']
-                    ))
-
-                artists_dict[artist_id] = artist_db
+                if artist:
+                    artists_dict[artist['id']] = self.__artist_schema(artist)
 
         return artists_dict
 
-    async def __parse_audio_analysis(self, tracks_ids_groups: list[str]) -> dict[str, STrackFeaturesBase]:
-        audio_analysis = {}
+    async def __parse_artists(self, artists_ids: list[str]) -> dict[str, SArtistBase]:
+        """
+        Loads artists info and writes all of them (new and refreshed) in one statement
+        :param artists_ids: Spotify ids of artists, may contain duplicates
+        :return: Dict of artist id and artist schema
+        """
+        artists_dict = await self.__fetch_artists(artists_ids)
+        await artists.upsert_many(list(artists_dict.values()))
 
-        for group in tracks_ids_groups:
+        return artists_dict
+
+    async def __parse_audio_analysis(self, tracks_ids: list[str]) -> dict[str, STrackFeaturesBase]:
+        """
+        Loads audio features of tracks, only features missing in db are requested from spotify
+        :param tracks_ids: Spotify ids of tracks
+        :return: Dict of track id and features
+        """
+        audio_analysis = await track_features.get_many(tracks_ids)
+        missing_ids = [track_id for track_id in dict.fromkeys(tracks_ids) if track_id not in audio_analysis]
+
+        for group in self.__group_items(missing_ids):
             response = await self.__get(f'/audio-features?ids={group}')
 
             for track_features_json in response['audio_features']:
-                track_id = track_features_json['id']
-                features_db = await track_features.get(track_id)
-
-                if features_db:
-                    audio_analysis[track_id] = features_db
+                # Spotify returns null for tracks without audio features
+                if not track_features_json:
                     continue
 
+                track_id = track_features_json['id']
                 audio_analysis[track_id] = STrackFeaturesBase(
                     track_id=track_id,
                     duration_ms=track_features_json['duration_ms'],
@@ -221,16 +311,19 @@ class AnalysisService:
 
         return audio_analysis
 
-    async def __parse_tracks(self, tracks_json: list[dict], version_id: UUID) -> list[STrack]:
+    async def __parse_tracks(self, tracks_json: list[dict], version_id: UUID) -> list[str]:
         """
-        Parse tracks json, loads additional data such as artist info, audio analysis and then convert to pydantic schema
+        Parse tracks json, loads additional data such as artist info, audio analysis and writes it to db.
+        Tracks already in db are used as is, even if expired (they are refreshed in background).
+        Everything is requested from spotify first, the page is then written in one short transaction,
+        so no row lock is held while waiting for spotify
         :param tracks_json: Raw tracks json (dict)
         :param version_id: Playlist version id
-        :return: List of tracks as pydantic model, modified artist list and audio analysis list
+        :return: Spotify ids of parsed tracks
         """
-        result: list[STrack] = []
         artists_ids = []
         tracks_ids = []
+        existing_tracks_ids = []
 
         # Spotify API issue fix: https://github.com/spotify/web-api/issues/958
         # And removing local tracks from playlist
@@ -241,31 +334,15 @@ class AnalysisService:
                 if 'local' not in track['uri']:
                     cleaned_tracks.append(track_json)
 
+        tracks_db = await tracks.get_many([track_data['track']['id'] for track_data in cleaned_tracks])
+
         for track_data in cleaned_tracks:
             track = track_data.get('track')
-            track_db = await tracks.get(track['id'])
+            track_db = tracks_db.get(track['id'])
 
             if track_db:
-                if await tracks.is_expired(track_db.track_id):
-                    # Almost any param can change after expiration
-                    await tracks.update(STrackBase(
-                        name=track['name'],
-                        track_id=track['id'],  # Added because of STrackBase requires it
-                        popularity=track['popularity'],
-                        explicit=track['explicit'],
-                        # Despite the fact that the release date should not change, we update it for security
-                        release_date=self.__get_track_date(track),
-                    ))
-
-                # Artists may expire
-                for artist_db in track_db.artists:
-                    await self.__update_artist(artist_db.artist_id, artist_db)
-
-                # Refreshing track_db because it may have changed
-                track_db = await tracks.get(track['id'])
-                result.append(track_db)
-
                 # Skip if track is already in db
+                existing_tracks_ids.append(track['id'])
                 continue
 
             tracks_ids.append(track['id'])
@@ -276,47 +353,249 @@ class AnalysisService:
         # Removing excising in db tracks from tracks_json
         cleaned_tracks = [track for track in cleaned_tracks if track['track']['id'] in tracks_ids]
 
-        artists_dict = await self.__parse_artists(artists_ids)
-        analysis = await self.__parse_audio_analysis(self.__group_items(tracks_ids))
+        artists_dict = await self.__fetch_artists(artists_ids)
+        analysis = await self.__parse_audio_analysis(tracks_ids)
 
-        for track_data in cleaned_tracks:
-            track = track_data.get('track')
-
-            track_db = await tracks.create(STrackBase(
-                name=track['name'],
-                track_id=track['id'],
-                popularity=track['popularity'],
-                explicit=track['explicit'],
-                release_date=self.__get_track_date(track)
-            ))
+        new_tracks = [self.__track_schema(track_data['track']) for track_data in cleaned_tracks]
 
-            await tracks.set_features(track_db.track_id, analysis[track_db.track_id])
-            await playlist_versions.link_track(track_db, version_id)
+        async with uow():
+            await artists.upsert_many(list(artists_dict.values()))
 
-            for artist_json in track['artists']:
-                await tracks.link_artist(artists_dict[artist_json['id']], track_db.track_id)
+            # New tracks of the page are written in one statement
+            await tracks.upsert_many(new_tracks)
+            await track_features.upsert_many([analysis[track.track_id] for track in new_tracks
+                                              if track.track_id in analysis])
 
-            # Refreshing track_db because it may have changed
-            track_db = await tracks.get(track['id'])
-            result.append(track_db)
+            # Every track of the page is linked to the version, including the ones already in db
+            await playlist_versions.link_tracks(version_id, existing_tracks_ids + tracks_ids)
+            await tracks.link_artists([
+                (track_data['track']['id'], artist_json['id'])
+                for track_data in cleaned_tracks
+                for artist_json in track_data['track']['artists']
+                if artist_json['id'] in artists_dict
+            ])
 
-        return result
+        return existing_tracks_ids + tracks_ids
 
-    async def __playlist_tracks(self, playlist_id: str, version_id: UUID, limit: int = 100, ) -> list[STrack]:
-        tracks_schemas = []
+    async def __playlist_pages(self, playlist_id: str, limit: int, total: int | None = None,
+                               fields: str | None = None) -> AsyncIterator[list[dict]]:
+        """
+        Yields pages of playlist items in playlist order.
+        If total number of tracks is known, every page offset is computed up front and pages are requested concurrently
+        while earlier pages are being processed: at most ``analysis_settings.pages_concurrency`` pages are requested
+        or waiting to be processed, so fetching doesn't run ahead of processing.
+        Otherwise, pages are fetched one after another following ``next`` links.
+        :param playlist_id: Spotify id of playlist
+        :param limit: Number of items per page (max 100)
+        :param total: Total number of tracks in playlist, if known
+        :param fields: Spotify ``fields`` filter of page, must keep ``next``
+        :return: Async iterator of raw playlist items (dict)
+        """
         current_url = f'/playlists/{playlist_id}/tracks?limit={limit}'
+        if fields:
+            current_url += f'&fields={fields}'
+
+        if total is not None and analysis_settings.pages_concurrency > 1:
+            # At least one page is requested, even for empty playlist
+            offsets = iter(range(0, max(total, 1), limit))
+            pages = deque()
+
+            def request_next_page() -> None:
+                offset = next(offsets, None)
+                if offset is not None:
+                    pages.append(asyncio.create_task(self.__get(f'{current_url}&offset={offset}')))
+
+            for _ in range(analysis_settings.pages_concurrency):
+                request_next_page()
+
+            try:
+                while pages:
+                    response = await pages.popleft()
+                    # Next page is requested only when a page is taken for processing
+                    request_next_page()
+                    yield response['items']
+            finally:
+                for page in pages:
+                    page.cancel()
+
+            # Playlist may have grown after ``total`` was read, the rest is fetched sequentially
+            current_url = response.get('next')
+            if current_url:
+                current_url = current_url.split(self.API_URL)[1]
 
         while current_url:
             response = await self.__get(current_url)
-
-            parsed_tracks = await self.__parse_tracks(response['items'], version_id)
-            tracks_schemas.extend(parsed_tracks)
+            yield response['items']
 
             current_url = response.get('next')
             if current_url:
                 current_url = current_url.split(self.API_URL)[1]
 
-        return tracks_schemas
+    async def __playlist_tracks(self, playlist_id: str, version_id: UUID, stats: BaseStats, limit: int = 100,
+                                total: int | None = None) -> list[str]:
+        """
+        Loads all playlist tracks and links them to playlist version, every page is committed on its own.
+        Every page is added to statistics as soon as it is written, so scoring is done when the last page is
+        :param stats: Statistics the tracks are added to
+        :return: Spotify ids of playlist tracks
+        """
+        # Ordered set, track repeated in playlist is linked (and scored) once
+        tracks_ids = {}
+        has_expired = False
+
+        async for items in self.__playlist_pages(playlist_id, limit, total):
+            parsed_tracks = await self.__parse_tracks(items, version_id)
+
+            new_tracks = [track_id for track_id in dict.fromkeys(parsed_tracks) if track_id not in tracks_ids]
+            if new_tracks:
+                stats.add(await tracks.scoring_records(track_ids=new_tracks))
+            tracks_ids.update(dict.fromkeys(new_tracks))
+
+            if not has_expired:
+                expired_tracks, expired_artists = await tracks.expired_ids(parsed_tracks)
+                has_expired = bool(expired_tracks or expired_artists)
+
+        # Analysis is scored with stale values, expired tracks and artists are refreshed in background
+        if has_expired:
+            await self.__request_refresh()
+
+        return list(tracks_ids)
+
+    async def __rescore_incrementally(self, playlist_id: str, version_id: UUID,
+                                      total: int | None = None) -> BaseStats | None:
+        """
+        Scores playlist version from statistics of the previous scored version of the playlist.
+        Only track ids of the new snapshot are requested, added tracks missing in db are fetched with ``/tracks``,
+        statistics are updated with added and removed tracks only. Statistics are not saved.
+        If the snapshot can't be rescored incrementally once its ids are requested (too many changes or removed
+        tracks were refreshed), it is scored from scratch from these ids, pages are not requested again
+        :param playlist_id: Spotify id of playlist
+        :param version_id: UUID of new playlist version
+        :param total: Total number of tracks in playlist, if known
+        :return: Statistics of new version, or None if it has to be scored from scratch
+        (no scored previous version or drift of removed tracks may be too large)
+        """
+        previous = await playlist_versions.previous_stats(version_id)
+        if previous is None:
+            return None
+
+        previous_version_id, previous_stats = previous
+        if previous_stats.get('version') not in PlaylistStats.SUPPORTED_VERSIONS:
+            return None
+
+        stats = PlaylistStats.from_json(previous_stats)
+        if stats.scored_at is None or stats.incremental >= analysis_settings.incremental_max_versions:
+            return None
+
+        tracks_ids = []
+        async for items in self.__playlist_pages(playlist_id, 100, total, fields='items(track(id,uri)),next'):
+            # Same filtering as in ``__parse_tracks``: null and local tracks are skipped
+            tracks_ids.extend(item['track']['id'] for item in items
+                              if item.get('track') and 'local' not in item['track']['uri'])
+        tracks_ids = list(dict.fromkeys(tracks_ids))
+        if not tracks_ids:
+            return None
+
+        previous_ids = set(await playlist_versions.track_ids(previous_version_id))
+        added_ids = [track_id for track_id in tracks_ids if track_id not in previous_ids]
+        removed_ids = previous_ids.difference(tracks_ids)
+
+        # Values of removed tracks may differ from the ones they were added with
+        changes = len(added_ids) + len(removed_ids)
+        if (changes > analysis_settings.incremental_max_changes * len(tracks_ids) or
+                await tracks.refreshed_since(removed_ids, stats.scored_at)):
+            stats = PlaylistSketch() if self.__use_sketch(len(tracks_ids)) else PlaylistStats()
+            tracks_ids = await self.__link_snapshot(version_id, tracks_ids, previous_ids)
+
+            for start in range(0, len(tracks_ids), 100):
+                stats.add(await tracks.scoring_records(track_ids=tracks_ids[start:start + 100]))
+        else:
+            tracks_ids = await self.__link_snapshot(version_id, tracks_ids, previous_ids)
+            # Added tracks spotify returned as null are not linked
+            added_ids = set(added_ids).intersection(tracks_ids)
+
+            stats.incremental += 1
+            if removed_ids:
+                stats.remove(await tracks.scoring_records(track_ids=removed_ids))
+            if added_ids:
+                stats.add(await tracks.scoring_records(track_ids=added_ids))
+
+        if stats.tracks == 0:
+            return None
+
+        expired_tracks, expired_artists = await tracks.expired_ids(tracks_ids)
+        if expired_tracks or expired_artists:
+            await self.__request_refresh()
+
+        return stats
+
+    async def __link_snapshot(self, version_id: UUID, tracks_ids: list[str], known_ids: set[str]) -> list[str]:
+        """
+        Links tracks of playlist snapshot to playlist version, tracks missing in db are fetched with ``/tracks``
+        (and linked by ``__parse_tracks``). Tracks spotify returns as null are not in db, so they are not linked
+        :param version_id: UUID of playlist version
+        :param tracks_ids: Spotify ids of snapshot tracks, without duplicates
+        :param known_ids: Spotify ids of tracks known to be in db (e.g. tracks of the previous version)
+        :return: Spotify ids of linked tracks, in snapshot order
+        """
+        unknown_ids = [track_id for track_id in tracks_ids if track_id not in known_ids]
+        existing_tracks = await tracks.get_many(unknown_ids)
+        missing_ids = [track_id for track_id in unknown_ids if track_id not in existing_tracks]
+        parsed_ids = set()
+
+        for id_group in self.__group_items(missing_ids, group_size=50):
+            response = await self.__get(f'/tracks?ids={id_group}')
+            parsed_ids.update(
+                await self.__parse_tracks([{'track': track} for track in response['tracks'] if track], version_id))
+
+        linked_ids = [track_id for track_id in tracks_ids
+                      if track_id in known_ids or track_id in existing_tracks or track_id in parsed_ids]
+        await playlist_versions.link_tracks(version_id, linked_ids)
+
+        return linked_ids
+
+    @staticmethod
+    async def __request_refresh() -> None:
+        """
+        Queues refresh of expired records, at most once per ``refresh_request_interval`` for all processes.
+        If redis is unavailable nothing is queued, records are refreshed on beat schedule
+        """
+        try:
+            acquired = await redis_client.set('analysis:refresh_expired:requested', 1, nx=True,
+                                              ex=analysis_settings.refresh_request_interval)
+        except RedisError:
+            return
+
+        if acquired:
+            celery.send_task('src.analysis.tasks.refresh_expired')
+
+    async def refresh_expired(self, limit: int = analysis_settings.refresh_limit) -> tuple[int, int]:
+        """
+        Refreshes expired artists and tracks in batches of 50 ids,
+        the ones referenced by the most playlist versions first.
+        Artists and tracks spotify returns as null are kept as they are until they expire again
+        :param limit: Max number of artists and tracks to refresh
+        :return: Number of refreshed artists and tracks
+        """
+        artists_ids = await artists.most_referenced_expired(limit)
+        artists_dict = await self.__parse_artists(artists_ids)
+        await artists.postpone_expiry([artist_id for artist_id in artists_ids if artist_id not in artists_dict])
+
+        tracks_ids = await tracks.most_referenced_expired(limit)
+        refreshed_tracks = []
+
+        for id_group in self.__group_items(tracks_ids, group_size=50):
+            response = await self.__get(f'/tracks?ids={id_group}')
+
+            # Tracks removed from spotify are returned as null
+            refreshed_tracks.extend(self.__track_schema(track) for track in response['tracks'] if track)
+
+        await tracks.upsert_many(refreshed_tracks)
+
+        refreshed_ids = {track.track_id for track in refreshed_tracks}
+        await tracks.postpone_expiry([track_id for track_id in tracks_ids if track_id not in refreshed_ids])
+
+        return len(artists_dict), len(refreshed_tracks)
 
     @staticmethod
     async def __create_playlist_version(playlist_info: dict, playlist: SPlaylist, image_url: str) -> \
@@ -392,52 +671,8 @@ class AnalysisService:
     async def __artist_info(self, artist_id: str):
         return await self.__get(f'/artists/{artist_id}')
 
-    @staticmethod
-    def __data_set_uniqueness(values: list[int | float]) -> float:
-        """
-        Calculating the uniqueness of data based on Shannon index, Simpson index, and coefficient of variation.
-
-        :param data (array-like): Input data (list, array or pandas series).
-
-        :return: Data uniqueness value (from 0 to 1).
-        """
-
-        if len(values) == 0:
-            return 0.0
-
-        data_array = np.array(values)
-
-        # Calculate Shannon index
-        unique, counts = np.unique(data_array, return_counts=True)
-        probabilities = counts / len(data_array)
-        shannon_index = entropy(probabilities, base=2)
-
-        # Normalize Shannon index (from 0 to 1)
-        max_shannon_index = np.log2(len(unique))
-        normalized_shannon_index = shannon_index / max_shannon_index if max_shannon_index > 0 else 0
-
-        # Calculate Simpson index
-        simpson_index = np.sum(probabilities ** 2)
-
-        # Normalize Simpson index (from 0 to 1), the higher the value (1 - D), the higher the diversity
-        normalized_simpson_index = 1 - simpson_index
-
-        # Calculate coefficient of variation
-        mean_value = np.mean(data_array)
-        std_dev = np.std(data_array)
-        coefficient_of_variation = std_dev / mean_value if mean_value != 0 else 0
-
-        # Normalize coefficient of variation (from 0 to 1)
-        # For this example, we assume CV > 1 as 1 (very high variability)
-        normalized_cv = min(coefficient_of_variation, 1)
-
-        # Combine the three indicators to obtain uniqueness
-        uniqueness_score = (normalized_shannon_index + normalized_simpson_index + normalized_cv) / 3
-
-        return uniqueness_score
-
-    def __calculate_uniqueness(self, playlist_tracks: list[STrack], playlist_artists: list[SArtist],
-                               weights: dict[str, int]) -> float:
+    async def __calculate_uniqueness(self, stats: BaseStats, weights: dict[str, int],
+                                     playlist_counts: np.ndarray) -> tuple[float, dict[str, float]]:
         """
         Calculates the uniqueness of a playlist based on the popularity of tracks, artists, variety of genres,
         variety of tracks audio params
@@ -485,83 +720,100 @@ class AnalysisService:
 
         E - Era Diversity:
         E = summ(1 / count_playlists_with_track) / t
+            count_playlists_with_track - number of playlists containing track in any of their versions
             t - total number of tracks
 
-        :param playlist_tracks: List of SpotifyTrack objects
-        :param playlist_artists: List of SpotifyArtist objects
+        :param stats: Statistics of playlist tracks and their artists
         :param weights: Dictionary of weights
-        :return: Uniqueness score between 0 and 1
+        :param playlist_counts: Number of playlists containing every track
+        :return: Uniqueness score between 0 and 1 and its components (keyed like weights)
         """
         # TODO: Add edge cases handing such as one genre
 
-        # Weights
-        w1 = weights.get('popularity')
-        w2 = weights.get('artist_diversity')
-        w3 = weights.get('musical_diversity')
-        w4 = weights.get('genre_diversity')
-        w5 = weights.get('temporal_diversity')
-        w6 = weights.get('era_diversity')
-        w_list = [w1, w2, w3, w4, w5, w6]
-
-        # Weights validation
-        if any(param is None for param in w_list):
-            raise ValueError('Not all weights are set.')
-
-        if sum(w_list) != 1:
-            raise ValueError('Sum of weights must be equal to 1')
-
-        # 1. Popularity (P)
-        p_tracks = np.mean([track.popularity for track in playlist_tracks])
-        p_artists = np.mean([artist.popularity for artist in playlist_artists])
-        P = 1 - ((p_tracks + p_artists) / 200)
+        # Weights (validated)
+        w1, w2, w3, w4, w5, w6 = component_weights(weights)
 
-        # 2. Artist Diversity (A)
-        unique_artists = len(set(artist.artist_id for track in playlist_tracks for artist in track.artists))
-        artist_counts = np.array([len(track.artists) for track in playlist_tracks])
-        A = (unique_artists / len(playlist_tracks)) * (1 - (np.max(artist_counts) / len(playlist_tracks)))
-
-        # 3. Musical Diversity (M)
-        tempos = [track.track_features.tempo for track in playlist_tracks]
-        keys = [track.track_features.key for track in playlist_tracks]
-        loudness = [track.track_features.loudness for track in playlist_tracks]
-        durations = [track.track_features.duration_ms for track in playlist_tracks]
-        modes = [track.track_features.mode for track in playlist_tracks]
-        energies = [track.track_features.energy for track in playlist_tracks]
-        valences = [track.track_features.valence for track in playlist_tracks]
-        danceabilities = [track.track_features.dance_ability for track in playlist_tracks]
-
-        M = np.mean([
-            self.__data_set_uniqueness(tempos),
-            self.__data_set_uniqueness(keys),
-            self.__data_set_uniqueness(loudness),
-            self.__data_set_uniqueness(durations),
-            self.__data_set_uniqueness(modes),
-            self.__data_set_uniqueness(energies),
-            self.__data_set_uniqueness(valences),
-            self.__data_set_uniqueness(danceabilities)
-        ])
-
-        # 4. Genre Diversity (G)
-        genres = list(chain.from_iterable(artist.genres for artist in playlist_artists))
-        unique_genres = len(set(genres))
-        genre_counts = np.array([genres.count(genre) for genre in set(genres)])
-        H = -np.sum((genre_counts / len(genres)) * np.log(genre_counts / len(genres)))
-        G = (unique_genres / len(playlist_tracks)) * (1 - (H / np.log(unique_genres)))
-
-        # 5. Temporal Diversity (T)
-        release_dates = [track.release_date for track in playlist_tracks]  # track.release_date in date format
-        current_date = datetime.now().date()
-        years = [t_date.year for t_date in release_dates]
-        min_year = min(years)
-        T = 1 - (max(years) - min_year) / (current_date.year - min_year + 1)  # Adding 1 to avoid division by zero
-
-        # 6. Era Diversity (E)
-        eras = [year // 10 for year in years]  # Defining eras as decades
-        current_era = current_date.year // 10
-        min_era = min_year // 10
-        E = len(set(eras)) / (current_era - min_era + 1)
+        # Only numbers and arrays of counts are sent to scoring process (see ``StatsSummary``)
+        components = await scoring_executor.run(summary_components, stats.summary(), datetime.now().year,
+                                                playlist_counts)
+        P, A, M, G, T, E = (components[name] for name in COMPONENTS)
 
         # Calculate final uniqueness score
         U = (w1 * P + w2 * A + w3 * M + w4 * G + w5 * T + w6 * E) / (w1 + w2 + w3 + w4 + w5 + w6)
 
-        return U
+        return U, components
+
+    async def similar_playlists(self, spotify_playlist_id: str, limit: int = 10,
+                                candidates: int = 100) -> list[SSimilarPlaylist]:
+        """
+        Analyzed playlists sharing most tracks with the latest analyzed version of playlist.
+        Candidates are found by LSH bands of MinHash signatures (no joins of playlist tracks),
+        then ranked by Jaccard similarity estimated from signatures
+        :param spotify_playlist_id: Spotify id of playlist
+        :param limit: Max number of playlists
+        :param candidates: Max number of candidate versions compared
+        :return: Similar playlists, most similar first
+        """
+        signature = await playlist_versions.latest_signature(spotify_playlist_id)
+        if signature is None:
+            raise PlaylistNotAnalyzed(spotify_playlist_id)
+
+        playlist_id, signature = signature
+        similar = {}
+
+        for candidate_id, name, candidate_signature in await playlist_versions.similar_candidates(
+                playlist_id, signature, candidates):
+            similarity = minhash.jaccard(signature, candidate_signature)
+
+            # Playlist is listed once, by its most similar version
+            if candidate_id not in similar or similar[candidate_id].jaccard < similarity:
+                similar[candidate_id] = SSimilarPlaylist(spotify_playlist_id=candidate_id, name=name,
+                                                         jaccard=similarity)
+
+        return sorted(similar.values(), key=lambda playlist: playlist.jaccard, reverse=True)[:limit]
+
+    async def similar_sound_playlists(self, spotify_playlist_id: str, limit: int = 10,
+                                      metric: str = 'l2') -> list[SSoundSimilarPlaylist]:
+        """
+        Analyzed playlists nearest by sound (mean and spread of audio features) to the latest analyzed version
+        of playlist, searched in in-memory ``FeatureIndex``
+        :param spotify_playlist_id: Spotify id of playlist
+        :param limit: Max number of playlists
+        :param metric: ``l2`` or ``cosine``
+        :return: Nearest playlists, nearest first
+        """
+        vector = await playlist_versions.latest_feature_vector(spotify_playlist_id)
+        if vector is None:
+            raise PlaylistNotAnalyzed(spotify_playlist_id)
+
+        playlist_id, vector = vector
+        await feature_index.refresh(playlist_versions.feature_vectors)
+
+        # Playlist itself is in index too
+        nearest = [(version_id, distance)
+                   for nearest_playlist_id, version_id, distance in feature_index.search(vector, limit + 1, metric)[0]
+                   if nearest_playlist_id != playlist_id][:limit]
+        names = await playlist_versions.names([version_id for version_id, _ in nearest])
+
+        return [
+            SSoundSimilarPlaylist(spotify_playlist_id=names[version_id][0], name=names[version_id][1],
+                                  distance=distance)
+            for version_id, distance in nearest
+            if version_id in names
+        ]
+
+    async def reweight(self, weights: dict[str, float] = analysis_settings.weights) -> int:
+        """
+        Recomputes uniqueness of every analysis from its stored components, nothing is fetched from spotify.
+        Analyzes made before components were stored keep their uniqueness
+        :param weights: Dictionary of weights
+        :return: Number of updated analyzes
+        """
+        async with uow():
+            updated = await analyzes.reweight(component_weights(weights))
+
+            # Every uniqueness has changed, percentiles are recounted from db
+            histogram = await analyzes.uniqueness_histogram(percentile_index.bins)
+
+        await percentile_index.rebuild(histogram)
+        return updated
@@ -0,0 +1,607 @@
+import json
+import struct
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime
+from typing import Hashable, Iterable
+
+import numpy as np
+
+from src.analysis.scoring import FEATURES, ScoringRecords, rarity
+from src.analysis.sketches import CountMinSketch, HyperLogLog, FixedBinHistogram, hash_strings
+
+
+def _update_counter(counter: Counter, keys: Iterable[Hashable], counts: Iterable[int], sign: int) -> None:
+    """
+    Adds (sign = 1) or subtracts (sign = -1) counts, keys with no occurrences left are dropped
+    """
+    for key, count in zip(keys, counts):
+        count = counter[key] + sign * int(count)
+
+        if count > 0:
+            counter[key] = count
+        else:
+            del counter[key]
+
+
+def _histogram(values: np.ndarray) -> tuple[list, np.ndarray]:
+    """
+    :return: Unique values (as python numbers) and their counts
+    """
+    unique, counts = np.unique(values, return_counts=True)
+    return unique.tolist(), counts
+
+
+def _counts_uniqueness(counts: np.ndarray, total: int, mean: float, std: float) -> float:
+    """
+    Same as ``features_uniqueness`` for one column, computed from value counts and moments
+    """
+    if total == 0:
+        return 0.0
+
+    # Shannon index (in bits), normalized from 0 to 1
+    probabilities = counts / total
+    probabilities = probabilities / np.sum(probabilities)
+    shannon_index = -np.sum(probabilities * np.log(probabilities)) / np.log(2)
+    max_shannon_index = np.log2(len(counts))
+    normalized_shannon_index = shannon_index / max_shannon_index if max_shannon_index > 0 else 0
+
+    # Simpson index, the higher the value (1 - D), the higher the diversity
+    normalized_simpson_index = 1 - np.sum(probabilities ** 2)
+
+    # Coefficient of variation, CV > 1 is treated as 1 (very high variability)
+    coefficient_of_variation = std / mean if mean != 0 else 0
+    normalized_cv = min(coefficient_of_variation, 1)
+
+    return (normalized_shannon_index + normalized_simpson_index + normalized_cv) / 3
+
+
+class RunningMoments:
+    """
+    Count, mean and sum of squared deviations (M2) of values, updated online with Welford's method.
+    Batches are added, removed and merged with the pairwise (Chan et al.) formulas, so memory doesn't depend
+    on number of values and precision doesn't suffer from subtracting large sums of squares
+    """
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    @classmethod
+    def from_values(cls, values: np.ndarray) -> 'RunningMoments':
+        if len(values) == 0:
+            return cls()
+
+        mean = float(values.mean())
+        return cls(len(values), mean, float(np.square(values - mean).sum()))
+
+    def add(self, values: np.ndarray) -> None:
+        self.merge(RunningMoments.from_values(values))
+
+    def remove(self, values: np.ndarray) -> None:
+        other = RunningMoments.from_values(values)
+        if other.count == 0:
+            return
+
+        count = self.count - other.count
+        if count <= 0:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+
+        # Inverse of ``merge``: moments of the rest are found from moments of the whole and of the removed part
+        mean = (self.count * self.mean - other.count * other.mean) / count
+        delta = other.mean - mean
+        m2 = self.m2 - other.m2 - delta ** 2 * count * other.count / self.count
+
+        self.count, self.mean, self.m2 = count, mean, max(m2, 0.0)
+
+    def merge(self, other: 'RunningMoments') -> None:
+        if other.count == 0:
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+
+    @property
+    def variance(self) -> float:
+        """
+        Population variance (like ``np.var``)
+        """
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        return np.sqrt(self.variance)
+
+    def to_json(self) -> list:
+        return [self.count, self.mean, self.m2]
+
+    @classmethod
+    def from_json(cls, data: list) -> 'RunningMoments':
+        return cls(*data)
+
+
+class BaseStats(ABC):
+    """
+    Statistics of playlist version tracks that uniqueness components are computed from.
+
+    Statistics are built page by page while playlist is fetched (tracks are added as their page is written),
+    uniqueness components are computed from statistics only. Counts, sums, running moments, numbers of artists
+    per track and years are exact in every implementation, subclasses choose how artists, genres and feature
+    values are counted
+    """
+
+    def __init__(self):
+        self.tracks = 0
+        self.popularity_sum = 0
+        self.edges = 0
+        self.edge_popularity_sum = 0
+
+        # number of artists of track -> number of tracks
+        self.artists_per_track: Counter[int] = Counter()
+        self.years: Counter[int] = Counter()
+
+        # Per feature (in ``FEATURES`` order), NaN values are counted as missing only
+        self.feature_missing = [0] * len(FEATURES)
+        self.feature_moments = [RunningMoments() for _ in FEATURES]
+
+    @classmethod
+    def from_records(cls, records: ScoringRecords) -> 'BaseStats':
+        stats = cls()
+        stats.add(records)
+        return stats
+
+    def add(self, records: ScoringRecords) -> None:
+        self._update(records, sign=1)
+
+    def merge(self, other: 'BaseStats') -> None:
+        """
+        Adds statistics of other tracks (e.g. of another page or worker), tracks must not overlap
+        """
+        self.tracks += other.tracks
+        self.popularity_sum += other.popularity_sum
+        self.edges += other.edges
+        self.edge_popularity_sum += other.edge_popularity_sum
+
+        self.artists_per_track.update(other.artists_per_track)
+        self.years.update(other.years)
+
+        for column in range(len(FEATURES)):
+            self.feature_missing[column] += other.feature_missing[column]
+            self.feature_moments[column].merge(other.feature_moments[column])
+
+        self._merge(other)
+
+    def _update(self, records: ScoringRecords, sign: int) -> None:
+        self.tracks += sign * len(records)
+        self.popularity_sum += sign * int(records.popularity.sum(dtype=np.int64))
+        self.edges += sign * len(records.edge_track)
+        self.edge_popularity_sum += sign * int(records.edge_popularity.sum(dtype=np.int64))
+
+        self._update_artists(records, sign)
+        self._update_genres(records, sign)
+
+        artists_per_track = np.bincount(records.edge_track, minlength=len(records))
+        _update_counter(self.artists_per_track, *_histogram(artists_per_track), sign)
+        _update_counter(self.years, *_histogram(records.years), sign)
+
+        for column in range(len(FEATURES)):
+            values = records.features[:, column]
+            missing = np.isnan(values)
+            values = values[~missing]
+
+            self.feature_missing[column] += sign * int(missing.sum())
+            if sign > 0:
+                self.feature_moments[column].add(values)
+            else:
+                self.feature_moments[column].remove(values)
+            self._update_feature_values(column, values, sign)
+
+    @abstractmethod
+    def _merge(self, other: 'BaseStats') -> None:
+        """
+        Merges artists, genres and feature values of other statistics of the same class
+        """
+
+    @abstractmethod
+    def _update_artists(self, records: ScoringRecords, sign: int) -> None:
+        pass
+
+    @abstractmethod
+    def _update_genres(self, records: ScoringRecords, sign: int) -> None:
+        pass
+
+    @abstractmethod
+    def _update_feature_values(self, column: int, values: np.ndarray, sign: int) -> None:
+        pass
+
+    @abstractmethod
+    def distinct_artists(self) -> int:
+        pass
+
+    @abstractmethod
+    def genre_counts(self) -> tuple[int, np.ndarray]:
+        """
+        :return: Number of distinct genres and occurrences of every genre
+        """
+
+    @abstractmethod
+    def feature_counts(self, column: int) -> np.ndarray:
+        """
+        Occurrences of every value of feature (present values only)
+        """
+
+    def features_uniqueness(self) -> list[float]:
+        """
+        Uniqueness of every feature over tracks having it (like ``features_uniqueness``)
+        """
+        result = []
+
+        for column in range(len(FEATURES)):
+            moments = self.feature_moments[column]
+            result.append(_counts_uniqueness(self.feature_counts(column), self.tracks - self.feature_missing[column],
+                                             moments.mean, moments.std))
+
+        return result
+
+    def feature_vector(self) -> np.ndarray:
+        """
+        Sound of playlist: mean (centroid) and standard deviation (spread) of every feature, in ``FEATURES`` order.
+        Features missing for every track are 0
+        :return: Array of 2 x len(FEATURES) float32
+        """
+        means = [moments.mean for moments in self.feature_moments]
+        stds = [moments.std for moments in self.feature_moments]
+        return np.array(means + stds, dtype=np.float32)
+
+    def summary(self) -> 'StatsSummary':
+        """
+        Reduces statistics to what components are computed from: numbers, moments and arrays of counts
+        """
+        unique_genres, genre_counts = self.genre_counts()
+
+        return StatsSummary(
+            tracks=self.tracks,
+            popularity_sum=self.popularity_sum,
+            edges=self.edges,
+            edge_popularity_sum=self.edge_popularity_sum,
+            distinct_artists=self.distinct_artists(),
+            max_artists=max(self.artists_per_track),
+            unique_genres=unique_genres,
+            genre_counts=genre_counts,
+            min_year=min(self.years),
+            max_year=max(self.years),
+            feature_missing=np.array(self.feature_missing, dtype=np.int64),
+            feature_moments=np.array([[moments.mean, moments.std] for moments in self.feature_moments]),
+            feature_counts=[np.unique(self.feature_counts(column), return_counts=True)
+                            for column in range(len(FEATURES))],
+        )
+
+    def components(self, current_year: int, playlist_counts: np.ndarray) -> dict[str, float]:
+        """
+        Components of uniqueness score, same as ``uniqueness_components`` of all tracks up to float rounding
+        (for exact statistics). See ``summary_components``
+        """
+        return summary_components(self.summary(), current_year, playlist_counts)
+
+
+class StatsSummary:
+    """
+    Compact input of ``summary_components``: numbers, feature means and standard deviations (features x 2)
+    and counts of values. Shannon and Simpson indexes depend only on how many values occur how many times,
+    so for every feature only distinct counts and their numbers of values are sent to scoring process
+    (a few dozen numbers for continuous features, where most values occur once), not histograms keyed by value
+    """
+    __slots__ = ('tracks', 'popularity_sum', 'edges', 'edge_popularity_sum', 'distinct_artists', 'max_artists',
+                 'unique_genres', 'genre_counts', 'min_year', 'max_year',
+                 'feature_missing', 'feature_moments', 'feature_counts')
+
+    def __init__(self, tracks: int, popularity_sum: int, edges: int, edge_popularity_sum: int,
+                 distinct_artists: int, max_artists: int, unique_genres: int, genre_counts: np.ndarray,
+                 min_year: int, max_year: int, feature_missing: np.ndarray, feature_moments: np.ndarray,
+                 feature_counts: list[tuple[np.ndarray, np.ndarray]]):
+        self.tracks = tracks
+        self.popularity_sum = popularity_sum
+        self.edges = edges
+        self.edge_popularity_sum = edge_popularity_sum
+        self.distinct_artists = distinct_artists
+        self.max_artists = max_artists
+        self.unique_genres = unique_genres
+        self.genre_counts = genre_counts
+        self.min_year = min_year
+        self.max_year = max_year
+        self.feature_missing = feature_missing
+        self.feature_moments = feature_moments
+        self.feature_counts = feature_counts
+
+
+def summary_components(summary: StatsSummary, current_year: int, playlist_counts: np.ndarray) -> dict[str, float]:
+    """
+    Components of uniqueness score computed from statistics (see ``BaseStats.summary``).
+    Playlist counts change with other playlists, so they are not part of statistics
+    :param summary: Summary of playlist statistics
+    :param current_year: Year temporal diversity is measured to
+    :param playlist_counts: Number of playlists containing every track
+    """
+    tracks_count = summary.tracks
+
+    # Popularity (P)
+    popularity = 1 - ((np.float64(summary.popularity_sum) / tracks_count +
+                       np.float64(summary.edge_popularity_sum) / summary.edges) / 200)
+
+    # Artist Diversity (A)
+    artist_diversity = (summary.distinct_artists / tracks_count) * (1 - (summary.max_artists / tracks_count))
+
+    # Musical Diversity (M), every feature over tracks having it (like ``features_uniqueness``)
+    musical_diversity = np.mean([
+        _counts_uniqueness(np.repeat(*summary.feature_counts[column]),
+                           tracks_count - summary.feature_missing[column], *summary.feature_moments[column])
+        for column in range(len(FEATURES))
+    ])
+
+    # Genre Diversity (G)
+    unique_genres = summary.unique_genres
+    shares = summary.genre_counts / summary.genre_counts.sum()
+    shannon_index = -np.sum(shares * np.log(shares))
+    genre_diversity = (unique_genres / tracks_count) * (1 - (shannon_index / np.log(unique_genres)))
+
+    # Temporal Diversity (T), adding 1 to avoid division by zero
+    temporal_diversity = 1 - (summary.max_year - summary.min_year) / (current_year - summary.min_year + 1)
+
+    # Era Diversity (E)
+    era_diversity = rarity(playlist_counts)
+
+    return {
+        'popularity': popularity,
+        'artist_diversity': artist_diversity,
+        'musical_diversity': musical_diversity,
+        'genre_diversity': genre_diversity,
+        'temporal_diversity': temporal_diversity,
+        'era_diversity': era_diversity,
+    }
+
+
+class PlaylistStats(BaseStats):
+    """
+    Exact sufficient statistics of playlist version tracks.
+
+    The next version of a playlist is scored by adding its added tracks and removing its removed tracks
+    instead of loading every track, so statistics are stored (see ``to_json``).
+    Removed tracks are subtracted with their current values, so statistics drift if a removed track was refreshed
+    since it was added. ``scored_at`` and ``incremental`` let the caller bound the drift by scoring from scratch.
+    """
+    FORMAT_VERSION = 3
+    # Older formats that can still be read
+    SUPPORTED_VERSIONS = (1, 2, 3)
+
+    def __init__(self):
+        super().__init__()
+
+        # When values of the oldest tracks were read (UTC, statistics are created before any track is read),
+        # None if unknown (formats 1 and 2)
+        self.scored_at: datetime | None = datetime.utcnow()
+        # Number of versions rescored incrementally since the statistics were built from scratch
+        self.incremental = 0
+
+        # artist id -> number of edges (tracks of the artist)
+        self.artists: Counter[str] = Counter()
+        # genre code -> number of occurrences
+        self.genres: Counter[int] = Counter()
+        # Musical diversity uses Shannon and Simpson indexes of exact values, so values are counted for every feature,
+        # continuous ones included (at most one entry per track, ``PlaylistSketch`` bounds them by bins)
+        self.feature_values: list[Counter[float]] = [Counter() for _ in FEATURES]
+
+    def remove(self, records: ScoringRecords) -> None:
+        self._update(records, sign=-1)
+
+    def _merge(self, other: 'PlaylistStats') -> None:
+        self.artists.update(other.artists)
+        self.genres.update(other.genres)
+
+        for column in range(len(FEATURES)):
+            self.feature_values[column].update(other.feature_values[column])
+
+    def _update_artists(self, records: ScoringRecords, sign: int) -> None:
+        artists, counts = _histogram(records.edge_artists)
+        _update_counter(self.artists, (records.artist_ids[code] for code in artists), counts, sign)
+
+    def _update_genres(self, records: ScoringRecords, sign: int) -> None:
+        _update_counter(self.genres, *_histogram(records.genres), sign)
+
+    def _update_feature_values(self, column: int, values: np.ndarray, sign: int) -> None:
+        _update_counter(self.feature_values[column], *_histogram(values), sign)
+
+    def distinct_artists(self) -> int:
+        return len(self.artists)
+
+    def genre_counts(self) -> tuple[int, np.ndarray]:
+        return len(self.genres), np.fromiter(self.genres.values(), dtype=np.int64)
+
+    def feature_counts(self, column: int) -> np.ndarray:
+        return np.fromiter(self.feature_values[column].values(), dtype=np.int64)
+
+    def to_json(self) -> dict:
+        """
+        Json-compatible representation, numeric histograms are lists of [value, count] pairs
+        """
+        return {
+            'version': self.FORMAT_VERSION,
+            'scored_at': self.scored_at.isoformat() if self.scored_at else None,
+            'incremental': self.incremental,
+            'tracks': self.tracks,
+            'popularity_sum': self.popularity_sum,
+            'edges': self.edges,
+            'edge_popularity_sum': self.edge_popularity_sum,
+            'artists': dict(self.artists),
+            'artists_per_track': list(self.artists_per_track.items()),
+            'genres': list(self.genres.items()),
+            'years': list(self.years.items()),
+            'features': {
+                feature: {
+                    'missing': self.feature_missing[column],
+                    'moments': self.feature_moments[column].to_json(),
+                    'values': list(self.feature_values[column].items()),
+                }
+                for column, feature in enumerate(FEATURES)
+            },
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'PlaylistStats':
+        stats = cls()
+
+        stats.scored_at = datetime.fromisoformat(data['scored_at']) if data.get('scored_at') else None
+        stats.incremental = data.get('incremental', 0)
+
+        stats.tracks = data['tracks']
+        stats.popularity_sum = data['popularity_sum']
+        stats.edges = data['edges']
+        stats.edge_popularity_sum = data['edge_popularity_sum']
+        stats.artists = Counter(data['artists'])
+        stats.artists_per_track = Counter(dict(data['artists_per_track']))
+        stats.genres = Counter(dict(data['genres']))
+        stats.years = Counter(dict(data['years']))
+
+        for column, feature in enumerate(FEATURES):
+            feature_data = data['features'][feature]
+            stats.feature_missing[column] = feature_data['missing']
+
+            if data['version'] == 1:
+                # Sums and sums of squares of present values
+                count = stats.tracks - feature_data['missing']
+                mean = feature_data['sum'] / count if count else 0.0
+                m2 = max(feature_data['squares'] - count * mean ** 2, 0.0)
+                stats.feature_moments[column] = RunningMoments(count, mean, m2)
+            else:
+                stats.feature_moments[column] = RunningMoments.from_json(feature_data['moments'])
+            stats.feature_values[column] = Counter({value: count for value, count in feature_data['values']})
+
+        return stats
+
+
+# (low, high, resolution) of feature histograms of ``PlaylistSketch``, in ``FEATURES`` order.
+# Key and mode are integers, energy, valence and dance-ability are reported by spotify with 3 decimals
+FEATURE_BINS = (
+    (0, 250, 0.1),  # tempo
+    (-1, 11, 1),  # key
+    (-60, 5, 0.01),  # loudness
+    (0, 1_800_000, 100),  # duration_ms
+    (0, 1, 1),  # mode
+    (0, 1, 0.001),  # energy
+    (0, 1, 0.001),  # valence
+    (0, 1, 0.001),  # dance_ability
+)
+
+
+class PlaylistSketch(BaseStats):
+    """
+    Approximate statistics for very large playlists, memory doesn't grow with number of tracks, artists or genres.
+
+    Differences from exact statistics:
+    - number of distinct artists and genres is estimated with ``HyperLogLog`` (relative standard error 0.81%),
+      artist diversity has the same relative error
+    - occurrences of genres (so Shannon index of genre diversity) are counted with ``CountMinSketch``:
+      genres sharing a counter are counted as one genre, which only lowers the Shannon index
+      (a pair of genres shares a counter with probability 1 / 4096)
+    - Shannon and Simpson indexes of features are computed over ``FixedBinHistogram`` bins (see ``FEATURE_BINS``)
+      instead of exact values: key, mode and features on their resolution grid are exact, otherwise values closer
+      than resolution / 2 are counted as one value
+    Moments (so coefficients of variation), popularity, numbers of artists per track and years are exact.
+
+    Sketches merge (pages, workers) and are serialized with ``to_bytes``. Tracks can't be removed from sketches,
+    so they are not stored for incremental rescoring
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.artists = HyperLogLog()
+        self.genres = HyperLogLog()
+        self.genre_frequencies = CountMinSketch()
+        self.feature_values = [FixedBinHistogram(*bins) for bins in FEATURE_BINS]
+
+    def _merge(self, other: 'PlaylistSketch') -> None:
+        self.artists.update(other.artists)
+        self.genres.update(other.genres)
+        self.genre_frequencies.update(other.genre_frequencies)
+
+        for column in range(len(FEATURES)):
+            self.feature_values[column].update(other.feature_values[column])
+
+    def _update_artists(self, records: ScoringRecords, sign: int) -> None:
+        # Artist codes are per records, so only artists of these records are hashed
+        self.artists.add(hash_strings(records.artist_ids))
+
+    def _update_genres(self, records: ScoringRecords, sign: int) -> None:
+        codes, counts = np.unique(records.genres, return_counts=True)
+        hashes = hash_strings(str(code) for code in codes.tolist())
+        self.genres.add(hashes)
+        self.genre_frequencies.add(hashes, counts)
+
+    def _update_feature_values(self, column: int, values: np.ndarray, sign: int) -> None:
+        self.feature_values[column].add(values)
+
+    def distinct_artists(self) -> int:
+        return len(self.artists)
+
+    def genre_counts(self) -> tuple[int, np.ndarray]:
+        return len(self.genres), self.genre_frequencies.row_counts()
+
+    def feature_counts(self, column: int) -> np.ndarray:
+        return self.feature_values[column].values()
+
+    def to_bytes(self) -> bytes:
+        """
+        Binary representation (e.g. to merge sketches of other workers): json of exact statistics
+        followed by the sketches, every part is prefixed with its length
+        """
+        exact = json.dumps({
+            'tracks': self.tracks,
+            'popularity_sum': self.popularity_sum,
+            'edges': self.edges,
+            'edge_popularity_sum': self.edge_popularity_sum,
+            'artists_per_track': list(self.artists_per_track.items()),
+            'years': list(self.years.items()),
+            'feature_missing': self.feature_missing,
+            'feature_moments': [moments.to_json() for moments in self.feature_moments],
+        }).encode()
+        parts = [exact, self.artists.to_bytes(), self.genres.to_bytes(), self.genre_frequencies.to_bytes(),
+                 *(histogram.to_bytes() for histogram in self.feature_values)]
+
+        return b''.join(struct.pack('<Q', len(part)) + part for part in parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'PlaylistSketch':
+        parts = []
+        offset = 0
+
+        while offset < len(data):
+            (size,) = struct.unpack_from('<Q', data, offset)
+            offset += struct.calcsize('<Q')
+            parts.append(data[offset:offset + size])
+            offset += size
+
+        exact, artists, genres, genre_frequencies, *feature_values = parts
+        exact = json.loads(exact)
+
+        sketch = cls()
+        sketch.tracks = exact['tracks']
+        sketch.popularity_sum = exact['popularity_sum']
+        sketch.edges = exact['edges']
+        sketch.edge_popularity_sum = exact['edge_popularity_sum']
+        sketch.artists_per_track = Counter(dict(exact['artists_per_track']))
+        sketch.years = Counter(dict(exact['years']))
+        sketch.feature_missing = exact['feature_missing']
+        sketch.feature_moments = [RunningMoments.from_json(moments) for moments in exact['feature_moments']]
+
+        sketch.artists = HyperLogLog.from_bytes(artists)
+        sketch.genres = HyperLogLog.from_bytes(genres)
+        sketch.genre_frequencies = CountMinSketch.from_bytes(genre_frequencies)
+        sketch.feature_values = [FixedBinHistogram.from_bytes(histogram) for histogram in feature_values]
+
+        return sketch
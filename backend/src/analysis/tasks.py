@@ -1,6 +1,7 @@
 from asyncio import get_event_loop
 from uuid import UUID
 
+from src.analysis.metrics import log_metrics
 from src.analysis.schemas import SPlaylistCreate
 from src.analysis.service import AnalysisService
 from src.tasks import celery
@@ -8,11 +9,38 @@ from celery import Task
 
 
 @celery.task(bind=True)
-def analyse_playlist(self: Task, playlist: SPlaylistCreate, version_id: UUID):
+def analyse_playlist(self: Task, playlist: SPlaylistCreate, version_id: UUID, tracks_count: int | None = None):
     loop = get_event_loop()
-    return loop.run_until_complete(analyse_playlist_wrapper(playlist, version_id, self.request.id))
+    return loop.run_until_complete(analyse_playlist_wrapper(playlist, version_id, self.request.id, tracks_count))
 
 
-async def analyse_playlist_wrapper(playlist: SPlaylistCreate, version_id: UUID, task_id: UUID):
+async def analyse_playlist_wrapper(playlist: SPlaylistCreate, version_id: UUID, task_id: UUID,
+                                   tracks_count: int | None = None):
     async with AnalysisService() as service:
-        return await service.analyze_playlist(playlist, version_id, task_id)
+        uniqueness = await service.analyze_playlist(playlist, version_id, task_id, tracks_count)
+
+    await log_metrics()
+    return uniqueness
+
+
+@celery.task
+def refresh_expired():
+    loop = get_event_loop()
+    return loop.run_until_complete(refresh_expired_wrapper())
+
+
+async def refresh_expired_wrapper():
+    async with AnalysisService() as service:
+        return await service.refresh_expired()
+
+
+# Run after changing ``AnalysisSettings.weights``
+@celery.task
+def reweight_analyzes():
+    loop = get_event_loop()
+    return loop.run_until_complete(reweight_analyzes_wrapper())
+
+
+async def reweight_analyzes_wrapper():
+    async with AnalysisService() as service:
+        return await service.reweight()
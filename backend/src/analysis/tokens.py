@@ -0,0 +1,182 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.analysis.config import analysis_settings
+from src.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Returns access token and its lifetime in seconds (``expires_in`` from spotify response)
+TokenFetcher = Callable[[], Awaitable[tuple[str, int]]]
+
+
+@dataclass(frozen=True)
+class AccessToken:
+    value: str
+    expires_at: float  # Unix timestamp
+
+    def is_fresh(self, margin: int) -> bool:
+        return time.time() < self.expires_at - margin
+
+
+class TokenStore:
+    """
+    Spotify access token cache shared by all API workers and celery processes.
+
+    Token is stored in redis, if redis is unavailable the store falls back to a json file.
+    Only one caller refreshes the token (in-process lock + redis or file lock), others wait and reuse the result.
+    """
+
+    def __init__(self, redis: Redis, file_path: str, refresh_margin: int, lock_timeout: float = 30):
+        self._redis = redis
+        self._file_path = file_path
+        self._refresh_margin = refresh_margin
+        # Seconds the refresh lock is held at most and waited for at most
+        self._lock_timeout = lock_timeout
+
+        # Local copy of the token, saves a redis round-trip while token is fresh
+        self._tokens: dict[str, AccessToken] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    async def get(self, client_id: str, fetch_token: TokenFetcher) -> str:
+        """
+        Returns fresh access token for client, refreshing it if needed
+        :param client_id: Spotify client id, tokens of different clients are stored separately
+        :param fetch_token: Coroutine function that requests a new token from spotify
+        :return: Access token
+        """
+        token = self._tokens.get(client_id)
+        if token and token.is_fresh(self._refresh_margin):
+            return token.value
+
+        async with self._locks.setdefault(client_id, asyncio.Lock()):
+            token = await self.__load_fresh(client_id)
+            if token:
+                return token.value
+
+            async with self.__refresh_lock(client_id) as locked:
+                # Token may have been refreshed by another process while we were waiting for the lock.
+                # If the lock wasn't acquired in time, its holder is slow or gone: the token is fetched only
+                # if it still didn't write one
+                token = await self.__load_fresh(client_id)
+                if token:
+                    return token.value
+
+                if not locked:
+                    logger.warning('Access token lock of %s is not acquired in %s seconds, fetching token without it',
+                                   client_id, self._lock_timeout)
+
+                value, expires_in = await fetch_token()
+                token = AccessToken(value=value, expires_at=time.time() + expires_in)
+                await self.__save(client_id, token)
+                self._tokens[client_id] = token
+
+                return token.value
+
+    async def __load_fresh(self, client_id: str) -> AccessToken | None:
+        token = await self.__load(client_id)
+
+        if not token or not token.is_fresh(self._refresh_margin):
+            return None
+
+        self._tokens[client_id] = token
+        return token
+
+    @staticmethod
+    def __key(client_id: str) -> str:
+        return f'spotify:access_token:{client_id}'
+
+    async def __load(self, client_id: str) -> AccessToken | None:
+        try:
+            raw = await self._redis.get(self.__key(client_id))
+        except RedisError:
+            return await asyncio.to_thread(self.__load_file, client_id)
+
+        if not raw:
+            return None
+
+        return AccessToken(**json.loads(raw))
+
+    async def __save(self, client_id: str, token: AccessToken) -> None:
+        try:
+            # Key expires together with the token, so stale tokens are never read
+            await self._redis.set(self.__key(client_id), json.dumps(token.__dict__),
+                                  exat=int(token.expires_at))
+        except RedisError:
+            await asyncio.to_thread(self.__save_file, client_id, token)
+
+    @asynccontextmanager
+    async def __refresh_lock(self, client_id: str):
+        """
+        Redis lock of token refresh, file lock if redis is unavailable
+        :return: Whether the lock is held (False if redis lock wasn't acquired in ``lock_timeout``)
+        """
+        lock = self._redis.lock(f'{self.__key(client_id)}:lock', timeout=self._lock_timeout,
+                                blocking_timeout=self._lock_timeout)
+        try:
+            acquired = await lock.acquire()
+        except RedisError:
+            acquired = None
+
+        if acquired is None:
+            async with self.__file_lock():
+                yield True
+            return
+
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    await lock.release()
+                except RedisError:
+                    # Lock will be released by timeout
+                    pass
+
+    @asynccontextmanager
+    async def __file_lock(self):
+        fd = os.open(f'{self._file_path}.lock', os.O_CREAT | os.O_RDWR)
+        try:
+            await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def __load_file(self, client_id: str) -> AccessToken | None:
+        try:
+            with open(self._file_path) as file:
+                tokens = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        token = tokens.get(client_id)
+        return AccessToken(**token) if token else None
+
+    def __save_file(self, client_id: str, token: AccessToken) -> None:
+        try:
+            with open(self._file_path) as file:
+                tokens = json.load(file)
+        except (OSError, ValueError):
+            tokens = {}
+
+        tokens[client_id] = token.__dict__
+
+        # Writing to temporary file and replacing, so readers never see a partially written file
+        tmp_path = f'{self._file_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(tokens, file)
+        os.replace(tmp_path, self._file_path)
+
+
+token_store = TokenStore(redis_client, analysis_settings.token_cache_file, analysis_settings.token_refresh_margin)
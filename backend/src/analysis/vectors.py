@@ -0,0 +1,169 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Iterable
+from uuid import UUID
+
+import numpy as np
+
+from src.analysis.config import analysis_settings
+from src.analysis.statistics import FEATURE_BINS
+
+# Features are scaled to comparable ranges: centroid by (value - low) / (high - low), spread by std / (high - low)
+_RANGES = np.array([high - low for low, high, _ in FEATURE_BINS], dtype=np.float32)
+_LOWS = np.array([low for low, _, _ in FEATURE_BINS], dtype=np.float32)
+OFFSETS = np.concatenate([_LOWS, np.zeros_like(_LOWS)])
+SCALES = np.concatenate([_RANGES, _RANGES])
+
+# Vectors are stored with created_at of their transaction start, transactions of the last ``REFRESH_OVERLAP``
+# may commit after a refresh, so their vectors are read again (adding the same vector twice is a no-op)
+REFRESH_OVERLAP = timedelta(hours=1)
+
+# Rows multiplied at once, bounds temporary memory (chunk x number of queries)
+_CHUNK_SIZE = 65_536
+
+# (version id, playlist id, vector, created_at) rows
+VectorLoader = Callable[[datetime | None], Awaitable[Iterable[tuple[UUID, UUID, np.ndarray, datetime]]]]
+
+
+def to_bytes(vector: np.ndarray) -> bytes:
+    return vector.astype('<f4').tobytes()
+
+
+def from_bytes(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype='<f4').astype(np.float32)
+
+
+class FeatureIndex:
+    """
+    In-memory index of feature vectors (``PlaylistStats.feature_vector``) of the latest analyzed version
+    of every playlist, for nearest playlists by sound.
+
+    Vectors are scaled (see ``SCALES``) and kept in one float32 matrix, with squared norms of rows.
+    Search is a brute force of batched matrix products (``_CHUNK_SIZE`` rows at a time) and ``argpartition``,
+    a few milliseconds for hundreds of thousands of playlists. Index is refreshed incrementally:
+    only vectors created since the previous refresh are loaded, matrix grows by doubling
+    """
+
+    def __init__(self, dimensions: int, refresh_interval: float):
+        self._refresh_interval = refresh_interval
+        self._refreshed_at: float | None = None
+        self._watermark: datetime | None = None
+        self._lock = asyncio.Lock()
+
+        self._matrix = np.empty((0, dimensions), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+        self._size = 0
+
+        # Row of every playlist, and playlist, version and created_at of every row
+        self._rows: dict[UUID, int] = {}
+        self._playlist_ids: list[UUID] = []
+        self._version_ids: list[UUID] = []
+        self._created_at: list[datetime] = []
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def scale(vectors: np.ndarray) -> np.ndarray:
+        return ((vectors - OFFSETS) / SCALES).astype(np.float32)
+
+    def add(self, version_id: UUID, playlist_id: UUID, vector: np.ndarray, created_at: datetime) -> None:
+        """
+        Adds vector of playlist version, replacing vector of an older version of the same playlist
+        """
+        row = self._rows.get(playlist_id)
+
+        if row is None:
+            if self._size == len(self._matrix):
+                self.__grow()
+
+            row = self._size
+            self._size += 1
+            self._rows[playlist_id] = row
+            self._playlist_ids.append(playlist_id)
+            self._version_ids.append(version_id)
+            self._created_at.append(created_at)
+        elif self._created_at[row] > created_at:
+            return
+        else:
+            self._version_ids[row] = version_id
+            self._created_at[row] = created_at
+
+        scaled = self.scale(vector)
+        self._matrix[row] = scaled
+        self._norms[row] = scaled @ scaled
+
+    def __grow(self) -> None:
+        capacity = max(1024, 2 * len(self._matrix))
+
+        matrix = np.zeros((capacity, self._matrix.shape[1]), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        norms = np.zeros(capacity, dtype=np.float32)
+        norms[:self._size] = self._norms[:self._size]
+
+        self._matrix, self._norms = matrix, norms
+
+    async def refresh(self, load: VectorLoader) -> None:
+        """
+        Loads vectors created since the previous refresh, at most once per ``refresh_interval`` seconds
+        :param load: Loader of vectors created since given time (all vectors for None)
+        """
+        if self._refreshed_at is not None and time.monotonic() - self._refreshed_at < self._refresh_interval:
+            return
+
+        async with self._lock:
+            # Refreshed by other caller while waiting for the lock
+            if self._refreshed_at is not None and time.monotonic() - self._refreshed_at < self._refresh_interval:
+                return
+
+            since = self._watermark - REFRESH_OVERLAP if self._watermark else None
+            for version_id, playlist_id, vector, created_at in await load(since):
+                self.add(version_id, playlist_id, vector, created_at)
+                if self._watermark is None or created_at > self._watermark:
+                    self._watermark = created_at
+
+            self._refreshed_at = time.monotonic()
+
+    def search(self, queries: np.ndarray, k: int, metric: str = 'l2') -> list[list[tuple[UUID, UUID, float]]]:
+        """
+        Nearest playlists of every query vector
+        :param queries: Matrix of unscaled vectors (queries x dimensions)
+        :param k: Number of playlists per query
+        :param metric: ``l2`` (euclidean distance) or ``cosine`` (1 - cosine similarity)
+        :return: For every query, (playlist id, version id, distance) of nearest playlists, nearest first
+        """
+        if metric not in ('l2', 'cosine'):
+            raise ValueError(f'Unknown metric: {metric}')
+
+        queries = self.scale(np.atleast_2d(queries))
+        query_norms = np.einsum('ij,ij->i', queries, queries)
+        distances = np.empty((len(queries), self._size), dtype=np.float32)
+
+        for start in range(0, self._size, _CHUNK_SIZE):
+            end = min(start + _CHUNK_SIZE, self._size)
+            products = queries @ self._matrix[start:end].T
+            norms = self._norms[start:end]
+
+            if metric == 'l2':
+                # ||x - q||² = ||x||² - 2 x·q + ||q||², negative rounding errors are clipped
+                squared = norms[np.newaxis, :] - 2 * products + query_norms[:, np.newaxis]
+                distances[:, start:end] = np.sqrt(np.maximum(squared, 0))
+            else:
+                lengths = np.sqrt(np.outer(query_norms, norms))
+                similarity = np.divide(products, lengths, out=np.zeros_like(products), where=lengths > 0)
+                distances[:, start:end] = 1 - similarity
+
+        k = min(k, self._size)
+        results = []
+
+        for query_distances in distances:
+            nearest = np.argpartition(query_distances, k - 1)[:k] if k else np.empty(0, dtype=np.int64)
+            nearest = nearest[np.argsort(query_distances[nearest])]
+            results.append([(self._playlist_ids[row], self._version_ids[row], float(query_distances[row]))
+                            for row in nearest])
+
+        return results
+
+
+feature_index = FeatureIndex(dimensions=2 * len(FEATURE_BINS), refresh_interval=analysis_settings.feature_index_refresh)
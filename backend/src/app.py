@@ -1,11 +1,22 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_async_sqlalchemy import SQLAlchemyMiddleware
 
 from src.analysis.router import router
 from src.config import settings
+from src.http_client import http_client
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    await http_client.start()
+    yield
+    await http_client.close()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(router)
 
@@ -36,6 +36,15 @@ class Settings(BaseSettings):
     TRACK_EXPIRY_DAYS: int = 7
     ARTIST_EXPIRY_DAYS: int = 7
 
+    # Shared state between API workers and celery processes (token cache, etc.)
+    REDIS_URL: str = 'redis://localhost:6379'
+
+    # Persistent HTTP client (one per process)
+    HTTP_POOL_LIMIT: int = 100
+    HTTP_POOL_LIMIT_PER_HOST: int = 20
+    HTTP_DNS_CACHE_TTL: int = 300
+    HTTP_KEEPALIVE_TIMEOUT: float = 30
+
     # It is assumed that fastAPI will be launched either from the root directory of the project or from the ./backend
     model_config = SettingsConfigDict(case_sensitive=True, env_file=".env" if path.exists(".env") else './backend/.env')
 
@@ -62,5 +71,13 @@ class CeleryConfig:
     # Add CREATED property to task status
     task_track_started = True
 
+    # Run with ``celery -A src.tasks beat``
+    beat_schedule = {
+        'refresh-expired': {
+            'task': 'src.analysis.tasks.refresh_expired',
+            'schedule': 60 * 60,
+        },
+    }
+
 
 settings = Settings()
@@ -0,0 +1,36 @@
+from aiohttp import ClientSession, TCPConnector
+
+from src.config import settings
+
+
+class HTTPClient:
+    """
+    Long-lived ``aiohttp`` session, one per process.
+    Keeps TCP+TLS connections alive between requests and tasks and caches DNS lookups.
+    Started on app/worker startup and closed on shutdown, but also started lazily (e.g. in scripts).
+    """
+
+    def __init__(self):
+        self._session: ClientSession | None = None
+
+    async def start(self) -> None:
+        if self._session is None or self._session.closed:
+            connector = TCPConnector(
+                limit=settings.HTTP_POOL_LIMIT,
+                limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+                ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+                keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+            )
+            self._session = ClientSession(connector=connector)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get_session(self) -> ClientSession:
+        await self.start()
+        return self._session
+
+
+http_client = HTTPClient()
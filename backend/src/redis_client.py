@@ -0,0 +1,6 @@
+from redis.asyncio import Redis
+
+from src.config import settings
+
+# Connections are created lazily, so it is safe to import this module before celery forks worker processes
+redis_client = Redis.from_url(settings.REDIS_URL)
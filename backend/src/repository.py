@@ -1,42 +1,117 @@
 import functools
 import inspect
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable
+from uuid import uuid4
 
 from fastapi_async_sqlalchemy import db
 from fastapi_async_sqlalchemy.exceptions import SessionNotInitialisedError
+from sqlalchemy import Table, column, select, table as table_clause, text
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database import SessionLocal
 
+# Session of the repository call (or unit of work) running in current context
+_current_session: ContextVar[AsyncSession | None] = ContextVar('current_session', default=None)
+_unit_of_work_session: ContextVar[AsyncSession | None] = ContextVar('unit_of_work_session', default=None)
+_unit_of_work_callbacks: ContextVar[list['CommitCallback'] | None] = ContextVar('unit_of_work_callbacks',
+                                                                                default=None)
+
+# Plain function or coroutine function
+CommitCallback = Callable[[], Awaitable[None] | None]
+
+
+async def _run_callback(callback: CommitCallback) -> None:
+    result = callback()
+    if inspect.isawaitable(result):
+        await result
+
+
+async def after_commit(callback: CommitCallback) -> None:
+    """
+    Runs callback once data written in current unit of work is committed (right away outside unit of work).
+    Callbacks are dropped on rollback
+    """
+    callbacks = _unit_of_work_callbacks.get()
+
+    if callbacks is None:
+        await _run_callback(callback)
+    else:
+        callbacks.append(callback)
+
+
+@asynccontextmanager
+async def uow():
+    """
+    Unit of work: all repository calls inside reuse one session (and one connection),
+    repository commits are deferred and everything is committed atomically when the block exits.
+    Nested blocks join the outer one.
+
+    async with uow():
+        await tracks.upsert_many(...)
+        await playlist_versions.link_tracks(...)
+    """
+    if _unit_of_work_session.get() is not None:
+        yield _unit_of_work_session.get()
+        return
+
+    session = SessionLocal()
+    callbacks = []
+    uow_token = _unit_of_work_session.set(session)
+    session_token = _current_session.set(session)
+    callbacks_token = _unit_of_work_callbacks.set(callbacks)
+
+    try:
+        yield session
+        await session.commit()
+    except BaseException:
+        await session.rollback()
+        raise
+    finally:
+        _unit_of_work_callbacks.reset(callbacks_token)
+        _current_session.reset(session_token)
+        _unit_of_work_session.reset(uow_token)
+        await session.close()
+
+    for callback in callbacks:
+        await _run_callback(callback)
+
 
 def with_session_management(cls):
     class SessionManager:
         def __init__(self):
             self._session = None
+            self._owned = False
 
         async def __aenter__(self):
             try:
                 self._session = db.session
             except SessionNotInitialisedError:
                 self._session = SessionLocal()
+                self._owned = True
             return self._session
 
         async def __aexit__(self, exc_type, exc_val, exc_tb):
-            try:
-                # Not closing session if it session from ``fastapi_async_sqlalchemy``
-                db.session
-            except SessionNotInitialisedError:
+            # Not closing session if it session from ``fastapi_async_sqlalchemy``
+            if self._owned:
                 await self._session.close()
-                self._session = None
+            self._session = None
 
     def wrap_method(original_method):
         @functools.wraps(original_method)
         async def wrapper(self, *args, **kwargs):
+            # Already inside repository call or unit of work, session is reused
+            if _current_session.get() is not None:
+                return await original_method(self, *args, **kwargs)
+
             async with SessionManager() as session:
-                self._session = session
+                token = _current_session.set(session)
                 try:
                     return await original_method(self, *args, **kwargs)
                 finally:
-                    self._session = None
+                    _current_session.reset(token)
 
         return wrapper
 
@@ -48,18 +123,76 @@ def with_session_management(cls):
     return cls
 
 
-class BaseRepository:
-    _session: AsyncSession | None
+async def bulk_insert(session: AsyncSession, table: Table, rows: list[dict], copy_threshold: int = 1000,
+                      ignore_conflicts: bool = False) -> None:
+    """
+    Inserts rows in one multi-row statement, or with asyncpg ``COPY`` if there are at least ``copy_threshold`` rows.
+    Doesn't commit.
+    :param session: Session to insert with, ``COPY`` runs on its connection (in the same transaction)
+    :param table: Table to insert into
+    :param rows: Rows as dicts with the same keys
+    :param copy_threshold: Minimal number of rows to use ``COPY``
+    :param ignore_conflicts: Skip rows violating unique constraints (``ON CONFLICT DO NOTHING``).
+    ``COPY`` can't skip rows, so they are copied into a temporary table first
+    and inserted with ``INSERT ... SELECT ... ON CONFLICT DO NOTHING``
+    """
+    if not rows:
+        return
+
+    if len(rows) < copy_threshold:
+        statement = insert(table).values(rows)
+        if ignore_conflicts:
+            statement = statement.on_conflict_do_nothing()
+
+        await session.execute(statement)
+        return
+
+    columns = list(rows[0])
+    target = table.name
+
+    if ignore_conflicts:
+        # Unique name, several bulk inserts into the same table can run in one transaction
+        target = f'bulk_insert_{uuid4().hex}'
+        await session.execute(text(f'CREATE TEMPORARY TABLE "{target}" '
+                                   f'(LIKE {table.fullname} INCLUDING DEFAULTS) ON COMMIT DROP'))
+
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+
+    await raw_connection.driver_connection.copy_records_to_table(
+        target,
+        records=[tuple(row[column_name] for column_name in columns) for row in rows],
+        columns=columns,
+    )
+
+    if ignore_conflicts:
+        copied = table_clause(target, *(column(column_name) for column_name in columns))
+        statement = insert(table).from_select(columns, select(*copied.c)).on_conflict_do_nothing()
+
+        await session.execute(statement)
+        await session.execute(text(f'DROP TABLE "{target}"'))
 
+
+class BaseRepository:
     def __init__(self):
         self._db = db
 
     @property
     def session(self) -> AsyncSession:
-        if not hasattr(self, '_session') or self._session is None:
+        session = _current_session.get()
+        if session is None:
             raise RuntimeError(
                 "Session is not initialized. This should not happen if using the @with_session_management decorator.")
-        return self._session
+        return session
+
+    async def commit(self) -> None:
+        """
+        Commits current session. Inside unit of work only flushes, commit happens when unit of work exits
+        """
+        if _unit_of_work_session.get() is self.session:
+            await self.session.flush()
+        else:
+            await self.session.commit()
 
     async def get(self, *args, **kwargs):
         raise NotImplementedError
@@ -1,6 +1,35 @@
+from asyncio import get_event_loop
+
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
 
+from src.analysis.executor import scoring_executor
 from src.config import CeleryConfig
+from src.http_client import http_client
 
 celery = Celery('tasks')
 celery.config_from_object(CeleryConfig)
+
+
+# Tasks are run in the worker's event loop, so the HTTP client is bound to it
+@worker_process_init.connect
+def start_http_client(**_):
+    get_event_loop().run_until_complete(http_client.start())
+
+
+# Pool is started before the first task, so scoring doesn't wait for process start.
+# Only prefork pool sends this signal, and its children can't start processes (scoring runs in threads),
+# with solo pool scoring pool is started on the first scoring
+@worker_process_init.connect
+def start_scoring_executor(**_):
+    scoring_executor.start()
+
+
+@worker_process_shutdown.connect
+def close_http_client(**_):
+    get_event_loop().run_until_complete(http_client.close())
+
+
+@worker_process_shutdown.connect
+def close_scoring_executor(**_):
+    scoring_executor.close()
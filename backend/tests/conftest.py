@@ -0,0 +1,72 @@
+import os
+from datetime import date
+
+import numpy as np
+import pytest
+
+# Settings are read on import of ``src``, nothing is connected to in tests
+for name, value in {
+    'SPOTIFY_CLIENT_ID': 'test',
+    'SPOTIFY_CLIENT_SECRET': 'test',
+    'DATABASE_USER': 'test',
+    'DATABASE_PASSWORD': 'test',
+    'DATABASE_HOST': 'localhost',
+    'DATABASE_PORT': '5432',
+    'DATABASE_NAME': 'test',
+}.items():
+    os.environ.setdefault(name, value)
+
+from src.analysis.scoring import FEATURES, ScoringRecords  # noqa: E402
+
+
+class PlaylistRows:
+    """
+    Random db rows of playlist tracks (see ``ScoringRecords.from_rows``), records of any subset of tracks
+    are built from the same rows
+    """
+
+    def __init__(self, tracks: int, artists: int, genres: int, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        artist_popularity = rng.integers(0, 101, artists)
+        artist_genres = [rng.choice(genres, rng.integers(0, 4), replace=False).tolist() for _ in range(artists)]
+
+        self.track_rows = []
+        self.artist_rows = []
+
+        for index in range(tracks):
+            track_id = f'track{index}'
+            features = [
+                round(float(rng.uniform(60, 200)), 1),  # tempo
+                int(rng.integers(0, 12)),  # key
+                round(float(rng.uniform(-30, 0)), 2),  # loudness
+                int(rng.integers(120, 360)) * 1000,  # duration_ms
+                int(rng.integers(0, 2)),  # mode
+                round(float(rng.random()), 3),  # energy
+                round(float(rng.random()), 3),  # valence
+                round(float(rng.random()), 3),  # dance_ability
+            ]
+            assert len(features) == len(FEATURES)
+
+            self.track_rows.append((track_id, int(rng.integers(0, 101)),
+                                    date(int(rng.integers(1960, 2025)), 1, 1), *features))
+
+            for artist in rng.choice(artists, rng.integers(1, 4), replace=False).tolist():
+                self.artist_rows.append((track_id, f'artist{artist}', int(artist_popularity[artist]),
+                                         artist_genres[artist]))
+
+    @property
+    def track_ids(self) -> list[str]:
+        return [row[0] for row in self.track_rows]
+
+    def records(self, track_ids=None) -> ScoringRecords:
+        if track_ids is None:
+            return ScoringRecords.from_rows(self.track_rows, self.artist_rows)
+
+        track_ids = set(track_ids)
+        return ScoringRecords.from_rows([row for row in self.track_rows if row[0] in track_ids],
+                                        [row for row in self.artist_rows if row[0] in track_ids])
+
+
+@pytest.fixture
+def playlist_rows() -> PlaylistRows:
+    return PlaylistRows(tracks=500, artists=150, genres=60)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from src.analysis import minhash
+
+
+def tracks(start: int, end: int) -> list[str]:
+    return [f'track{index}' for index in range(start, end)]
+
+
+def test_signature_depends_on_set_only():
+    signature = minhash.signature(tracks(0, 100))
+
+    assert signature.shape == (minhash.SIGNATURE_SIZE,)
+    np.testing.assert_array_equal(minhash.signature(tracks(0, 100)[::-1] + tracks(0, 10)), signature)
+
+
+@pytest.mark.parametrize('common', [0, 100, 200, 300])
+def test_jaccard_estimate(common):
+    first, second = tracks(0, 300), tracks(300 - common, 600 - common)
+    expected = common / (600 - common)
+
+    estimate = minhash.jaccard(minhash.signature(first), minhash.signature(second))
+
+    # 4 standard errors of the estimate (at most 0.044)
+    assert estimate == pytest.approx(expected, abs=0.18)
+
+
+def test_similar_sets_share_bands():
+    first = minhash.band_hashes(minhash.signature(tracks(0, 500)))
+    similar = minhash.band_hashes(minhash.signature(tracks(25, 525)))
+    different = minhash.band_hashes(minhash.signature(tracks(1000, 1500)))
+
+    assert len(first) == minhash.BANDS
+    # Jaccard 0.9 is a candidate with probability > 0.99, disjoint sets share a band with probability ~0
+    assert set(first) & set(similar)
+    assert not set(first) & set(different)
+
+
+def test_identical_sets_share_every_band():
+    signature = minhash.signature(tracks(0, 50))
+
+    assert minhash.band_hashes(signature) == minhash.band_hashes(minhash.signature(tracks(0, 50)))
+
+
+def test_signature_bytes_round_trip():
+    signature = minhash.signature(tracks(0, 50))
+
+    np.testing.assert_array_equal(minhash.from_bytes(minhash.to_bytes(signature)), signature)
@@ -0,0 +1,108 @@
+import asyncio
+from uuid import uuid4
+
+from sqlalchemy.dialects import postgresql
+
+from src.analysis.models import playlist_track_association
+from src.repository import bulk_insert
+
+
+class FakeDriverConnection:
+    def __init__(self, statements: list):
+        self.statements = statements
+
+    async def copy_records_to_table(self, table_name, records, columns):
+        self.statements.append(('COPY', table_name, columns, records))
+
+
+class FakeConnection:
+    def __init__(self, statements: list):
+        self.driver_connection = FakeDriverConnection(statements)
+
+    async def get_raw_connection(self):
+        return self
+
+
+class FakeSession:
+    """
+    Records statements compiled for postgres and ``COPY`` calls of asyncpg connection, in order
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+
+    async def connection(self):
+        return FakeConnection(self.statements)
+
+
+def rows(count: int) -> list[dict]:
+    version_id = uuid4()
+    return [{'playlist_version_id': version_id, 'track_id': f'track{index}'} for index in range(count)]
+
+
+def insert(session: FakeSession, count: int, ignore_conflicts: bool) -> None:
+    asyncio.run(bulk_insert(session, playlist_track_association, rows(count), copy_threshold=10,
+                            ignore_conflicts=ignore_conflicts))
+
+
+def test_nothing_is_inserted_without_rows():
+    session = FakeSession()
+    insert(session, 0, ignore_conflicts=True)
+
+    assert session.statements == []
+
+
+def test_small_insert_skips_conflicts():
+    session = FakeSession()
+    insert(session, 3, ignore_conflicts=True)
+
+    (statement,) = session.statements
+    assert statement.startswith('INSERT INTO playlist_track_association')
+    assert statement.endswith('ON CONFLICT DO NOTHING')
+
+
+def test_small_insert_without_ignoring_conflicts():
+    session = FakeSession()
+    insert(session, 3, ignore_conflicts=False)
+
+    (statement,) = session.statements
+    assert 'ON CONFLICT' not in statement
+
+
+def test_copy_into_table_without_ignoring_conflicts():
+    session = FakeSession()
+    insert(session, 10, ignore_conflicts=False)
+
+    (copy,) = session.statements
+    assert copy[:3] == ('COPY', 'playlist_track_association', ['playlist_version_id', 'track_id'])
+    assert len(copy[3]) == 10
+
+
+def test_copy_skips_conflicts_through_temporary_table():
+    session = FakeSession()
+    insert(session, 10, ignore_conflicts=True)
+
+    create, copy, insert_select, drop = session.statements
+    temporary_table = copy[1]
+
+    assert temporary_table != 'playlist_track_association'
+    assert create.startswith(f'CREATE TEMPORARY TABLE "{temporary_table}" (LIKE playlist_track_association')
+    assert create.endswith('ON COMMIT DROP')
+    assert len(copy[3]) == 10
+    assert insert_select.startswith('INSERT INTO playlist_track_association (playlist_version_id, track_id) '
+                                    'SELECT')
+    assert f'FROM {temporary_table}' in insert_select
+    assert insert_select.endswith('ON CONFLICT DO NOTHING')
+    assert drop == f'DROP TABLE "{temporary_table}"'
+
+
+def test_temporary_tables_of_one_transaction_differ():
+    session = FakeSession()
+    insert(session, 10, ignore_conflicts=True)
+    insert(session, 10, ignore_conflicts=True)
+
+    copies = [statement for statement in session.statements if isinstance(statement, tuple)]
+    assert copies[0][1] != copies[1][1]
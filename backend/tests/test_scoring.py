@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from scipy.stats import entropy
+
+from src.analysis.scoring import features_uniqueness, component_weights, uniqueness_components
+
+
+def data_set_uniqueness(values) -> float:
+    """
+    Uniqueness of one column as it was computed before scoring was vectorized
+    """
+    if len(values) == 0:
+        return 0.0
+
+    data_array = np.array(values)
+
+    unique, counts = np.unique(data_array, return_counts=True)
+    probabilities = counts / len(data_array)
+    shannon_index = entropy(probabilities, base=2)
+
+    max_shannon_index = np.log2(len(unique))
+    normalized_shannon_index = shannon_index / max_shannon_index if max_shannon_index > 0 else 0
+
+    normalized_simpson_index = 1 - np.sum(probabilities ** 2)
+
+    mean_value = np.mean(data_array)
+    std_dev = np.std(data_array)
+    coefficient_of_variation = std_dev / mean_value if mean_value != 0 else 0
+    normalized_cv = min(coefficient_of_variation, 1)
+
+    return (normalized_shannon_index + normalized_simpson_index + normalized_cv) / 3
+
+
+@pytest.mark.parametrize('rows', [1, 2, 17, 1000])
+def test_features_uniqueness_matches_per_column_implementation(rows):
+    rng = np.random.default_rng(rows)
+    features = np.column_stack([
+        rng.integers(0, 12, rows),  # few repeated values
+        np.round(rng.uniform(60, 200, rows), 1),  # mostly distinct values
+        np.full(rows, 3.0),  # one value
+        rng.normal(0, 1, rows),  # mean close to zero, CV is clipped
+        np.zeros(rows),  # zero mean
+    ]).astype(np.float64)
+
+    expected = [data_set_uniqueness(features[:, column]) for column in range(features.shape[1])]
+
+    np.testing.assert_allclose(features_uniqueness(features), expected, rtol=1e-12, atol=1e-15)
+
+
+def test_features_uniqueness_of_empty_matrix():
+    np.testing.assert_array_equal(features_uniqueness(np.empty((0, 3))), np.zeros(3))
+
+
+def test_features_uniqueness_skips_missing_values():
+    features = np.array([[1.0, 2.0, np.nan], [np.nan, 3.0, np.nan], [2.0, 3.0, np.nan], [2.0, np.nan, np.nan]])
+
+    result = features_uniqueness(features)
+
+    assert result[0] == pytest.approx(data_set_uniqueness([1.0, 2.0, 2.0]))
+    assert result[1] == pytest.approx(data_set_uniqueness([2.0, 3.0, 3.0]))
+    # Feature missing for every track
+    assert result[2] == 0
+
+
+def test_component_weights_are_validated():
+    weights = {'popularity': 0.3, 'artist_diversity': 0.2, 'musical_diversity': 0.1, 'genre_diversity': 0.2,
+               'temporal_diversity': 0.1, 'era_diversity': 0.1}
+
+    assert component_weights(weights) == [0.3, 0.2, 0.1, 0.2, 0.1, 0.1]
+
+    with pytest.raises(ValueError):
+        component_weights({**weights, 'era_diversity': None})
+    with pytest.raises(ValueError):
+        component_weights({**weights, 'era_diversity': 0.5})
+
+
+def test_uniqueness_components_are_in_range(playlist_rows):
+    records = playlist_rows.records()
+
+    components = uniqueness_components(records, 2026, np.ones(len(records)))
+
+    for name in ('popularity', 'artist_diversity', 'musical_diversity', 'temporal_diversity', 'era_diversity'):
+        assert 0 <= components[name] <= 1, name
@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+from src.analysis.sketches import CountMinSketch, FixedBinHistogram, HyperLogLog, hash_strings
+
+
+def ids(start: int, end: int) -> list[str]:
+    return [f'artist{index}' for index in range(start, end)]
+
+
+def test_hash_strings_are_stable():
+    hashes = hash_strings(['a', 'b', 'a'])
+
+    assert hashes.dtype == np.uint64
+    assert hashes[0] == hashes[2] != hashes[1]
+    np.testing.assert_array_equal(hash_strings(['a', 'b']), hashes[:2])
+
+
+@pytest.mark.parametrize('count', [10, 1000, 100_000])
+def test_hyperloglog_count(count):
+    sketch = HyperLogLog()
+    sketch.add(hash_strings(ids(0, count)))
+
+    # 4 standard errors (0.81% for precision 14)
+    assert len(sketch) == pytest.approx(count, rel=0.033)
+
+
+def test_hyperloglog_merge_is_sketch_of_union():
+    first, second, union = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    first.add(hash_strings(ids(0, 30_000)))
+    second.add(hash_strings(ids(20_000, 50_000)))
+    union.add(hash_strings(ids(0, 50_000)))
+
+    first.update(second)
+
+    np.testing.assert_array_equal(first.registers, union.registers)
+    assert len(first) == pytest.approx(50_000, rel=0.033)
+
+
+def test_hyperloglog_of_different_precision_is_not_merged():
+    with pytest.raises(ValueError):
+        HyperLogLog(12).update(HyperLogLog(14))
+
+
+def test_hyperloglog_bytes_round_trip():
+    sketch = HyperLogLog(10)
+    sketch.add(hash_strings(ids(0, 500)))
+
+    restored = HyperLogLog.from_bytes(sketch.to_bytes())
+
+    assert restored.precision == 10
+    np.testing.assert_array_equal(restored.registers, sketch.registers)
+
+
+def test_fixed_bin_histogram_counts_and_merge():
+    first, second = FixedBinHistogram(0, 1, 0.1), FixedBinHistogram(0, 1, 0.1)
+    first.add(np.array([0.0, 0.1, 0.1, 0.52]))
+    second.add(np.array([0.5, 1.7, -3.0]))
+
+    first.update(second)
+
+    # 0.52 and 0.5 share a bin, values out of range are counted in the edge bins
+    assert first.counts.tolist() == [2, 2, 0, 0, 0, 2, 0, 0, 0, 0, 1]
+    assert sorted(first.values().tolist()) == [1, 2, 2, 2]
+
+
+def test_fixed_bin_histograms_with_different_bins_are_not_merged():
+    with pytest.raises(ValueError):
+        FixedBinHistogram(0, 1, 0.1).update(FixedBinHistogram(0, 1, 0.01))
+
+
+def test_fixed_bin_histogram_bytes_round_trip():
+    histogram = FixedBinHistogram(-60, 5, 0.01)
+    histogram.add(np.random.default_rng(0).uniform(-30, 0, 100))
+
+    restored = FixedBinHistogram.from_bytes(histogram.to_bytes())
+
+    assert (restored.low, restored.high, restored.resolution) == (-60, 5, 0.01)
+    np.testing.assert_array_equal(restored.counts, histogram.counts)
+
+
+def test_count_min_sketch_estimates():
+    rng = np.random.default_rng(0)
+    frequent = np.repeat(np.arange(5), [500, 300, 200, 100, 50])
+    items = np.concatenate([frequent, rng.integers(5, 20_000, 30_000)])
+    true_counts = np.bincount(items)
+    hashes = hash_strings(str(item) for item in items.tolist())
+
+    sketch = CountMinSketch()
+    sketch.add(hashes)
+
+    unique_items = np.arange(len(true_counts))[true_counts > 0]
+    estimates = sketch.estimate(hash_strings(str(item) for item in unique_items.tolist()))
+
+    # Never lower, higher by at most e / width of total count with high probability
+    assert np.all(estimates >= true_counts[unique_items])
+    assert np.all(estimates - true_counts[unique_items] <= np.e / sketch.width * len(items))
+
+
+def test_count_min_sketch_merge_and_bytes_round_trip():
+    hashes = hash_strings(ids(0, 1000) * 2 + ids(0, 10) * 50)
+    counts = np.arange(len(hashes)) % 3 + 1
+    whole, first, second = CountMinSketch(), CountMinSketch(), CountMinSketch()
+    whole.add(hashes, counts)
+    first.add(hashes[:700], counts[:700])
+    second.add(hashes[700:], counts[700:])
+
+    first.update(CountMinSketch.from_bytes(second.to_bytes()))
+
+    np.testing.assert_array_equal(first.table, whole.table)
+
+
+def test_count_min_sketches_of_different_size_are_not_merged():
+    with pytest.raises(ValueError):
+        CountMinSketch(width=1024).update(CountMinSketch(width=2048))
@@ -0,0 +1,165 @@
+import json
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from src.analysis.scoring import uniqueness_components
+from src.analysis.statistics import PlaylistStats, PlaylistSketch, RunningMoments, summary_components
+
+CURRENT_YEAR = 2026
+
+
+def assert_components_equal(actual: dict, expected: dict):
+    assert actual.keys() == expected.keys()
+    for name in expected:
+        assert actual[name] == pytest.approx(expected[name], rel=1e-12, abs=1e-12), name
+
+
+def components(stats, tracks: int) -> dict:
+    return stats.components(CURRENT_YEAR, np.ones(tracks))
+
+
+def test_running_moments_add_remove_merge():
+    rng = np.random.default_rng(0)
+    values = rng.normal(100, 15, 1000)
+
+    moments = RunningMoments.from_values(values[:600])
+    moments.add(values[600:])
+    assert moments.mean == pytest.approx(values.mean())
+    assert moments.std == pytest.approx(values.std())
+
+    moments.remove(values[:300])
+    assert moments.count == 700
+    assert moments.mean == pytest.approx(values[300:].mean())
+    assert moments.variance == pytest.approx(values[300:].var())
+
+    merged = RunningMoments.from_values(values[:300])
+    merged.merge(moments)
+    assert merged.variance == pytest.approx(values.var())
+
+
+def test_stats_match_components_of_all_tracks(playlist_rows):
+    records = playlist_rows.records()
+
+    assert_components_equal(components(PlaylistStats.from_records(records), len(records)),
+                            uniqueness_components(records, CURRENT_YEAR, np.ones(len(records))))
+
+
+def test_stats_of_track_without_audio_features(playlist_rows):
+    # Track is linked, but spotify returned no audio features for it
+    track_id, popularity, release_date, *features = playlist_rows.track_rows[0]
+    playlist_rows.track_rows[0] = (track_id, popularity, release_date, *[None] * len(features))
+    records = playlist_rows.records()
+
+    expected = uniqueness_components(records, CURRENT_YEAR, np.ones(len(records)))
+    exact = components(PlaylistStats.from_records(records), len(records))
+    approximate = components(PlaylistSketch.from_records(records), len(records))
+
+    assert np.isfinite(expected['musical_diversity'])
+    assert_components_equal(exact, expected)
+    assert approximate['musical_diversity'] == pytest.approx(expected['musical_diversity'], abs=0.01)
+
+
+def test_stats_built_page_by_page(playlist_rows):
+    track_ids = playlist_rows.track_ids
+    stats = PlaylistStats()
+
+    for start in range(0, len(track_ids), 100):
+        stats.add(playlist_rows.records(track_ids[start:start + 100]))
+
+    assert_components_equal(components(stats, len(track_ids)),
+                            components(PlaylistStats.from_records(playlist_rows.records()), len(track_ids)))
+
+
+def test_stats_merge(playlist_rows):
+    track_ids = playlist_rows.track_ids
+    stats = PlaylistStats.from_records(playlist_rows.records(track_ids[:200]))
+    stats.merge(PlaylistStats.from_records(playlist_rows.records(track_ids[200:])))
+
+    assert_components_equal(components(stats, len(track_ids)),
+                            components(PlaylistStats.from_records(playlist_rows.records()), len(track_ids)))
+
+
+def test_stats_remove_tracks(playlist_rows):
+    track_ids = playlist_rows.track_ids
+    removed, kept = track_ids[::7], [track_id for index, track_id in enumerate(track_ids) if index % 7]
+
+    stats = PlaylistStats.from_records(playlist_rows.records())
+    stats.remove(playlist_rows.records(removed))
+    expected = PlaylistStats.from_records(playlist_rows.records(kept))
+
+    assert stats.tracks == len(kept)
+    assert stats.artists == expected.artists
+    assert stats.genres == expected.genres
+    assert stats.feature_values == expected.feature_values
+    assert_components_equal(components(stats, len(kept)), components(expected, len(kept)))
+
+
+def test_stats_json_round_trip(playlist_rows):
+    stats = PlaylistStats.from_records(playlist_rows.records())
+    stats.incremental = 2
+
+    # Stored in JSONB, so keys and tuples become strings and lists
+    restored = PlaylistStats.from_json(json.loads(json.dumps(stats.to_json())))
+
+    assert restored.to_json() == stats.to_json()
+    assert restored.scored_at == stats.scored_at
+    assert restored.incremental == 2
+    assert_components_equal(components(restored, stats.tracks), components(stats, stats.tracks))
+
+
+def test_stats_of_version_1_are_read(playlist_rows):
+    stats = PlaylistStats.from_records(playlist_rows.records())
+    data = stats.to_json()
+    data['version'] = 1
+    del data['scored_at'], data['incremental']
+
+    for column, feature_data in enumerate(data['features'].values()):
+        moments = stats.feature_moments[column]
+        feature_data['sum'] = moments.mean * moments.count
+        feature_data['squares'] = moments.m2 + moments.count * moments.mean ** 2
+        del feature_data['moments']
+
+    restored = PlaylistStats.from_json(data)
+
+    assert restored.scored_at is None
+    assert_components_equal(components(restored, stats.tracks), components(stats, stats.tracks))
+
+
+def test_new_stats_are_scored_now():
+    before = datetime.utcnow()
+    assert before <= PlaylistStats().scored_at <= datetime.utcnow()
+
+
+def test_summary_components_match_stats(playlist_rows):
+    stats = PlaylistStats.from_records(playlist_rows.records())
+
+    assert_components_equal(summary_components(stats.summary(), CURRENT_YEAR, np.ones(stats.tracks)),
+                            components(stats, stats.tracks))
+
+
+def test_sketch_is_close_to_exact_stats(playlist_rows):
+    records = playlist_rows.records()
+    exact = components(PlaylistStats.from_records(records), len(records))
+    approximate = components(PlaylistSketch.from_records(records), len(records))
+
+    for name in exact:
+        assert approximate[name] == pytest.approx(exact[name], abs=0.01), name
+
+
+def test_sketch_can_not_be_rescored_incrementally():
+    assert not hasattr(PlaylistSketch(), 'remove')
+    assert not hasattr(PlaylistSketch(), 'to_json')
+
+
+def test_sketch_merge_and_bytes_round_trip(playlist_rows):
+    track_ids = playlist_rows.track_ids
+    whole = PlaylistSketch.from_records(playlist_rows.records())
+
+    first = PlaylistSketch.from_records(playlist_rows.records(track_ids[:250]))
+    second = PlaylistSketch.from_records(playlist_rows.records(track_ids[250:]))
+    merged = PlaylistSketch.from_bytes(first.to_bytes())
+    merged.merge(PlaylistSketch.from_bytes(second.to_bytes()))
+
+    assert_components_equal(components(merged, len(track_ids)), components(whole, len(track_ids)))
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import time
+
+import fakeredis
+
+from src.analysis.tokens import AccessToken, TokenStore
+
+
+class Fetcher:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self) -> tuple[str, int]:
+        self.calls += 1
+        return f'token{self.calls}', 3600
+
+
+def store(redis, tmp_path) -> TokenStore:
+    return TokenStore(redis, str(tmp_path / 'tokens.json'), refresh_margin=60, lock_timeout=0.2)
+
+
+def test_token_is_fetched_once_and_shared(tmp_path):
+    async def run():
+        redis = fakeredis.FakeAsyncRedis()
+        fetch = Fetcher()
+
+        values = await asyncio.gather(*(store(redis, tmp_path).get('client', fetch) for _ in range(5)))
+
+        assert values == ['token1'] * 5
+        assert fetch.calls == 1
+
+    asyncio.run(run())
+
+
+def test_token_written_by_lock_holder_is_reused_after_lock_timeout(tmp_path):
+    async def run():
+        redis = fakeredis.FakeAsyncRedis()
+        fetch = Fetcher()
+
+        # Another process holds the lock longer than it is waited for, and writes the token meanwhile
+        lock = redis.lock('spotify:access_token:client:lock', timeout=10)
+        assert await lock.acquire()
+
+        async def write_token():
+            await asyncio.sleep(0.05)
+            token = AccessToken('shared', expires_at=time.time() + 3600)
+            await redis.set('spotify:access_token:client', json.dumps(token.__dict__))
+
+        writer = asyncio.create_task(write_token())
+        assert await store(redis, tmp_path).get('client', fetch) == 'shared'
+        assert fetch.calls == 0
+        await writer
+
+    asyncio.run(run())
+
+
+def test_token_is_fetched_if_lock_holder_wrote_none(tmp_path):
+    async def run():
+        redis = fakeredis.FakeAsyncRedis()
+        fetch = Fetcher()
+
+        lock = redis.lock('spotify:access_token:client:lock', timeout=10)
+        assert await lock.acquire()
+
+        assert await store(redis, tmp_path).get('client', fetch) == 'token1'
+        assert fetch.calls == 1
+
+    asyncio.run(run())